@@ -0,0 +1,313 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .changes import changes_after, get_head_position
+from foodgram.constants import RECIPE_BITMAP_MAX_CHANGES
+from recipes.models import Change, Favorite, Recipe, ShoppingList
+
+
+def bitmap_from_ids(ids):
+    """Метод собирает битовую карту из списка id за один проход."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for item_id in ids:
+        buffer[item_id >> 3] |= 1 << (item_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bitmap_count(bitmap):
+    """Метод считает количество рецептов в битовой карте."""
+    return bin(bitmap).count('1')
+
+
+def bitmap_slots(bitmap, offset=0, limit=None):
+    """Метод возвращает номера установленных битов по убыванию."""
+    bits = bin(bitmap)[2:]
+    length = len(bits)
+    slots = []
+    position = bits.find('1')
+    while position != -1 and (limit is None or len(slots) < limit):
+        if offset:
+            offset -= 1
+        else:
+            slots.append(length - 1 - position)
+        position = bits.find('1', position + 1)
+    return slots
+
+
+class RecipeBitmapIndex:
+    """
+    Индекс рецептов в виде битовых карт.
+    Рецепты пронумерованы по возрастанию (pub_date, id), и для всех
+    рецептов, каждого тега и каждого автора хранится целое число,
+    в котором установлены биты с номерами рецептов. Комбинация
+    фильтров вычисляется операциями над множествами, а старший бит
+    соответствует самому новому рецепту, поэтому порядок выдачи
+    совпадает с сортировкой по '-pub_date'.
+    Перед каждым вычислением индекс дочитывает журнал изменений:
+    в нем только закоммиченные изменения из всех процессов, а записи
+    незавершенных транзакций читаются после их завершения. Изменения
+    тегов рецепта без его сохранения в журнал не попадают и
+    подхватываются полной перестройкой по истечении
+    RECIPE_BITMAP_INDEX_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self.last_position = (0, 0)
+        self.order = []
+        self.slots = {}
+        self.keys = {}
+        self.last_key = None
+        self.all = 0
+        self.tags = {}
+        self.authors = {}
+
+    def build(self):
+        """Метод полностью перестраивает индекс по данным из БД."""
+        # Позиция журнала читается до данных: изменения, закоммиченные
+        # между запросами, будут применены повторно, что безопасно.
+        last_position = get_head_position()
+        recipes = list(
+            Recipe.objects.order_by('pub_date', 'id').values_list(
+                'id', 'author_id', 'pub_date'
+            )
+        )
+        by_tag = {}
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ):
+            by_tag.setdefault(tag_id, []).append(recipe_id)
+        order = [recipe_id for recipe_id, _, _ in recipes]
+        slots = {recipe_id: slot for slot, recipe_id in enumerate(order)}
+        by_author = {}
+        for slot, (_, author_id, _) in enumerate(recipes):
+            by_author.setdefault(author_id, []).append(slot)
+
+        with self._lock:
+            self.last_position = last_position
+            self.order = order
+            self.slots = slots
+            self.keys = {
+                recipe_id: (pub_date, recipe_id)
+                for recipe_id, _, pub_date in recipes
+            }
+            self.last_key = (
+                (recipes[-1][2], recipes[-1][0]) if recipes else None
+            )
+            self.all = bitmap_from_ids(range(len(order)))
+            self.authors = {
+                author_id: bitmap_from_ids(author_slots)
+                for author_id, author_slots in by_author.items()
+            }
+            self.tags = {
+                tag_id: bitmap_from_ids(slots[recipe_id] for recipe_id in ids)
+                for tag_id, ids in by_tag.items()
+            }
+            self._built_at = time.monotonic()
+
+    def clear_slot(self, slot):
+        mask = ~(1 << slot)
+        self.all &= mask
+        for group in (self.authors, self.tags):
+            for key in group:
+                group[key] &= mask
+
+    def remove_recipe(self, recipe_id):
+        slot = self.slots.pop(recipe_id, None)
+        self.keys.pop(recipe_id, None)
+        if slot is not None:
+            self.clear_slot(slot)
+
+    def put_recipe(self, recipe_id, author_id, pub_date, tag_ids):
+        """
+        Метод добавляет или обновляет рецепт. Возвращает False, если
+        рецепт не встает в конец порядка и нужна полная перестройка.
+        """
+        key = (pub_date, recipe_id)
+        slot = self.slots.get(recipe_id)
+        if slot is not None and self.keys[recipe_id] == key:
+            self.clear_slot(slot)
+        else:
+            if self.last_key is not None and self.last_key > key:
+                return False
+            self.remove_recipe(recipe_id)
+            slot = len(self.order)
+            self.order.append(recipe_id)
+            self.slots[recipe_id] = slot
+            self.keys[recipe_id] = key
+            self.last_key = key
+        bit = 1 << slot
+        self.all |= bit
+        self.authors[author_id] = self.authors.get(author_id, 0) | bit
+        for tag_id in tag_ids:
+            self.tags[tag_id] = self.tags.get(tag_id, 0) | bit
+        return True
+
+    def apply_changes(self, changes):
+        """
+        Метод применяет записи журнала. Возвращает False, если
+        изменения проще применить полной перестройкой.
+        """
+        saved = set()
+        for *_, object_type, object_id, action in changes:
+            if object_type == Change.RECIPE:
+                if action == Change.DELETED:
+                    saved.discard(object_id)
+                    self.remove_recipe(object_id)
+                else:
+                    saved.add(object_id)
+            elif object_type == Change.TAG and action == Change.DELETED:
+                self.tags.pop(object_id, None)
+        if not saved:
+            return True
+        tags = {}
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=saved
+        ).values_list('recipe_id', 'tag_id'):
+            tags.setdefault(recipe_id, []).append(tag_id)
+        recipes = Recipe.objects.filter(id__in=saved).order_by(
+            'pub_date', 'id'
+        ).values_list('id', 'author_id', 'pub_date')
+        found = set()
+        for recipe_id, author_id, pub_date in recipes:
+            found.add(recipe_id)
+            if not self.put_recipe(
+                recipe_id, author_id, pub_date, tags.get(recipe_id, ())
+            ):
+                return False
+        for recipe_id in saved - found:
+            self.remove_recipe(recipe_id)
+        return True
+
+    def sync(self):
+        """
+        Метод приводит индекс к текущему состоянию БД: перестраивает
+        его, если он не создан или устарел, иначе применяет новые
+        записи журнала изменений.
+        """
+        ttl = settings.RECIPE_BITMAP_INDEX_TTL
+        if (
+            self._built_at is None
+            or time.monotonic() - self._built_at > ttl
+        ):
+            self.build()
+            return
+        changes = list(
+            changes_after(self.last_position).values_list(
+                'transaction_id', 'id', 'object_type', 'object_id', 'action'
+            )[:RECIPE_BITMAP_MAX_CHANGES + 1]
+        )
+        if not changes:
+            return
+        if (
+            len(changes) > RECIPE_BITMAP_MAX_CHANGES
+            or not self.apply_changes(changes)
+        ):
+            self.build()
+            return
+        self.last_position = changes[-1][:2]
+
+    def bitmap_for(self, recipe_ids):
+        """Метод собирает битовую карту по id рецептов."""
+        return bitmap_from_ids(
+            self.slots[recipe_id]
+            for recipe_id in recipe_ids
+            if recipe_id in self.slots
+        )
+
+    def evaluate(self, tag_ids=None, author_id=None, include=(), exclude=()):
+        """
+        Метод вычисляет битовую карту для комбинации фильтров.
+        Теги объединяются через ИЛИ, остальные условия через И;
+        include и exclude — списки id рецептов. Вместе с картой
+        возвращается порядок рецептов, по которому номера битов
+        переводятся в id: перестройка создает новый список, а
+        добавление не меняет существующие номера.
+        """
+        with self._lock:
+            self.sync()
+            result = self.all
+            if tag_ids:
+                tags_bitmap = 0
+                for tag_id in tag_ids:
+                    tags_bitmap |= self.tags.get(tag_id, 0)
+                result &= tags_bitmap
+            if author_id is not None:
+                result &= self.authors.get(author_id, 0)
+            for recipe_ids in include:
+                result &= self.bitmap_for(recipe_ids)
+            for recipe_ids in exclude:
+                result &= ~self.bitmap_for(recipe_ids)
+            return result, self.order
+
+
+def user_favorite_ids(user):
+    return Favorite.objects.filter(
+        current_user=user
+    ).values_list('recipe_id', flat=True)
+
+
+def user_shopping_cart_ids(user):
+    return ShoppingList.objects.filter(
+        current_user=user
+    ).values_list('recipe_id', flat=True)
+
+
+class BitmapRecipeList:
+    """
+    Последовательность рецептов для пагинатора.
+    Хранит только битовую карту, а при срезе загружает
+    одну страницу рецептов одним запросом. Рецепты, удаленные
+    после чтения журнала, пропускаются, а страница дополняется
+    следующими, чтобы она не оказалась короче.
+    """
+
+    def __init__(self, bitmap, order, queryset):
+        self.bitmap = bitmap
+        self.order = order
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = bitmap_count(self.bitmap)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        limit = None if key.stop is None else max(key.stop - start, 0)
+        page = []
+        while limit is None or len(page) < limit:
+            slots = bitmap_slots(
+                self.bitmap,
+                offset=start,
+                limit=None if limit is None else limit - len(page)
+            )
+            if not slots:
+                break
+            ids = [self.order[slot] for slot in slots]
+            recipes = self.queryset.order_by().in_bulk(ids)
+            for slot, recipe_id in zip(slots, ids):
+                if recipe_id in recipes:
+                    page.append(recipes[recipe_id])
+                    start += 1
+                else:
+                    self.bitmap &= ~(1 << slot)
+                    self._count = None
+            if limit is None:
+                break
+        return page
+
+
+recipe_index = RecipeBitmapIndex()
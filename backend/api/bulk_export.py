@@ -0,0 +1,165 @@
+import json
+import os
+import uuid
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .changes import get_head_position
+from foodgram.constants import EXPORT_CHUNK_SIZE, RECIPE_EXPORTS_KEEP
+from jobs.models import Job
+from jobs.queue import enqueue, get_job_name
+from recipes.models import IngredientRecipe, Recipe
+
+User = get_user_model()
+
+RECIPE_EXPORTS_DIR = 'recipe_exports'
+
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'text', 'cooking_time', 'pub_date'
+)
+AUTHOR_FIELDS = ('id', 'username', 'first_name', 'last_name')
+
+
+def get_chunk_relations(chunk):
+    """Метод загружает теги, ингредиенты и авторов для пачки рецептов."""
+    ids = [recipe['id'] for recipe in chunk]
+    tags = defaultdict(list)
+    for recipe_id, tag_id, name, slug in Recipe.tags.through.objects.filter(
+        recipe__in=ids
+    ).order_by('tag').values_list(
+        'recipe', 'tag', 'tag__name', 'tag__slug'
+    ):
+        tags[recipe_id].append({'id': tag_id, 'name': name, 'slug': slug})
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, name, unit, amount in (
+        IngredientRecipe.objects.filter(recipe__in=ids).order_by(
+            'ingredient'
+        ).values_list(
+            'recipe', 'ingredient', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        )
+    ):
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+    authors = User.objects.filter(
+        id__in={recipe['author_id'] for recipe in chunk}
+    ).in_bulk(field_name='id')
+    return tags, ingredients, {
+        author_id: {field: getattr(author, field) for field in AUTHOR_FIELDS}
+        for author_id, author in authors.items()
+    }
+
+
+def render_chunk(chunk):
+    tags, ingredients, authors = get_chunk_relations(chunk)
+    storage = Recipe._meta.get_field('image').storage
+    lines = []
+    for recipe in chunk:
+        author_id = recipe.pop('author_id')
+        recipe['image'] = storage.url(recipe['image'])
+        recipe['author'] = authors.get(author_id)
+        recipe['tags'] = tags[recipe['id']]
+        recipe['ingredients'] = ingredients[recipe['id']]
+        lines.append(json.dumps(
+            recipe, cls=DjangoJSONEncoder, ensure_ascii=False
+        ) + '\n')
+    return ''.join(lines)
+
+
+def iter_recipes_ndjson(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Метод построчно выгружает все рецепты в формате NDJSON.
+    Рецепты читаются серверным курсором пачками по chunk_size,
+    связанные объекты загружаются тремя запросами на пачку,
+    поэтому память не зависит от размера базы. Все чтение идет
+    в одной транзакции REPEATABLE READ, то есть из одного снимка.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY'
+                )
+        chunk = []
+        recipes = Recipe.objects.order_by('id').values(*RECIPE_FIELDS)
+        for recipe in recipes.iterator(chunk_size=chunk_size):
+            chunk.append(recipe)
+            if len(chunk) >= chunk_size:
+                yield render_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield render_chunk(chunk)
+
+
+def get_export_version():
+    """
+    Метод возвращает версию каталога: позицию последней записи журнала
+    изменений рецептов, тегов и ингредиентов. Строки версий
+    сортируются в порядке позиций.
+    """
+    transaction_id, change_id = get_head_position()
+    return f'{transaction_id:020d}.{change_id:012d}'
+
+
+def get_export(version):
+    """Метод возвращает путь к готовой выгрузке версии или None."""
+    if not default_storage.exists(RECIPE_EXPORTS_DIR):
+        return None
+    prefix = f'{version}-'
+    for name in default_storage.listdir(RECIPE_EXPORTS_DIR)[1]:
+        if name.startswith(prefix) and name.endswith('.ndjson'):
+            return f'{RECIPE_EXPORTS_DIR}/{name}'
+    return None
+
+
+def write_export():
+    """
+    Фоновая задача: выгружает рецепты в файл NDJSON в MEDIA_ROOT.
+    Файл пишется во временный и переименовывается после записи,
+    а случайная часть имени не дает найти выгрузку без API.
+    Хранятся последние RECIPE_EXPORTS_KEEP выгрузок, чтобы ссылка,
+    которую уже получил клиент, не пропала сразу после новой.
+    """
+    version = get_export_version()
+    if get_export(version):
+        return
+    name = f'{RECIPE_EXPORTS_DIR}/{version}-{uuid.uuid4().hex}.ndjson'
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f'{target}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        for chunk in iter_recipes_ndjson():
+            file.write(chunk)
+    os.replace(temporary, target)
+    names = sorted(
+        (
+            name for name in default_storage.listdir(RECIPE_EXPORTS_DIR)[1]
+            if name.endswith('.ndjson')
+        ),
+        reverse=True
+    )
+    for name in names[RECIPE_EXPORTS_KEEP:]:
+        default_storage.delete(f'{RECIPE_EXPORTS_DIR}/{name}')
+
+
+def request_export():
+    """
+    Метод возвращает путь к выгрузке текущей версии каталога или
+    ставит ее в очередь и возвращает None. Пока задача ждет или
+    выполняется, новая не создается.
+    """
+    path = get_export(get_export_version())
+    if path is None and not Job.objects.filter(
+        name=get_job_name(write_export),
+        status__in=(Job.QUEUED, Job.RUNNING)
+    ).exists():
+        enqueue(write_export)
+    return path
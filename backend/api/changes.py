@@ -0,0 +1,157 @@
+import base64
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from foodgram.constants import CHANGE_LOG_PURGE_MARGIN
+from recipes.models import Change
+
+
+def get_transaction_id():
+    """
+    Метод возвращает id текущей транзакции PostgreSQL, который
+    растет по мере начала транзакций. В остальных СУБД записи
+    пишутся по одной транзакции за раз, и порядка id достаточно.
+    """
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_current()')
+        return cursor.fetchone()[0]
+
+
+def log_changes(object_type, object_ids, action):
+    """
+    Метод добавляет записи в журнал изменений. Вызывать его нужно
+    в той же транзакции, что и само изменение: так запись не
+    потеряется при сбое между ними. Id записей берутся из
+    последовательности без блокировок, поэтому транзакции могут
+    коммититься не в порядке id; порядок чтения задает позиция
+    (transaction_id, id), см. settled_changes.
+    """
+    transaction_id = get_transaction_id()
+    Change.objects.bulk_create(
+        Change(
+            object_type=object_type,
+            object_id=object_id,
+            action=action,
+            transaction_id=transaction_id
+        )
+        for object_id in object_ids
+    )
+
+
+def log_change(object_type, object_id, action):
+    log_changes(object_type, (object_id,), action)
+
+
+def settled_changes():
+    """
+    Метод возвращает записи журнала в порядке позиции, отбрасывая
+    записи транзакций, начатых после самой старой незавершенной.
+    Все транзакции с id меньше xmin снимка уже завершены, поэтому
+    записи, которые появятся позже, встанут после прочитанных,
+    и читатель, запомнивший позицию, их не пропустит.
+    """
+    changes = Change.objects.order_by('transaction_id', 'id')
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT txid_snapshot_xmin(txid_current_snapshot())'
+            )
+            changes = changes.filter(transaction_id__lt=cursor.fetchone()[0])
+    return changes
+
+
+def changes_after(position):
+    """Метод возвращает записи журнала после позиции."""
+    transaction_id, change_id = position
+    return settled_changes().filter(
+        Q(transaction_id__gt=transaction_id)
+        | Q(transaction_id=transaction_id, id__gt=change_id)
+    )
+
+
+def get_head_position():
+    """Метод возвращает позицию последней прочитанной записи журнала."""
+    head = settled_changes().reverse().values_list(
+        'transaction_id', 'id'
+    ).first()
+    return tuple(head) if head else (0, 0)
+
+
+def encode_token(position, checked_at):
+    """
+    Метод возвращает токен: позицию последней прочитанной записи
+    и время, начиная с которого клиенту могут быть нужны следующие.
+    """
+    transaction_id, change_id = position
+    value = f'{transaction_id}.{change_id}|{int(checked_at)}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_token(token):
+    """
+    Метод разбирает токен; для некорректного значения возвращает None.
+    Токен без id транзакции выдан до появления позиций: записи того
+    времени получили transaction_id 0.
+    """
+    try:
+        value = base64.urlsafe_b64decode(token.encode()).decode()
+        position, checked_at = value.split('|')
+        transaction_id, _, change_id = position.rpartition('.')
+        return (
+            (int(transaction_id or 0), int(change_id)), int(checked_at)
+        )
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def is_token_expired(checked_at):
+    """
+    Метод проверяет, что нужные клиенту записи могли быть удалены
+    очисткой журнала. Такому клиенту нужно заново загрузить списки.
+    """
+    return checked_at < time.time() - settings.CHANGE_LOG_RETENTION
+
+
+def get_head_token():
+    """Метод возвращает токен конца журнала."""
+    return encode_token(get_head_position(), time.time())
+
+
+def get_changes_page(since, limit):
+    """
+    Метод возвращает записи журнала после позиции since в порядке
+    позиций, токен для следующего запроса и признак того, что записи
+    еще есть.
+    """
+    changes = list(changes_after(since)[:limit + 1])
+    if len(changes) > limit:
+        next_change = changes.pop()
+        return changes, encode_token(
+            (changes[-1].transaction_id, changes[-1].id),
+            next_change.created_at.timestamp()
+        ), True
+    position = (
+        (changes[-1].transaction_id, changes[-1].id) if changes else since
+    )
+    return changes, encode_token(position, time.time()), False
+
+
+def purge_changes():
+    """
+    Метод удаляет записи журнала старше CHANGE_LOG_RETENTION.
+    Запись получает created_at при вставке, а позицию читателю
+    открывает коммит транзакции, поэтому время записей идет не строго
+    по позициям. Запас CHANGE_LOG_PURGE_MARGIN не дает удалить запись
+    долгой транзакции раньше, чем устареет токен перед ней.
+    """
+    threshold = timezone.now() - timedelta(
+        seconds=settings.CHANGE_LOG_RETENTION + CHANGE_LOG_PURGE_MARGIN
+    )
+    return Change.objects.filter(created_at__lt=threshold).delete()[0]
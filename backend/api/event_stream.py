@@ -0,0 +1,156 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .events import broker, EventStream
+from foodgram.constants import (
+    EVENTS_HEARTBEAT_INTERVAL,
+    EVENTS_RETRY_INTERVAL
+)
+
+EVENTS_PATH = '/api/events/'
+EVENTS_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def get_token(scope):
+    """
+    Метод берет токен из заголовка Authorization или параметра token:
+    EventSource в браузере не умеет передавать заголовки.
+    """
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            keyword, _, key = value.decode('latin-1').partition(' ')
+            if keyword == 'Token' and key:
+                return key.strip()
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('token', [None])[0]
+
+
+def load_subscriber(key):
+    """Метод возвращает id пользователя по токену и его подписки."""
+    from rest_framework.authtoken.models import Token
+
+    from .follows import get_followees
+
+    close_old_connections()
+    try:
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token is None or not token.user.is_active:
+            return None, None
+        return token.user.id, get_followees(token.user)
+    finally:
+        close_old_connections()
+
+
+def render_event(message):
+    data = json.dumps(message['data'], ensure_ascii=False)
+    return f'event: {message["event"]}\ndata: {data}\n\n'.encode()
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_events(scope, receive, send):
+    """
+    Метод отдает поток server-sent events: новые рецепты авторов,
+    на которых подписан пользователь, и изменения его избранного,
+    списка покупок и подписок, сделанные с других устройств.
+    Пока событий нет, раз в EVENTS_HEARTBEAT_INTERVAL отправляется
+    комментарий, чтобы прокси не закрыли соединение.
+    """
+    key = get_token(scope)
+    user_id, followees = (None, None) if key is None else (
+        await sync_to_async(load_subscriber)(key)
+    )
+    if user_id is None:
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': json.dumps(
+                {'detail': 'Учетные данные не были предоставлены.'},
+                ensure_ascii=False
+            ).encode(),
+        })
+        return
+    broker.start()
+    stream = EventStream(user_id, followees)
+    broker.register(stream)
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': EVENTS_HEADERS,
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {EVENTS_RETRY_INTERVAL}\n\n'.encode(),
+            'more_body': True,
+        })
+        while not stream.overflowed:
+            message = asyncio.ensure_future(stream.queue.get())
+            done, _ = await asyncio.wait(
+                (message, disconnect),
+                timeout=EVENTS_HEARTBEAT_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                message.cancel()
+                return
+            if message in done:
+                body = render_event(message.result())
+            else:
+                message.cancel()
+                body = b': ping\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broker.unregister(stream)
+        disconnect.cancel()
+
+
+class EventStreamApplication:
+    """
+    ASGI-приложение, которое обслуживает EVENTS_PATH потоком событий,
+    а остальные запросы передает Django. Django 3.2 перебирает
+    StreamingHttpResponse синхронно, поэтому долгий поток внутри
+    view занял бы поток сервера на все время подключения.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            return await stream_events(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                broker.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await broker.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
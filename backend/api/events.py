@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+
+from django.db import connection, connections, transaction
+
+from foodgram.constants import EVENTS_QUEUE_SIZE, EVENTS_RECONNECT_DELAY
+
+EVENTS_CHANNEL = 'foodgram_events'
+
+logger = logging.getLogger(__name__)
+
+
+def publish(event, data, user=None, author=None):
+    """
+    Метод публикует событие для потока /api/events/.
+    Событие получает пользователь user и подписчики автора author.
+    В PostgreSQL событие отправляется через NOTIFY в текущей
+    транзакции: слушатели всех процессов получат его только после
+    коммита, а при откате оно исчезнет. В остальных СУБД событие
+    после коммита получают только потоки текущего процесса.
+    """
+    message = {'event': event, 'data': data, 'user': user, 'author': author}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                (EVENTS_CHANNEL, json.dumps(message))
+            )
+    else:
+        transaction.on_commit(lambda: broker.publish_threadsafe(message))
+
+
+class EventStream:
+    """
+    Очередь событий одного подключения. Множество авторов, на которых
+    подписан пользователь, загружается при подключении и обновляется
+    по событиям subscription, поэтому отбор событий не обращается к БД.
+    """
+
+    def __init__(self, user_id, followees):
+        self.user_id = user_id
+        self.followees = set(followees)
+        self.queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, message):
+        if message['user'] == self.user_id:
+            if message['event'] == 'subscription':
+                author = message['data']['author']
+                if message['data']['is_subscribed']:
+                    self.followees.add(author)
+                else:
+                    self.followees.discard(author)
+        elif message['author'] not in self.followees:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: поток закрывается, а клиент
+            # переподключается и перечитывает данные через API.
+            self.overflowed = True
+
+
+class EventBroker:
+    """
+    Рассылает события открытым потокам процесса. Работает в цикле
+    событий ASGI-сервера; в PostgreSQL слушает канал EVENTS_CHANNEL
+    на отдельном соединении, поэтому события из любых процессов,
+    включая воркеры gunicorn и обработчик задач, доходят до всех
+    процессов с потоками.
+    """
+
+    def __init__(self):
+        self.streams = set()
+        self.loop = None
+        self.listener = None
+
+    def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        if connection.vendor == 'postgresql':
+            self.listener = self.loop.create_task(self.listen())
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+        self.loop = self.listener = None
+
+    def register(self, stream):
+        self.streams.add(stream)
+
+    def unregister(self, stream):
+        self.streams.discard(stream)
+
+    def dispatch(self, message):
+        for stream in list(self.streams):
+            stream.deliver(message)
+
+    def publish_threadsafe(self, message):
+        """Метод передает событие в цикл событий из другого потока."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.dispatch, message)
+
+    async def listen(self):
+        """Метод слушает канал и переподключается при обрыве."""
+        import psycopg2
+
+        while True:
+            try:
+                await self.listen_once()
+            except (psycopg2.Error, OSError):
+                logger.exception('Соединение для LISTEN прервано.')
+            await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+
+    async def listen_once(self):
+        import psycopg2
+
+        params = connections['default'].get_connection_params()
+        listener = await self.loop.run_in_executor(
+            None, lambda: psycopg2.connect(**params)
+        )
+        listener.autocommit = True
+        ready = asyncio.Event()
+        try:
+            with listener.cursor() as cursor:
+                cursor.execute(f'LISTEN {EVENTS_CHANNEL}')
+            self.loop.add_reader(listener.fileno(), ready.set)
+            while True:
+                await ready.wait()
+                ready.clear()
+                listener.poll()
+                while listener.notifies:
+                    notify = listener.notifies.pop(0)
+                    self.dispatch(json.loads(notify.payload))
+        finally:
+            self.loop.remove_reader(listener.fileno())
+            listener.close()
+
+
+broker = EventBroker()
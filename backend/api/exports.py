@@ -0,0 +1,178 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw, ImageFont
+
+from jobs.models import Job
+from jobs.queue import enqueue, get_job_name
+from recipes.models import ShoppingListIngredient
+
+EXPORTS_DIR = 'shopping_lists'
+PDF_PAGE_SIZE = (1240, 1754)
+PDF_MARGIN = 100
+PDF_FONT_SIZE = 28
+PDF_LINE_HEIGHT = 44
+
+
+def render_txt(rows):
+    return ''.join(
+        f'{name} - {amount} {unit}\n' for name, amount, unit in rows
+    ).encode()
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+def get_pdf_font():
+    try:
+        return ImageFont.truetype(
+            settings.SHOPPING_LIST_PDF_FONT, PDF_FONT_SIZE
+        )
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_pdf(rows):
+    """Метод рисует список покупок постранично и сохраняет его в PDF."""
+    font = get_pdf_font()
+    lines = ['Список покупок', ''] + [
+        f'{name} — {amount} {unit}' for name, amount, unit in rows
+    ]
+    per_page = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT
+    pages = []
+    for start in range(0, len(lines), per_page):
+        page = Image.new('RGB', PDF_PAGE_SIZE, 'white')
+        draw = ImageDraw.Draw(page)
+        for number, line in enumerate(lines[start:start + per_page]):
+            draw.text(
+                (PDF_MARGIN, PDF_MARGIN + number * PDF_LINE_HEIGHT),
+                line, fill='black', font=font
+            )
+        pages.append(page)
+    buffer = io.BytesIO()
+    pages[0].save(
+        buffer, 'PDF', resolution=150, save_all=True,
+        append_images=pages[1:]
+    )
+    return buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain', render_txt),
+    'csv': ('text/csv', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
+
+
+def get_cart_version(rows):
+    """
+    Метод вычисляет версию списка покупок по его содержимому.
+    Одинаковые списки получают одинаковую версию и общий файл.
+    """
+    digest = hashlib.sha1(repr(rows).encode())
+    return digest.hexdigest()[:16]
+
+
+def get_artifact_path(user_id, version, file_format):
+    return f'{EXPORTS_DIR}/{user_id}/{version}.{file_format}'
+
+
+def get_cart_rows(user_id):
+    return [
+        (name, float(amount), unit)
+        for name, amount, unit in ShoppingListIngredient.objects.filter(
+            current_user_id=user_id
+        ).order_by('ingredient__name').values_list(
+            'ingredient__name', 'amount', 'ingredient__measurement_unit'
+        )
+    ]
+
+
+def write_artifact(path, content):
+    """
+    Метод записывает файл во временный и атомарно переименовывает его.
+    Одновременные запросы одной версии пишут одно и то же содержимое
+    под одним именем, а читатели не видят недописанный файл.
+    """
+    target = default_storage.path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, target)
+
+
+def render_artifact(file_format, rows, path):
+    """Метод формирует файл, если его еще нет в хранилище."""
+    if not default_storage.exists(path):
+        write_artifact(path, EXPORT_FORMATS[file_format][1](rows))
+    return path
+
+
+def render_shopping_list(user_id, file_format):
+    """Фоновая задача: формирует файл текущего списка покупок."""
+    rows = get_cart_rows(user_id)
+    render_artifact(
+        file_format, rows,
+        get_artifact_path(user_id, get_cart_version(rows), file_format)
+    )
+
+
+def get_artifact(user_id, rows, file_format):
+    """
+    Метод возвращает путь к готовому файлу списка покупок.
+    TXT и CSV формируются сразу, PDF ставится в очередь фоновых задач
+    один раз для всех воркеров: пока задача ждет или выполняется,
+    новая не создается, а возвращается None.
+    Время изменения готового файла обновляется, чтобы purge_artifacts
+    удалял только файлы, которые давно не скачивали.
+    """
+    path = get_artifact_path(user_id, get_cart_version(rows), file_format)
+    if default_storage.exists(path):
+        os.utime(default_storage.path(path))
+        return path
+    if file_format != 'pdf':
+        return render_artifact(file_format, rows, path)
+    if not Job.objects.filter(
+        name=get_job_name(render_shopping_list),
+        args=[user_id, file_format],
+        status__in=(Job.QUEUED, Job.RUNNING)
+    ).exists():
+        enqueue(render_shopping_list, user_id, file_format)
+    return None
+
+
+def purge_artifacts():
+    """
+    Периодическая задача: удаляет файлы списков покупок, которые
+    не скачивали дольше SHOPPING_LIST_EXPORT_TTL. Старые версии
+    не удаляются при записи новой, чтобы не отнять файл у запроса,
+    который уже получил его путь.
+    """
+    if not default_storage.exists(EXPORTS_DIR):
+        return 0
+    threshold = time.time() - settings.SHOPPING_LIST_EXPORT_TTL
+    removed = 0
+    for directory in default_storage.listdir(EXPORTS_DIR)[0]:
+        directory = f'{EXPORTS_DIR}/{directory}'
+        for name in default_storage.listdir(directory)[1]:
+            path = f'{directory}/{name}'
+            try:
+                if os.path.getmtime(default_storage.path(path)) > threshold:
+                    continue
+            except FileNotFoundError:
+                continue
+            default_storage.delete(path)
+            removed += 1
+    return removed
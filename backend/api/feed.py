@@ -0,0 +1,218 @@
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from foodgram.constants import FEED_CELEBRITY_BACKFILL_MARGIN
+from jobs.queue import enqueue
+from recipes.models import FeedCelebrity, FeedEntry, Recipe
+from users.models import Subscription
+
+
+def sync_celebrities():
+    """
+    Периодическая задача: раз в FEED_CELEBRITIES_INTERVAL сверяет
+    таблицу популярных авторов с числом подписчиков. Новые авторы
+    с подписчиками больше FEED_FANOUT_LIMIT добавляются в таблицу.
+    Авторы, которые опустились ниже лимита, помечаются leaving:
+    их рецепты снова рассылаются, а задача finish_leaving добавляет
+    в ленты пропущенные рецепты и только затем удаляет автора
+    из таблицы, поэтому до конца дозаполнения лент рецепты
+    подмешиваются при чтении.
+    Подсчет подписчиков идет по всей таблице подписок, поэтому
+    он выполняется только в фоне, а не в запросах и рассылках.
+    """
+    current = set(
+        Subscription.objects.values('user').annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('user', flat=True)
+    )
+    stored = dict(FeedCelebrity.objects.values_list('author', 'leaving'))
+    FeedCelebrity.objects.bulk_create(
+        (
+            FeedCelebrity(author_id=author_id)
+            for author_id in current - stored.keys()
+        ),
+        ignore_conflicts=True
+    )
+    FeedCelebrity.objects.filter(
+        author__in=[
+            author_id for author_id in current if stored.get(author_id)
+        ]
+    ).update(leaving=False)
+    for author_id in stored.keys() - current:
+        if FeedCelebrity.objects.filter(
+            author=author_id, leaving=False
+        ).update(leaving=True):
+            enqueue(finish_leaving, author_id)
+
+
+def finish_leaving(author_id):
+    """
+    Метод добавляет в ленты подписчиков рецепты, которые автор
+    опубликовал, пока был в таблице популярных, и удаляет его
+    из таблицы. Рецепты берутся с запасом
+    FEED_CELEBRITY_BACKFILL_MARGIN до попадания в таблицу: их
+    рассылка могла быть пропущена задачей, выполненной позже.
+    """
+    celebrity = FeedCelebrity.objects.filter(
+        author=author_id, leaving=True
+    ).first()
+    if celebrity is None:
+        return
+    recipes = list(
+        Recipe.objects.filter(
+            author=author_id,
+            pub_date__gte=celebrity.since - timedelta(
+                seconds=FEED_CELEBRITY_BACKFILL_MARGIN
+            )
+        ).only('id', 'author_id', 'pub_date')
+    )
+    followers = Subscription.objects.filter(
+        user=author_id
+    ).values_list('current_user', flat=True).iterator()
+    create_entries(recipes, followers)
+    FeedCelebrity.objects.filter(author=author_id, leaving=True).delete()
+
+
+def is_celebrity(author_id):
+    """Метод проверяет, что рецепты автора не рассылаются в ленты."""
+    return FeedCelebrity.objects.filter(
+        author=author_id, leaving=False
+    ).exists()
+
+
+def create_entries(recipes, followers):
+    """Метод добавляет рецепты в ленты подписчиков пачками."""
+    batch = []
+    for follower_id in followers:
+        for recipe in recipes:
+            batch.append(FeedEntry(
+                current_user_id=follower_id,
+                recipe_id=recipe.id,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date
+            ))
+        if len(batch) >= settings.FEED_FANOUT_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_recipe(recipe_id):
+    """Метод рассылает новый рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.filter(id=recipe_id).only(
+        'id', 'author_id', 'pub_date'
+    ).first()
+    if recipe is None:
+        return
+    if is_celebrity(recipe.author_id):
+        return
+    followers = Subscription.objects.filter(
+        user=recipe.author_id
+    ).values_list('current_user', flat=True).iterator()
+    create_entries((recipe,), followers)
+
+
+def backfill_feed(current_user_id, author_id):
+    """
+    Фоновая задача: добавляет в ленту последние рецепты нового
+    автора. Если до ее выполнения пользователь отписался, лента
+    не меняется. Строка подписки блокируется до конца заполнения,
+    поэтому отписка и trim_feed выполнятся уже после него.
+    """
+    if is_celebrity(author_id):
+        return
+    with transaction.atomic():
+        if not Subscription.objects.select_for_update().filter(
+            current_user=current_user_id, user=author_id
+        ).exists():
+            return
+        recipes = list(
+            Recipe.objects.filter(author=author_id).only(
+                'id', 'author_id', 'pub_date'
+            )[:settings.FEED_BACKFILL_SIZE]
+        )
+        create_entries(recipes, (current_user_id,))
+
+
+def trim_feed(current_user_id, author_id):
+    """Метод удаляет из ленты рецепты автора после отписки."""
+    FeedEntry.objects.filter(
+        current_user=current_user_id,
+        author=author_id
+    ).delete()
+
+
+def encode_cursor(pub_date, recipe_id):
+    value = f'{pub_date.isoformat()}|{recipe_id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Метод разбирает курсор; для некорректного значения возвращает None."""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        pub_date, recipe_id = value.split('|')
+        return datetime.fromisoformat(pub_date), int(recipe_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def before_cursor(cursor, date_field, id_field):
+    pub_date, recipe_id = cursor
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(
+        **{date_field: pub_date, f'{id_field}__lt': recipe_id}
+    )
+
+
+def get_feed_page(user, queryset, cursor=None, limit=10):
+    """
+    Метод возвращает страницу ленты пользователя и курсор следующей.
+    Записи из таблицы ленты объединяются с рецептами авторов из
+    FeedCelebrity, которые читаются напрямую из Recipe.
+    """
+    entries = FeedEntry.objects.filter(current_user=user)
+    if cursor:
+        entries = entries.filter(before_cursor(cursor, 'pub_date', 'recipe'))
+    keys = list(
+        entries.order_by('-pub_date', '-recipe').values_list(
+            'pub_date', 'recipe'
+        )[:limit + 1]
+    )
+
+    followed = set(
+        Subscription.objects.filter(
+            current_user=user,
+            user__in=FeedCelebrity.objects.values('author')
+        ).values_list('user', flat=True)
+    )
+    if followed:
+        recipes = Recipe.objects.filter(author__in=followed)
+        if cursor:
+            recipes = recipes.filter(before_cursor(cursor, 'pub_date', 'id'))
+        keys.extend(
+            recipes.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'id'
+            )[:limit + 1]
+        )
+
+    seen = set()
+    page = []
+    for pub_date, recipe_id in sorted(keys, reverse=True):
+        if recipe_id not in seen:
+            seen.add(recipe_id)
+            page.append((pub_date, recipe_id))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(*page[-1])
+
+    ids = [recipe_id for _, recipe_id in page]
+    recipes = queryset.order_by().in_bulk(ids)
+    return [recipes[i] for i in ids if i in recipes], next_cursor
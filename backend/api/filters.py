@@ -1,5 +1,12 @@
 import django_filters
-from recipes.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Q
+
+from .bitmaps import user_favorite_ids, user_shopping_cart_ids
+from .rankings import RANKING_ORDERINGS, order_by_ranking
+from recipes.models import Favorite, Recipe, ShoppingList, Tag
+
+User = get_user_model()
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -8,7 +15,9 @@ class RecipeFilter(django_filters.FilterSet):
     Фильтр позволяет: показывать только рецепты, находящиеся
     в списке избранного, находящиеся в списке покупок;
     показывать рецепты только автора с указанным id;
-    показывать рецепты только с указанными тегами (по slug).
+    показывать рецепты только с указанными тегами (по slug);
+    сортировать по популярности (ordering=popular)
+    или по трендам (ordering=trending).
     """
     author = django_filters.NumberFilter(
         field_name='author',
@@ -16,51 +25,129 @@ class RecipeFilter(django_filters.FilterSet):
     )
     tags = django_filters.ModelMultipleChoiceFilter(
         field_name='tags__slug', to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
     )
     is_favorited = django_filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = django_filters.ChoiceFilter(
+        choices=[(name, name) for name in RANKING_ORDERINGS],
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+            'ordering'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """Метод фильтрует рецепты по тегам.
+        Условие строится как EXISTS по таблице связи, поэтому рецепт
+        с несколькими подходящими тегами не дублируется в выдаче.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'),
+                    tag__in=value
+                )
+            )
+        )
+
+    def filter_user_list(self, queryset, model, value):
+        """Метод фильтрует рецепты по наличию в списке пользователя.
+        Для value == 1 строится EXISTS, иначе NOT EXISTS по индексу
+        (current_user, recipe) из unique_together модели списка.
+        """
+        current_user = self.request.user if self.request else None
+        if (
+            current_user is None
+            or not current_user.is_authenticated
+            or value is None
+        ):
+            return queryset
+        in_list = Exists(
+            model.objects.filter(
+                current_user=current_user,
+                recipe=OuterRef('pk')
+            )
+        )
+        if value == 1:
+            return queryset.filter(in_list)
+        return queryset.filter(~in_list)
 
     def filter_is_favorited(self, queryset, name, value):
         """Метод фильтрует рецепты по наличию
         в избранном для текущего пользователя.
         """
-        if self.request.user:
-            current_user = self.request.user
-        else:
-            return None
-
-        if current_user.is_authenticated and value is not None:
-            if value == 1:
-                return queryset.filter(
-                    favorites__current_user=current_user.id
-                )
-            else:
-                return queryset.exclude(
-                    favorites__current_user=current_user.id
-                )
-        else:
-            return queryset
+        return self.filter_user_list(queryset, Favorite, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Метод фильтрует рецепты по наличию
         в списке покупок для текущего пользователя.
         """
-        current_user = self.request.user
+        return self.filter_user_list(queryset, ShoppingList, value)
 
-        if current_user.is_authenticated and value is not None:
-            if value:
-                return queryset.filter(
-                    shoppinglists__current_user=current_user
-                )
-            else:
-                return queryset.exclude(
-                    shoppinglists__current_user=current_user.id
-                )
-        return queryset
+    def filter_ordering(self, queryset, name, value):
+        """Метод сортирует рецепты по предрасчитанному рейтингу."""
+        return order_by_ranking(queryset, value)
+
+    def filter_bitmap(self, index):
+        """
+        Метод вычисляет результат фильтрации по битовому индексу.
+        Возвращает битовую карту рецептов, подходящих под все фильтры,
+        и порядок рецептов для перевода номеров битов в id.
+        """
+        data = self.form.cleaned_data
+        user = self.request.user if self.request else None
+        include, exclude = [], []
+        if user is not None and user.is_authenticated:
+            for name, get_ids in (
+                ('is_favorited', user_favorite_ids),
+                ('is_in_shopping_cart', user_shopping_cart_ids),
+            ):
+                value = data.get(name)
+                if value is None:
+                    continue
+                if value == 1:
+                    include.append(list(get_ids(user)))
+                else:
+                    exclude.append(list(get_ids(user)))
+        author = data.get('author')
+        return index.evaluate(
+            tag_ids=[tag.id for tag in data.get('tags') or ()],
+            author_id=int(author) if author is not None else None,
+            include=include,
+            exclude=exclude
+        )
+
+
+class UserFilter(django_filters.FilterSet):
+    """Фильтр для модели User.
+    Параметр search ищет пользователей по началу юзернейма,
+    имени или фамилии без учета регистра.
+    """
+    search = django_filters.CharFilter(method='filter_search')
+
+    class Meta:
+        model = User
+        fields = ('search',)
+
+    def filter_search(self, queryset, name, value):
+        """Метод ищет по префиксу; запросы используют индексы
+        по UPPER(поле) из миграции users.0008.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.filter(
+            Q(username__istartswith=value)
+            | Q(first_name__istartswith=value)
+            | Q(last_name__istartswith=value)
+        )
@@ -0,0 +1,69 @@
+from django.db import connections, router
+from django.db.models.signals import post_save
+
+from users.models import Subscription
+
+
+def get_followees(user):
+    """
+    Метод возвращает множество id авторов, на которых подписан user.
+    Множество загружается одним запросом при первой проверке и
+    хранится на объекте пользователя до конца запроса, поэтому
+    каждая следующая проверка is_subscribed — поиск в множестве.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    followees = getattr(user, '_followees', None)
+    if followees is None:
+        followees = set(
+            Subscription.objects.filter(current_user=user).values_list(
+                'user_id', flat=True
+            )
+        )
+        user._followees = followees
+    return followees
+
+
+def is_subscribed(user, author_id):
+    return author_id in get_followees(user)
+
+
+def follow(user, author):
+    """
+    Метод подписывает user на author одним INSERT ... ON CONFLICT
+    DO NOTHING. Повторная подписка, в том числе из параллельного
+    запроса, не вызывает ошибку: метод возвращает None. Для новой
+    подписки отправляется post_save, как при save().
+    """
+    using = router.db_for_write(Subscription)
+    connection = connections[using]
+    meta = Subscription._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(meta.db_table)} '
+            f'({quote(meta.get_field("current_user").column)}, '
+            f'{quote(meta.get_field("user").column)}) '
+            f'VALUES (%s, %s) ON CONFLICT DO NOTHING '
+            f'RETURNING {quote(meta.pk.column)}',
+            (user.id, author.id)
+        )
+        row = cursor.fetchone()
+    get_followees(user).add(author.id)
+    if row is None:
+        return None
+    subscription = Subscription(id=row[0], current_user=user, user=author)
+    post_save.send(
+        sender=Subscription, instance=subscription, created=True,
+        update_fields=None, raw=False, using=using
+    )
+    return subscription
+
+
+def unfollow(user, author):
+    """Метод отменяет подписку и возвращает, была ли она."""
+    deleted, _ = Subscription.objects.filter(
+        current_user=user, user=author
+    ).delete()
+    get_followees(user).discard(author.id)
+    return bool(deleted)
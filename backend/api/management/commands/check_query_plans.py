@@ -0,0 +1,309 @@
+import hashlib
+import json
+import re
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import (
+    setup_test_environment,
+    teardown_test_environment
+)
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+PLAN_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+IN_LIST = re.compile(r'%s(, %s)+')
+SQLITE_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW|SUBQUERY)(\S+)$')
+ALLOWED_SCANS = ('recipes_tag',)
+
+ENDPOINTS = (
+    (('GET', '/api/tags/'),),
+    (('GET', '/api/tags/{tag}/'),),
+    (('GET', '/api/ingredients/?name={prefix}'),),
+    (('GET', '/api/ingredients/{ingredient}/'),),
+    (('GET', '/api/recipes/'),),
+    (('GET', '/api/recipes/?limit=6&page=2'),),
+    (('GET', '/api/recipes/?author={author}'),),
+    (('GET', '/api/recipes/?tags={tag_slug}'),),
+    (('GET', '/api/recipes/?is_favorited=1'),),
+    (('GET', '/api/recipes/?is_favorited=0'),),
+    (('GET', '/api/recipes/?is_in_shopping_cart=1'),),
+    (('GET', '/api/recipes/?ordering=popular'),),
+    (('GET', '/api/recipes/?ordering=trending&tags={tag_slug}'),),
+    (('GET', '/api/recipes/?fields=id,name,cooking_time'),),
+    (('GET', '/api/recipes/{recipe}/'),),
+    (('GET', '/api/recipes/{recipe}/get-link/'),),
+    (('GET', '/api/recipes/{recipe}/similar/'),),
+    (('GET', '/api/recipes/bulk/?ids={recipe_ids}'),),
+    (('GET', '/api/recipes/feed/'),),
+    (('GET', '/api/recipes/shopping_cart/'),),
+    (
+        ('POST', '/api/recipes/{recipe}/favorite/'),
+        ('DELETE', '/api/recipes/{recipe}/favorite/'),
+    ),
+    (
+        ('POST', '/api/recipes/{recipe}/shopping_cart/'),
+        ('DELETE', '/api/recipes/{recipe}/shopping_cart/'),
+    ),
+    (('GET', '/api/users/'),),
+    (('GET', '/api/users/?search={user_prefix}'),),
+    (('GET', '/api/users/{author}/'),),
+    (('GET', '/api/users/me/'),),
+    (('GET', '/api/users/subscriptions/'),),
+    (
+        ('POST', '/api/users/{author}/subscribe/'),
+        ('DELETE', '/api/users/{author}/subscribe/'),
+    ),
+)
+
+
+class QueryRecorder:
+    """Обертка выполнения запросов, которая запоминает SQL и параметры."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(PLAN_STATEMENTS):
+            self.queries.append((self.alias, sql, params))
+        return execute(sql, params, many, context)
+
+
+def get_fingerprint(sql):
+    """Метод возвращает отпечаток формы запроса без учета длины IN."""
+    return hashlib.sha1(IN_LIST.sub('%s...', sql).encode()).hexdigest()[:12]
+
+
+def describe_postgresql(node, depth=0):
+    """Метод превращает узел плана PostgreSQL в строки без стоимостей."""
+    line = node['Node Type']
+    if 'Relation Name' in node:
+        line += f' on {node["Relation Name"]}'
+    if 'Index Name' in node:
+        line += f' using {node["Index Name"]}'
+    lines = ['  ' * depth + line]
+    for child in node.get('Plans', ()):
+        lines.extend(describe_postgresql(child, depth + 1))
+    return lines
+
+
+def get_seq_scans(vendor, plan):
+    """Метод возвращает таблицы, которые читаются целиком."""
+    if vendor == 'postgresql':
+        prefix = 'Seq Scan on '
+        return [
+            line.strip()[len(prefix):] for line in plan
+            if line.strip().startswith(prefix)
+        ]
+    return [
+        match.group(1) for match in map(SQLITE_SCAN.match, plan) if match
+    ]
+
+
+class Command(BaseCommand):
+    """
+    Проверка планов запросов API на заполненной базе.
+
+    Команда выполняет запросы ко всем эндпоинтам через тестовый клиент,
+    перехватывает SQL и получает для него EXPLAIN. Изменяющие запросы
+    выполняются в транзакции, которая откатывается. Отмечаются
+    последовательные чтения таблиц, а также новые запросы, изменившиеся
+    планы и рост числа одинаковых запросов относительно сохраненного
+    эталона. В PostgreSQL планы строятся с enable_seqscan = off,
+    поэтому Seq Scan остается только там, где нет подходящего индекса.
+    """
+
+    help = "Проверка планов запросов API по эталону."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline',
+            default=str(settings.BASE_DIR / 'query_plans.json'),
+            help='Файл с эталонными планами запросов.'
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Сохранить текущие планы как эталон.'
+        )
+        parser.add_argument(
+            '--user',
+            help='Юзернейм пользователя, от имени которого идут запросы.'
+        )
+        parser.add_argument(
+            '--allow-scan',
+            action='append',
+            default=[],
+            help='Таблица, которую допустимо читать целиком.'
+        )
+
+    def get_context(self, username):
+        """Метод выбирает из базы объекты для подстановки в адреса."""
+        users = User.objects.order_by('id')
+        user = users.filter(username=username).first() if username else (
+            users.first()
+        )
+        recipe = (
+            Recipe.objects.exclude(author=user).order_by('id').first()
+            or Recipe.objects.order_by('id').first()
+        )
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if None in (user, recipe, tag, ingredient):
+            raise CommandError(
+                'Заполните базу пользователями, тегами, '
+                'ингредиентами и рецептами.'
+            )
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        )[:10]
+        return user, {
+            'tag': tag.id,
+            'tag_slug': tag.slug,
+            'ingredient': ingredient.id,
+            'prefix': ingredient.name[:2],
+            'recipe': recipe.id,
+            'recipe_ids': ','.join(map(str, recipe_ids)),
+            'author': recipe.author_id,
+            'user_prefix': recipe.author.username[:2],
+        }
+
+    def explain(self, alias, sql, params):
+        """Метод возвращает план запроса в виде списка строк."""
+        connection = connections[alias]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(
+                f'СУБД {connection.vendor} не поддерживается.'
+            )
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                return describe_postgresql(cursor.fetchone()[0][0]['Plan'])
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def replay(self, client, steps, context):
+        """
+        Метод выполняет шаги эндпоинта и возвращает коды ответов
+        и перехваченные запросы. Изменения откатываются.
+        """
+        recorders = [QueryRecorder(alias) for alias in connections]
+        statuses = []
+        with ExitStack() as stack:
+            for recorder in recorders:
+                stack.enter_context(
+                    connections[recorder.alias].execute_wrapper(recorder)
+                )
+            with transaction.atomic():
+                for method, url in steps:
+                    response = client.generic(method, url.format(**context))
+                    statuses.append(str(response.status_code))
+                transaction.set_rollback(True)
+        queries = [
+            query for recorder in recorders for query in recorder.queries
+        ]
+        return statuses, queries
+
+    def collect(self, client, context):
+        """Метод собирает планы запросов всех эндпоинтов."""
+        vendors = set()
+        endpoints = {}
+        for steps in ENDPOINTS:
+            label = ' + '.join(f'{method} {url}' for method, url in steps)
+            statuses, queries = self.replay(client, steps, context)
+            plans = {}
+            for alias, sql, params in queries:
+                fingerprint = get_fingerprint(sql)
+                if fingerprint in plans:
+                    plans[fingerprint]['count'] += 1
+                    continue
+                vendors.add(connections[alias].vendor)
+                plans[fingerprint] = {
+                    'sql': sql,
+                    'plan': self.explain(alias, sql, params),
+                    'count': 1,
+                }
+            endpoints[label] = plans
+            self.stdout.write(
+                f'{label} [{", ".join(statuses)}] '
+                f'запросов: {len(queries)}'
+            )
+        return ','.join(sorted(vendors)), endpoints
+
+    def compare(self, vendor, endpoints, baseline, allowed_scans):
+        """Метод возвращает список найденных проблем."""
+        if baseline is not None and baseline['vendor'] != vendor:
+            self.stderr.write(
+                f'Эталон снят на {baseline["vendor"]}, сравнение пропущено.'
+            )
+            baseline = None
+        issues = []
+        for label, plans in endpoints.items():
+            expected = (baseline or {}).get('endpoints', {}).get(label)
+            for fingerprint, query in plans.items():
+                sql = query['sql'][:200]
+                for table in get_seq_scans(vendor, query['plan']):
+                    if table not in allowed_scans:
+                        issues.append(
+                            f'{label}: чтение всей таблицы {table}\n    {sql}'
+                        )
+                if expected is None:
+                    continue
+                old = expected.get(fingerprint)
+                if old is None:
+                    issues.append(f'{label}: новый запрос\n    {sql}')
+                    continue
+                if old['plan'] != query['plan']:
+                    issues.append(
+                        f'{label}: план изменился\n    {sql}\n    '
+                        + '\n    '.join(query['plan'])
+                    )
+                if query['count'] > old['count']:
+                    issues.append(
+                        f'{label}: запрос выполняется {query["count"]} раз '
+                        f'вместо {old["count"]}\n    {sql}'
+                    )
+        return issues
+
+    def handle(self, *args, **options):
+        """Метод проверяет планы или сохраняет их как эталон."""
+        user, context = self.get_context(options['user'])
+        client = APIClient()
+        client.force_authenticate(user)
+        setup_test_environment()
+        try:
+            vendor, endpoints = self.collect(client, context)
+        finally:
+            teardown_test_environment()
+
+        if options['update']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(
+                    {'vendor': vendor, 'endpoints': endpoints}, file,
+                    ensure_ascii=False, indent=2, sort_keys=True
+                )
+            return f'Эталон сохранен в {options["baseline"]}.'
+
+        try:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            self.stderr.write('Эталон не найден, проверяются только планы.')
+            baseline = None
+        issues = self.compare(
+            vendor, endpoints, baseline,
+            ALLOWED_SCANS + tuple(options['allow_scan'])
+        )
+        for issue in issues:
+            self.stdout.write(issue)
+        if issues:
+            raise CommandError(f'Найдено проблем: {len(issues)}.')
+        return 'Планы запросов в порядке.'
@@ -0,0 +1,540 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+
+User = get_user_model()
+
+COLLECTION = (
+    settings.BASE_DIR.parent / 'postman_collection'
+    / 'foodgram.postman_collection.json'
+)
+VARIABLE = re.compile(r'{{(\w+)}}')
+EXPECTED_STATUS = re.compile(r'Статус-код ответа должен быть (\d{3})')
+LOCAL_VALUE = re.compile(r'const (\w+) = _\.get\(responseData, "(\w+)"\)')
+SAVED_VALUE = re.compile(
+    r'collectionVariables\.set\(\s*["\'](\w+)["\'],\s*'
+    r'(?:responseData(?:\[(\d+)\])?\.(\w+)(\.slice\(0,\s*1\))?|(\w+))\s*\)'
+)
+UNIQUE_VARIABLE = re.compile(r'^(?!tooLong)\w*(username|email)$', re.I)
+
+# Папки коллекции, которые каждый виртуальный пользователь выполняет
+# один раз: регистрация, токены и данные для остальных сценариев.
+SETUP = (
+    'register_and_get_tokens/create_users',
+    'register_and_get_tokens/get_tokens',
+    'tags/get_tags_info',
+    'ingredients/get_ingradients',
+    'recipes/create_recipes',
+)
+# Сценарии нагрузки: вес и папки коллекции, выполняемые по порядку.
+SCENARIOS = {
+    'browse': (6, (
+        'tags/get_tags_info',
+        'ingredients/get_ingradients',
+        'recipes/get_recipes',
+        'recipes/get_recipe_short_link',
+    )),
+    'profiles': (2, ('users/get_user_info',)),
+    'lists': (2, (
+        'shopping_cart/add_to_shopping_cart',
+        'shopping_cart/download_shopping_cart',
+        'favorite/add_to_favorite',
+        'recipe_filters_for_favorite_and_shopping_cart',
+        'delete_requests/shopping_cart',
+        'delete_requests/favorite',
+    )),
+    'subscriptions': (1, (
+        'subscriptions/create_subscriptions',
+        'subscriptions/get_subscriptions',
+        'delete_requests/subscriptions',
+    )),
+    'edit': (1, ('recipes/update_recipes',)),
+    'validation': (1, (
+        'register_and_get_tokens/create_users_bad_requests',
+        'recipes/recipes_bad_requests',
+    )),
+}
+# Насыщение: следующая ступень дает прирост пропускной способности
+# меньше SATURATION_GAIN или доля ошибок превышает MAX_ERROR_RATE.
+SATURATION_GAIN = 0.1
+MAX_ERROR_RATE = 0.01
+PERCENTILES = (50, 95, 99)
+THROTTLED = 429
+THROTTLE_SETTINGS = (
+    'THROTTLE_DOWNLOADS', 'THROTTLE_SHORT_LINKS',
+    'THROTTLE_SEARCH', 'THROTTLE_UPLOADS',
+)
+
+
+def get_percentile(values, percentile):
+    """Метод возвращает перцентиль отсортированного списка."""
+    if not values:
+        return 0
+    index = max(round(percentile / 100 * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def parse_step(item, inherited_auth):
+    """
+    Метод превращает запрос коллекции в шаг нагрузочного теста.
+    Ожидаемый статус и сохраняемые переменные берутся из тестового
+    скрипта Postman: он не выполняется, а разбирается по шаблонам,
+    которые используются в коллекции.
+    """
+    request = item['request']
+    script = '\n'.join(
+        line
+        for event in item.get('event', ())
+        if event['listen'] == 'test'
+        for line in event['script']['exec']
+    )
+    headers = [
+        (header['key'], header['value'])
+        for header in request.get('header', ())
+        if not header.get('disabled')
+    ]
+    auth = request.get('auth') or inherited_auth
+    if auth.get('type') == 'apikey':
+        values = {value['key']: value['value'] for value in auth['apikey']}
+        headers.append((values['key'], values['value']))
+    body = (request.get('body') or {}).get('raw')
+    if body:
+        headers.append(('Content-Type', 'application/json'))
+    url = request['url']
+    expected = EXPECTED_STATUS.search(script)
+    locals_ = dict(LOCAL_VALUE.findall(script))
+    saved = [
+        (name, int(index) if index else None,
+         key or locals_.get(local, local), bool(first_letter))
+        for name, index, key, first_letter, local
+        in SAVED_VALUE.findall(script)
+    ]
+    return {
+        'name': item['name'],
+        'method': request['method'],
+        'url': url['raw'] if isinstance(url, dict) else url,
+        'headers': headers,
+        'body': body,
+        'expected': int(expected.group(1)) if expected else None,
+        'saved': saved,
+    }
+
+
+def load_collection(path):
+    """Метод возвращает переменные коллекции и шаги по путям папок."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            collection = json.load(file)
+    except FileNotFoundError:
+        raise CommandError(f'Коллекция {path} не найдена.')
+    folders = {}
+
+    def walk(items, prefix, auth):
+        steps = []
+        for item in items:
+            if 'item' in item:
+                # Пометки вида « // No Auth» в путь папки не входят.
+                folder = prefix + item['name'].split(' //')[0]
+                folders[folder] = walk(
+                    item['item'], folder + '/', item.get('auth') or auth
+                )
+                steps.extend(folders[folder])
+            else:
+                steps.append(parse_step(item, auth))
+        return steps
+
+    walk(collection['item'], '', collection.get('auth') or {})
+    variables = {
+        variable['key']: variable['value']
+        for variable in collection.get('variable', ())
+    }
+    return variables, folders
+
+
+def substitute(text, variables):
+    return VARIABLE.sub(
+        lambda match: str(variables.get(match.group(1), match.group(0))),
+        text
+    )
+
+
+class Stats:
+    """
+    Накопитель задержек и ошибок по запросам коллекции.
+    Ответы 429 учитываются отдельно: их отдает ограничение частоты,
+    а не перегруженный сервер, поэтому они не входят в RPS, задержки
+    и долю ошибок, по которым определяется насыщение.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.throttled = Counter()
+        self.statuses = defaultdict(Counter)
+
+    def record(self, name, latency, status, is_error, throttled=False):
+        with self.lock:
+            self.statuses[name][status] += 1
+            if throttled:
+                self.throttled[name] += 1
+                return
+            self.latencies[name].append(latency)
+            if is_error:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        """Метод возвращает итог по всем запросам и по каждому запросу."""
+        with self.lock:
+            latencies = {
+                name: sorted(values)
+                for name, values in self.latencies.items()
+            }
+            errors = Counter(self.errors)
+            throttled = Counter(self.throttled)
+            statuses = {
+                name: dict(counter) for name, counter in self.statuses.items()
+            }
+        rows = []
+        for name in sorted(statuses):
+            values = latencies.get(name, [])
+            rows.append({
+                'name': name,
+                'count': len(values),
+                'rps': len(values) / elapsed,
+                'error_rate': errors[name] / len(values) if values else 0,
+                'throttled': throttled[name],
+                'statuses': statuses[name],
+                **{
+                    f'p{percentile}': get_percentile(values, percentile)
+                    for percentile in PERCENTILES
+                },
+            })
+        total = sorted(
+            value for values in latencies.values() for value in values
+        )
+        count = len(total)
+        return {
+            'count': count,
+            'rps': count / elapsed,
+            'error_rate': sum(errors.values()) / count if count else 0,
+            'throttled': sum(throttled.values()),
+            **{
+                f'p{percentile}': get_percentile(total, percentile)
+                for percentile in PERCENTILES
+            },
+        }, rows
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест API по Postman-коллекции.
+
+    Виртуальные пользователи работают в отдельных потоках: каждый
+    регистрирует своих пользователей и создает рецепты по запросам
+    коллекции, а затем без пауз выполняет сценарии, выбранные
+    случайно с учетом весов. Переменные, которые коллекция сохраняет
+    в тестовых скриптах (id, токены), берутся из ответов, а логины
+    и почты получают уникальный префикс запуска. Ошибкой считается
+    ответ со статусом, отличным от ожидаемого в коллекции, или сбой
+    соединения. С параметром --ramp число пользователей растет
+    ступенями, и по ним определяется точка насыщения сервера.
+    Ответы 429 выводятся отдельно и не считаются ошибками: для теста
+    на сервере поднимают лимиты THROTTLE_DOWNLOADS,
+    THROTTLE_SHORT_LINKS, THROTTLE_SEARCH и THROTTLE_UPLOADS.
+    После теста созданные пользователи удаляются вместе с рецептами
+    из БД команды, поэтому без --keep-data тест запускается только
+    против сервера, который пишет в эту же БД.
+    """
+
+    help = "Нагрузочный тест API по Postman-коллекции."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default='http://127.0.0.1:8000',
+            help='Адрес тестируемого сервера.'
+        )
+        parser.add_argument(
+            '--collection',
+            default=str(COLLECTION),
+            help='Файл Postman-коллекции.'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=10,
+            help='Число виртуальных пользователей.'
+        )
+        parser.add_argument(
+            '--ramp',
+            help='Ступени числа пользователей через запятую, например 1,2,4,8.'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Длительность теста или одной ступени в секундах.'
+        )
+        parser.add_argument(
+            '--weight',
+            action='append',
+            default=[],
+            help='Вес сценария в виде имя=вес, например browse=10.'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Таймаут одного запроса в секундах.'
+        )
+        parser.add_argument(
+            '--keep-data',
+            action='store_true',
+            help=(
+                'Не удалять созданных тестом пользователей; '
+                'нужно для сервера с другой БД.'
+            )
+        )
+
+    def check_database(self):
+        """
+        Метод регистрирует через API пользователя с префиксом запуска
+        и проверяет, что он появился в БД команды. Иначе сервер пишет
+        в другую БД: удаление по префиксу не найдет данные теста, и они
+        останутся на сервере.
+        """
+        username = f'{self.prefix}probe'
+        try:
+            response = requests.post(
+                f'{self.base_url}/api/users/',
+                json={
+                    'email': f'{username}@example.com',
+                    'username': username,
+                    'first_name': 'Load',
+                    'last_name': 'Test',
+                    'password': uuid.uuid4().hex,
+                },
+                timeout=self.timeout
+            )
+        except requests.RequestException as error:
+            raise CommandError(f'Сервер {self.base_url} недоступен: {error}')
+        if response.status_code != 201 or not User.objects.using(
+            router.db_for_write(User)
+        ).filter(username=username).exists():
+            raise CommandError(
+                f'Сервер {self.base_url} пишет не в БД команды, и созданные '
+                'тестом данные не удалить. Запустите команду рядом с '
+                'сервером или с --keep-data. Удалите на сервере '
+                f'пользователя {username}, если он был создан.'
+            )
+
+    def get_scenarios(self, folders, weights):
+        scenarios = {
+            name: [weight, paths]
+            for name, (weight, paths) in SCENARIOS.items()
+        }
+        for value in weights:
+            name, _, weight = value.partition('=')
+            if name not in scenarios or not weight.isdigit():
+                raise CommandError(
+                    f'Некорректный вес {value}, сценарии: '
+                    + ', '.join(scenarios)
+                )
+            scenarios[name][0] = int(weight)
+        for path in SETUP + tuple(
+            path for _, paths in scenarios.values() for path in paths
+        ):
+            if path not in folders:
+                raise CommandError(f'В коллекции нет папки {path}.')
+        return {
+            name: [step for path in paths for step in folders[path]]
+            for name, (weight, paths) in scenarios.items()
+            if weight > 0
+        }, [weight for weight, _ in scenarios.values() if weight > 0]
+
+    def get_variables(self, number):
+        """Метод возвращает переменные виртуального пользователя."""
+        variables = dict(self.variables)
+        variables['baseUrl'] = self.base_url
+        for key, value in self.variables.items():
+            if UNIQUE_VARIABLE.match(key):
+                variables[key] = (
+                    f'"{self.prefix}{number}-{value.strip(chr(34))}"'
+                )
+        return variables
+
+    def send(self, session, step, variables, stats):
+        """
+        Метод выполняет шаг и сохраняет переменные из ответа.
+        Виртуальный пользователь держит свою сессию requests, поэтому
+        соединения переиспользуются и задержка не включает установку
+        TCP-соединения на каждый запрос.
+        """
+        body = step['body']
+        started = time.perf_counter()
+        try:
+            response = session.request(
+                step['method'],
+                substitute(step['url'], variables),
+                headers={
+                    key: substitute(value, variables)
+                    for key, value in step['headers']
+                },
+                data=substitute(body, variables).encode() if body else None,
+                timeout=self.timeout
+            )
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        latency = time.perf_counter() - started
+        expected = step['expected']
+        throttled = status == THROTTLED and expected != THROTTLED
+        stats.record(
+            step['name'], latency, status,
+            response is None or (
+                status != expected if expected else status >= 500
+            ),
+            throttled
+        )
+        if response is None or not step['saved'] or status != expected:
+            return
+        try:
+            data = response.json()
+            for name, index, key, first_letter in step['saved']:
+                value = (data if index is None else data[index])[key]
+                variables[name] = value[:1] if first_letter else value
+        except (ValueError, LookupError, TypeError):
+            pass
+
+    def run_user(self, number):
+        variables = self.get_variables(number)
+        with requests.Session() as session:
+            for step in self.setup:
+                if self.stop.is_set():
+                    return
+                self.send(session, step, variables, self.setup_stats)
+            names = list(self.scenarios)
+            while not self.stop.is_set():
+                name = random.choices(names, self.weights)[0]
+                for step in self.scenarios[name]:
+                    if self.stop.is_set():
+                        return
+                    self.send(session, step, variables, self.stats)
+
+    def write_summary(self, title, stats, elapsed):
+        total, rows = stats.summary(elapsed)
+        self.stdout.write(f'\n{title}')
+        self.stdout.write(
+            f'{"Запрос":<60} {"Кол-во":>7} {"RPS":>7} {"Ошибки":>7} '
+            f'{THROTTLED:>7} '
+            + ' '.join(f'{f"p{p}, мс":>9}' for p in PERCENTILES)
+            + '  Статусы'
+        )
+        for row in rows + [{'name': 'Всего', **total}]:
+            self.stdout.write(
+                f'{row["name"][:60]:<60} {row["count"]:>7} '
+                f'{row["rps"]:>7.1f} {row["error_rate"]:>7.1%} '
+                f'{row["throttled"]:>7} '
+                + ' '.join(
+                    f'{row[f"p{p}"] * 1000:>9.1f}' for p in PERCENTILES
+                )
+                + '  ' + ' '.join(
+                    f'{status}:{count}'
+                    for status, count in row.get('statuses', {}).items()
+                )
+            )
+        if total['throttled']:
+            self.stderr.write(
+                f'Сервер ограничил частоту {total["throttled"]} запросов. '
+                'Они не входят в RPS и ошибки, но сценарии с ними '
+                'нагружают сервер меньше обычного: поднимите на сервере '
+                + ', '.join(THROTTLE_SETTINGS) + ', например 100000/min.'
+            )
+        return total
+
+    def write_saturation(self, stages):
+        self.stdout.write('\nСтупени нагрузки')
+        self.stdout.write(
+            f'{"Пользователи":>12} {"RPS":>8} {"p95, мс":>9} {"Ошибки":>7}'
+        )
+        for users, total in stages:
+            self.stdout.write(
+                f'{users:>12} {total["rps"]:>8.1f} '
+                f'{total["p95"] * 1000:>9.1f} {total["error_rate"]:>7.1%}'
+            )
+        for (users, total), (_, following) in zip(stages, stages[1:]):
+            if (
+                following['rps'] < total['rps'] * (1 + SATURATION_GAIN)
+                or following['error_rate'] > MAX_ERROR_RATE
+            ):
+                return (
+                    f'Насыщение при {users} пользователях: '
+                    f'{total["rps"]:.1f} запросов в секунду.'
+                )
+        return 'Насыщение не достигнуто, увеличьте число пользователей.'
+
+    def handle(self, *args, **options):
+        """Метод запускает виртуальных пользователей по ступеням."""
+        self.variables, folders = load_collection(options['collection'])
+        self.scenarios, self.weights = self.get_scenarios(
+            folders, options['weight']
+        )
+        self.setup = [step for path in SETUP for step in folders[path]]
+        self.base_url = options['base_url'].rstrip('/')
+        self.timeout = options['timeout']
+        self.prefix = f'lt{uuid.uuid4().hex[:6]}-'
+        if options['ramp']:
+            try:
+                ramp = [int(users) for users in options['ramp'].split(',')]
+            except ValueError:
+                raise CommandError('Ступени задаются числами через запятую.')
+        else:
+            ramp = [options['users']]
+        if not options['keep_data']:
+            self.check_database()
+
+        self.stop = threading.Event()
+        self.setup_stats = Stats()
+        threads, stages = [], []
+        try:
+            for users in ramp:
+                self.stats = Stats()
+                while len(threads) < users:
+                    thread = threading.Thread(
+                        target=self.run_user, args=(len(threads),),
+                        daemon=True
+                    )
+                    thread.start()
+                    threads.append(thread)
+                time.sleep(options['duration'])
+                elapsed = time.monotonic() - self.stats.started
+                stages.append((users, self.write_summary(
+                    f'Пользователей: {users}', self.stats, elapsed
+                )))
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join(self.timeout)
+            self.write_summary(
+                'Подготовка пользователей', self.setup_stats,
+                time.monotonic() - self.setup_stats.started
+            )
+            if not options['keep_data']:
+                User.objects.filter(
+                    username__startswith=self.prefix
+                ).delete()
+        if len(stages) > 1:
+            return self.write_saturation(stages)
+        return 'Нагрузочный тест завершен.'
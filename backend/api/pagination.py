@@ -1,4 +1,7 @@
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from foodgram.constants import PAGINATION_PAGE_SIZE
 
@@ -6,3 +9,45 @@ from foodgram.constants import PAGINATION_PAGE_SIZE
 class LimitPagePagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = PAGINATION_PAGE_SIZE
+
+
+class KeysetLimitPagination(LimitPagePagination):
+    """
+    Пагинация по страницам с дополнительным режимом по ключу.
+    Если передан параметр after, возвращаются объекты с id больше
+    указанного, без подсчета общего количества и OFFSET.
+    Для первой страницы передается after=0.
+    """
+    after_query_param = 'after'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        after = request.query_params.get(self.after_query_param)
+        self.keyset = after is not None
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        try:
+            after = int(after)
+        except ValueError:
+            raise ValidationError(
+                {self.after_query_param: 'Укажите id числом.'}
+            )
+        self.request = request
+        page_size = self.get_page_size(request)
+        items = list(
+            queryset.filter(pk__gt=after).order_by('pk')[:page_size + 1]
+        )
+        self.has_next = len(items) > page_size
+        self.items = items[:page_size]
+        return self.items
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        next_url = None
+        if self.has_next:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(),
+                self.after_query_param,
+                self.items[-1].pk
+            )
+        return Response({'next': next_url, 'results': data})
@@ -0,0 +1,23 @@
+import mimetypes
+
+from rest_framework.parsers import FileUploadParser
+
+
+class RawImageParser(FileUploadParser):
+    """
+    Парсер для загрузки изображения телом запроса без base64.
+    Файл читается обработчиками загрузки Django частями и при большом
+    размере сразу пишется во временный файл, а не в память.
+    Имя файла берется из Content-Disposition или из Content-Type.
+    """
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        content_type = parser_context['request'].content_type
+        extension = mimetypes.guess_extension(
+            content_type.split(';')[0].strip()
+        )
+        return f'upload{extension or ""}'
@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from foodgram.constants import (
+    PUBLIC_CACHE_COMPRESS_LEVEL,
+    PUBLIC_CACHE_MIN_COMPRESS_LENGTH,
+    PUBLIC_CACHE_PREFIXES
+)
+
+DISABLED_QUALITIES = ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+
+
+def get_generation():
+    """
+    Метод возвращает текущее поколение кеша публичных ответов.
+    Поколение хранится в файле PUBLIC_CACHE_GENERATION_PATH, общем
+    для воркеров: кеш default у каждого процесса свой.
+    """
+    try:
+        with open(settings.PUBLIC_CACHE_GENERATION_PATH) as file:
+            return file.read()
+    except FileNotFoundError:
+        return ''
+
+
+def bump_generation():
+    """Метод атомарно записывает в файл новое поколение."""
+    path = settings.PUBLIC_CACHE_GENERATION_PATH
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    with open(temporary, 'w') as file:
+        file.write(uuid.uuid4().hex)
+    os.replace(temporary, path)
+
+
+def invalidate_payloads():
+    """
+    Метод делает все сохраненные ответы устаревшими после коммита.
+    Ключи содержат поколение, поэтому старые записи просто
+    перестают читаться и вытесняются по PUBLIC_CACHE_TTL. До коммита
+    поколение не меняется: иначе другой воркер мог бы сохранить
+    под новым поколением еще старые данные.
+    """
+    transaction.on_commit(bump_generation)
+
+
+def accepts_gzip(request):
+    """Метод проверяет, что клиент принимает ответ в gzip."""
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in DISABLED_QUALITIES
+    return False
+
+
+def is_cacheable(request):
+    """Метод проверяет, что запрос получает публичный ответ."""
+    return (
+        request.method == 'GET'
+        and request.path.startswith(PUBLIC_CACHE_PREFIXES)
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and not request.user.is_authenticated
+    )
+
+
+def get_payload_key(request):
+    identity = '|'.join((
+        str(get_generation()),
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', '')
+    ))
+    return f'public-payload:{hashlib.sha1(identity.encode()).hexdigest()}'
+
+
+def make_payload(response):
+    """
+    Метод сохраняет тело ответа и его сжатую версию.
+    Короткие тела не сжимаются: выигрыш меньше заголовков gzip.
+    """
+    body = response.content
+    compressed = None
+    if len(body) >= PUBLIC_CACHE_MIN_COMPRESS_LENGTH:
+        compressed = gzip.compress(
+            body, compresslevel=PUBLIC_CACHE_COMPRESS_LEVEL
+        )
+    return response['Content-Type'], body, compressed
+
+
+def build_response(request, payload):
+    content_type, body, compressed = payload
+    if compressed is not None and accepts_gzip(request):
+        response = HttpResponse(compressed, content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body, content_type=content_type)
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+
+class CompressedPayloadMiddleware:
+    """
+    Middleware, которое кеширует публичные JSON-ответы для анонимных
+    пользователей вместе с их сжатой версией. Каждое тело сжимается
+    один раз при сохранении, а сжатый или обычный вариант выбирается
+    по Accept-Encoding запроса.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_cacheable(request):
+            return self.get_response(request)
+        key = get_payload_key(request)
+        payload = cache.get(key)
+        if payload is None:
+            response = self.get_response(request)
+            if (
+                response.status_code != 200
+                or response.streaming
+                or not response.get('Content-Type', '').startswith(
+                    'application/json'
+                )
+            ):
+                return response
+            payload = make_payload(response)
+            cache.set(key, payload, settings.PUBLIC_CACHE_TTL)
+        return build_response(request, payload)
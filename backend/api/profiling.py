@@ -0,0 +1,148 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from foodgram.constants import (
+    PROFILE_MEMORY_SITES,
+    PROFILE_STATS_LINES,
+    PROFILE_TRACE_FRAMES
+)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+PROFILE_FORMATS = {
+    'prof': 'application/octet-stream',
+    'txt': 'text/plain; charset=utf-8',
+}
+
+# Профили хранятся вне MEDIA_ROOT, чтобы nginx не отдавал их всем.
+profile_storage = FileSystemStorage(location=settings.PROFILES_ROOT)
+
+# tracemalloc и профилировщик глобальны для процесса,
+# поэтому одновременно профилируется только один запрос.
+_profile_lock = threading.Lock()
+
+
+def is_profile_requested(request):
+    return PROFILE_HEADER in request.META or PROFILE_PARAM in request.GET
+
+
+def get_staff_user(request):
+    """
+    Метод возвращает администратора, отправившего запрос, или None.
+    Токен проверяется здесь, так как DRF аутентифицирует запрос
+    только во view, уже после middleware.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            user, _ = TokenAuthentication().authenticate(request) or (
+                None, None
+            )
+        except AuthenticationFailed:
+            return None
+    if user is not None and user.is_staff:
+        return user
+    return None
+
+
+def render_report(request, user, duration, profiler, peak, snapshot, base):
+    """Метод формирует текстовый отчет по времени и памяти."""
+    buffer = io.StringIO()
+    buffer.write(
+        f'{request.method} {request.get_full_path()}\n'
+        f'Пользователь: {user.username}\n'
+        f'Время: {duration * 1000:.1f} мс\n'
+        f'Пик памяти: {peak / 1024:.1f} КиБ\n\n'
+    )
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+        PROFILE_STATS_LINES
+    )
+    buffer.write('Память, занятая к концу запроса, по местам выделения:\n')
+    for stat in snapshot.compare_to(base, 'lineno')[:PROFILE_MEMORY_SITES]:
+        buffer.write(f'{stat}\n')
+    return buffer.getvalue()
+
+
+def save_profile(profile_id, profiler, report):
+    """
+    Метод сохраняет профиль в двух видах: файл pstats для snakeviz
+    и текстовый отчет. Старые профили сверх PROFILES_KEEP удаляются.
+    """
+    # Stats.dump_stats пишет только в файл по имени, поэтому
+    # статистика сериализуется так же, но сразу в хранилище.
+    stats = marshal.dumps(pstats.Stats(profiler).stats)
+    profile_storage.save(f'{profile_id}.prof', ContentFile(stats))
+    profile_storage.save(f'{profile_id}.txt', ContentFile(report.encode()))
+    names = sorted(profile_storage.listdir('')[1], reverse=True)
+    for name in names[2 * settings.PROFILES_KEEP:]:
+        profile_storage.delete(name)
+
+
+def list_profiles():
+    """Метод возвращает id сохраненных профилей, новые первыми."""
+    return sorted(
+        {name.rsplit('.', 1)[0] for name in profile_storage.listdir('')[1]},
+        reverse=True
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Middleware, которое профилирует запрос администратора с заголовком
+    X-Profile или параметром profile: время по вызовам через cProfile
+    и память через tracemalloc. Id сохраненного профиля возвращается
+    в заголовке X-Profile-Id. Остальные запросы проходят с проверкой
+    двух ключей словаря.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profile_requested(request):
+            return self.get_response(request)
+        user = get_staff_user(request)
+        if user is None or not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, user)
+        finally:
+            _profile_lock.release()
+
+    def profile(self, request, user):
+        profiler = cProfile.Profile()
+        tracemalloc.start(PROFILE_TRACE_FRAMES)
+        base = tracemalloc.take_snapshot()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        profile_id = f'{time.strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        save_profile(
+            profile_id,
+            profiler,
+            render_report(
+                request, user, duration, profiler, peak, snapshot, base
+            )
+        )
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+
+from recipes.models import Favorite, IngredientRecipe, Recipe, ShoppingList
+
+User = get_user_model()
+
+
+RECIPE_FIELD_COLUMNS = {
+    'id': ('id',),
+    'author': ('author',),
+    'name': ('name',),
+    'image': ('image',),
+    'image_renditions': ('image', 'image_renditions_for'),
+    'text': ('text',),
+    'cooking_time': ('cooking_time',),
+}
+USER_FIELD_COLUMNS = {
+    'id': ('id',),
+    'email': ('email',),
+    'username': ('username',),
+    'first_name': ('first_name',),
+    'last_name': ('last_name',),
+    'avatar': ('avatar',),
+    'avatar_renditions': ('avatar', 'avatar_renditions_for'),
+}
+
+
+def get_requested_fields(request):
+    """Метод возвращает множество полей из параметра fields или None."""
+    fields = request.query_params.get('fields', '')
+    fields = {field.strip() for field in fields.split(',') if field.strip()}
+    return fields or None
+
+
+def get_columns(fields, field_columns):
+    """Метод возвращает столбцы модели, нужные для вывода полей."""
+    columns = {'id'}
+    for field in fields:
+        columns.update(field_columns.get(field, ()))
+    return columns
+
+
+def get_user_flag(model, current_user, **filters):
+    """Метод возвращает EXISTS-выражение для флага текущего пользователя."""
+    if not current_user.is_authenticated:
+        return Value(False, output_field=BooleanField())
+    return Exists(model.objects.filter(current_user=current_user, **filters))
+
+
+def get_authors_queryset(user):
+    """Метод возвращает авторов для UserSerializer."""
+    return get_user_queryset(user, User.objects.all())
+
+
+def get_recipe_queryset(user, queryset=None, fields=None):
+    """
+    Метод возвращает рецепты со всем, что нужно RecipeSerializer.
+    Флаги пользователя вычисляются в основном запросе, а авторы,
+    теги и ингредиенты загружаются тремя дополнительными запросами
+    независимо от количества рецептов.
+    Если передан fields, загружаются только нужные для этих полей
+    столбцы, связи и флаги.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    if fields is None:
+        fields = set(RECIPE_FIELD_COLUMNS) | {
+            'tags', 'ingredients', 'is_favorited', 'is_in_shopping_cart'
+        }
+    else:
+        queryset = queryset.only(
+            *get_columns(fields, RECIPE_FIELD_COLUMNS)
+        )
+    if 'is_favorited' in fields:
+        queryset = queryset.annotate(
+            is_favorited=get_user_flag(Favorite, user, recipe=OuterRef('pk'))
+        )
+    if 'is_in_shopping_cart' in fields:
+        queryset = queryset.annotate(
+            is_in_shopping_cart=get_user_flag(
+                ShoppingList, user, recipe=OuterRef('pk')
+            )
+        )
+    if 'author' in fields:
+        queryset = queryset.prefetch_related(
+            Prefetch('author', queryset=get_authors_queryset(user))
+        )
+    if 'tags' in fields:
+        queryset = queryset.prefetch_related('tags')
+    if 'ingredients' in fields:
+        queryset = queryset.prefetch_related(
+            Prefetch(
+                'ingredientrecipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
+    return queryset
+
+
+def get_user_queryset(user, queryset, fields=None):
+    """
+    Метод возвращает пользователей для UserSerializer.
+    Столбцы, не нужные для полей fields, не загружаются. Флаг
+    is_subscribed не вычисляется в запросе: сериализатор берет его
+    из множества подписок текущего пользователя.
+    """
+    if fields is None:
+        return queryset
+    return queryset.only(*get_columns(fields, USER_FIELD_COLUMNS))
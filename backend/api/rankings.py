@@ -0,0 +1,95 @@
+import math
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, RecipeRanking, ShoppingList
+
+RANKING_ORDERINGS = {
+    'popular': 'popularity',
+    'trending': 'trending',
+}
+RANKING_BATCH_SIZE = 1000
+RANKING_PRECISION = 4
+
+
+def get_popularity():
+    """Метод возвращает количество добавлений в избранное по рецептам."""
+    return dict(
+        Favorite.objects.values('recipe').annotate(
+            total=Count('id')
+        ).values_list('recipe', 'total')
+    )
+
+
+def get_trending(now):
+    """
+    Метод возвращает тренд рецептов: сумму добавлений в избранное
+    и список покупок, вес которых падает вдвое каждые
+    RANKING_TRENDING_HALF_LIFE секунд. События старше четырех
+    периодов полураспада не учитываются.
+    """
+    half_life = settings.RANKING_TRENDING_HALF_LIFE
+    since = now - timedelta(seconds=4 * half_life)
+    scores = Counter()
+    for model in (Favorite, ShoppingList):
+        events = model.objects.filter(added_at__gte=since).values_list(
+            'recipe', 'added_at'
+        )
+        for recipe_id, added_at in events.iterator():
+            age = (now - added_at).total_seconds()
+            scores[recipe_id] += math.pow(0.5, max(age, 0) / half_life)
+    return scores
+
+
+def refresh_rankings():
+    """
+    Метод пересчитывает рейтинги всех рецептов.
+    Запускается периодически обработчиком фоновых задач;
+    обновляются только строки, у которых изменились значения.
+    """
+    popularity = get_popularity()
+    trending = get_trending(timezone.now())
+    current = {
+        ranking.recipe_id: ranking
+        for ranking in RecipeRanking.objects.all().iterator()
+    }
+    created, changed = [], []
+    for recipe_id in Recipe.objects.values_list('id', flat=True).iterator():
+        values = (
+            float(popularity.get(recipe_id, 0)),
+            round(trending.get(recipe_id, 0), RANKING_PRECISION)
+        )
+        ranking = current.get(recipe_id)
+        if ranking is None:
+            created.append(RecipeRanking(
+                recipe_id=recipe_id,
+                popularity=values[0],
+                trending=values[1]
+            ))
+        elif (ranking.popularity, ranking.trending) != values:
+            ranking.popularity, ranking.trending = values
+            changed.append(ranking)
+    RecipeRanking.objects.bulk_create(
+        created, batch_size=RANKING_BATCH_SIZE, ignore_conflicts=True
+    )
+    RecipeRanking.objects.bulk_update(
+        changed, ('popularity', 'trending'), batch_size=RANKING_BATCH_SIZE
+    )
+    return len(created) + len(changed)
+
+
+def order_by_ranking(queryset, ordering):
+    """
+    Метод сортирует рецепты по рейтингу.
+    Выборка идет по индексу таблицы рейтингов с соединением
+    с рецептами по первичному ключу, поэтому страница стоит
+    столько же, сколько при сортировке по дате.
+    """
+    field = RANKING_ORDERINGS[ordering]
+    return queryset.filter(ranking__isnull=False).order_by(
+        f'-ranking__{field}', '-ranking__recipe_id'
+    )
@@ -0,0 +1,124 @@
+import io
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .changes import log_changes
+from .payload_cache import invalidate_payloads
+from foodgram.constants import RENDITION_FORMATS, RENDITION_WIDTHS
+from foodgram.storage import content_storage
+from recipes.models import Change, Recipe
+
+User = get_user_model()
+
+RENDITIONS_DIR = 'renditions'
+
+
+def get_renditions_dir(name):
+    """Метод возвращает каталог уменьшенных копий изображения."""
+    return f'{RENDITIONS_DIR}/{os.path.splitext(name)[0]}'
+
+
+def get_rendition_name(name, size, extension):
+    return f'{get_renditions_dir(name)}/{size}.{extension}'
+
+
+def has_renditions(name):
+    last_size = list(RENDITION_WIDTHS)[-1]
+    last_format = list(RENDITION_FORMATS)[-1]
+    return default_storage.exists(
+        get_rendition_name(name, last_size, last_format)
+    )
+
+
+def mark_renditions_ready(name):
+    """
+    Метод отмечает в рецептах и пользователях с этим изображением,
+    что копии созданы, чтобы сериализаторы не проверяли файлы.
+    Отметка меняет ответ API, поэтому рецепты попадают в журнал
+    изменений, а кеш публичных ответов сбрасывается.
+    """
+    with transaction.atomic():
+        recipe_ids = list(
+            Recipe.objects.filter(image=name).exclude(
+                image_renditions_for=name
+            ).values_list('id', flat=True)
+        )
+        if recipe_ids:
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                image_renditions_for=name
+            )
+            log_changes(Change.RECIPE, recipe_ids, Change.UPDATED)
+        users = User.objects.filter(avatar=name).exclude(
+            avatar_renditions_for=name
+        ).update(avatar_renditions_for=name)
+        if recipe_ids or users:
+            invalidate_payloads()
+
+
+def generate_renditions(name, force=False):
+    """
+    Метод создает уменьшенные копии изображения во всех размерах
+    и форматах и отмечает их готовность в моделях. Уже существующие
+    копии пропускаются, если не указан force.
+    """
+    if not name:
+        return
+    if not force and has_renditions(name):
+        mark_renditions_ready(name)
+        return
+    with content_storage.open(name, 'rb') as file:
+        original = Image.open(file)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+    for size, width in RENDITION_WIDTHS.items():
+        image = original.copy()
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        for extension, (image_format, options) in RENDITION_FORMATS.items():
+            rendition = image
+            if image_format == 'JPEG' and image.mode == 'RGBA':
+                rendition = Image.new('RGB', image.size, 'white')
+                rendition.paste(image, mask=image.getchannel('A'))
+            path = get_rendition_name(name, size, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            buffer = io.BytesIO()
+            rendition.save(buffer, image_format, **options)
+            default_storage.save(path, ContentFile(buffer.getvalue()))
+    mark_renditions_ready(name)
+
+
+def get_renditions(name, ready_for):
+    """
+    Метод возвращает ссылки на уменьшенные копии изображения
+    и готовые значения srcset для каждого формата. ready_for — имя
+    изображения, для которого фоновая задача уже создала копии.
+    Пока оно не совпадает с name, возвращается None, и клиент
+    показывает оригинал из поля image.
+    """
+    if not name or name != ready_for:
+        return None
+    sizes = {
+        size: {
+            'width': width,
+            **{
+                extension: default_storage.url(
+                    get_rendition_name(name, size, extension)
+                )
+                for extension in RENDITION_FORMATS
+            }
+        }
+        for size, width in RENDITION_WIDTHS.items()
+    }
+    srcsets = {
+        f'srcset_{extension}': ', '.join(
+            f'{item[extension]} {item["width"]}w' for item in sizes.values()
+        )
+        for extension in RENDITION_FORMATS
+    }
+    return {**sizes, **srcsets}
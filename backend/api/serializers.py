@@ -3,15 +3,21 @@ import re
 
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
+from .follows import is_subscribed
+from .renditions import get_renditions
+from .shopping_cart import get_recipe_amounts, update_recipe_in_carts
 from recipes.models import (
+    Change,
     Favorite,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingList,
+    ShoppingListIngredient,
     ShortLinkRecipe,
     Tag,
 )
@@ -33,12 +39,26 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Миксин для вывода только запрошенных полей.
+    Список полей передается аргументом fields; неизвестные
+    имена игнорируются.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для отображения объекта модели User."""
     avatar = serializers.SerializerMethodField(
         'get_avatar_url',
         required=False
     )
+    avatar_renditions = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField(default=False)
 
     class Meta:
@@ -50,7 +70,8 @@ class UserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'is_subscribed',
-            'avatar'
+            'avatar',
+            'avatar_renditions'
         )
 
     def get_avatar_url(self, obj):
@@ -59,6 +80,12 @@ class UserSerializer(serializers.ModelSerializer):
             return obj.avatar.url
         return None
 
+    def get_avatar_renditions(self, obj):
+        """Метод получает ссылки на уменьшенные копии аватара."""
+        return get_renditions(
+            obj.avatar.name, obj.avatar_renditions_for
+        )
+
     def get_is_subscribed(self, obj):
         """
         Метод проверяет, подписан ли текущий пользовтаель
@@ -66,13 +93,7 @@ class UserSerializer(serializers.ModelSerializer):
         """
         if not self.context.get('request'):
             return False
-        current_user = self.context.get('request').user
-        if current_user.is_authenticated:
-            return Subscription.objects.filter(
-                current_user=current_user,
-                user=obj.id
-            ).exists()
-        return False
+        return is_subscribed(self.context['request'].user, obj.id)
 
 
 class UserShowSerializer(serializers.ModelSerializer):
@@ -155,6 +176,34 @@ class AvatarUpdateSerializer(serializers.ModelSerializer):
         return representation
 
 
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Сериализатор для замены фото рецепта."""
+    image = Base64ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def to_representation(self, instance):
+        """Метод возвращает ссылки на фото и его уменьшенные копии."""
+        return {
+            'image': instance.image.url,
+            'image_renditions': get_renditions(
+                instance.image.name, instance.image_renditions_for
+            )
+        }
+
+
+class ChangeSerializer(serializers.ModelSerializer):
+    """Сериализатор для записей журнала изменений."""
+    type = serializers.CharField(source='object_type')
+    id = serializers.IntegerField(source='object_id')
+
+    class Meta:
+        model = Change
+        fields = ('type', 'id', 'action')
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Tag."""
 
@@ -184,7 +233,21 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class ShoppingCartItemSerializer(serializers.ModelSerializer):
+    """Сериализатор для итоговой строки списка покупок."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ShoppingListIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для отображения объекта модели Recipe."""
     tags = TagSerializer(many=True)
     author = UserSerializer()
@@ -194,6 +257,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField(default=False)
     is_in_shopping_cart = serializers.SerializerMethodField(default=False)
     image = serializers.SerializerMethodField('get_image_url')
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -206,6 +270,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time'
         )
@@ -216,6 +281,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         Метод проверяет, есть ли рецепт в избранном
         у текущего пользователя.
         """
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if 'request' not in self.context:
             return False
         current_user = self.context['request'].user
@@ -231,6 +298,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         Метод проверяет, есть ли рецепт в списке покупок
         у текущего пользователя.
         """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if 'request' not in self.context:
             return False
         current_user = self.context['request'].user
@@ -247,6 +316,10 @@ class RecipeSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image_renditions(self, obj):
+        """Метод получает ссылки на уменьшенные копии изображения."""
+        return get_renditions(obj.image.name, obj.image_renditions_for)
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания или изменения объекта Recipe."""
@@ -318,6 +391,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         data['ingredients'] = ingredients
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         """Переопределят метод для создания объекта модели Recipe.
         и создает соответствующие записи в связанных таблицах
@@ -344,6 +418,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Переопределяет метод для изменения объекта модели Recipe."""
         instance.name = validated_data.get('name', instance.name)
@@ -365,6 +440,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             instance.save()
         else:
             ingredients_data = validated_data.pop('ingredients')
+            old_amounts = get_recipe_amounts(instance.id)
             IngredientRecipe.objects.filter(recipe=instance).all().delete()
             for ingredient in ingredients_data:
                 amount = ingredient['amount']
@@ -374,6 +450,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     ingredient=ingredient,
                     amount=amount
                 )
+            update_recipe_in_carts(
+                instance, old_amounts, get_recipe_amounts(instance.id)
+            )
         instance.save()
         return instance
 
@@ -390,10 +469,11 @@ class RecipeResponseSerializer(serializers.ModelSerializer):
     Используется при формирование ответов на запросы.
     """
     image = serializers.SerializerMethodField('get_image_url')
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
     def get_image_url(self, obj):
         """Метод получает URL изображения."""
@@ -401,6 +481,10 @@ class RecipeResponseSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image_renditions(self, obj):
+        """Метод получает ссылки на уменьшенные копии изображения."""
+        return get_renditions(obj.image.name, obj.image_renditions_for)
+
     def validate(self, data):
         """
         Метод проверяет данные для рецепта при добавлении и
@@ -457,6 +541,7 @@ class SubcriptionSerializer(serializers.ModelSerializer):
         'get_avatar_url',
         required=False
     )
+    avatar_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Subscription
@@ -469,7 +554,8 @@ class SubcriptionSerializer(serializers.ModelSerializer):
             'is_subscribed',
             'recipes',
             'recipes_count',
-            'avatar'
+            'avatar',
+            'avatar_renditions'
         )
 
     def get_avatar_url(self, obj):
@@ -478,16 +564,18 @@ class SubcriptionSerializer(serializers.ModelSerializer):
             return obj.user.avatar.url
         return None
 
+    def get_avatar_renditions(self, obj):
+        """Метод получает ссылки на уменьшенные копии аватара."""
+        return get_renditions(
+            obj.user.avatar.name, obj.user.avatar_renditions_for
+        )
+
     def get_is_subscribed(self, obj):
         """
         Метод проверяет, подписан ли текущий пользовтаель
         на другого пользователя.
         """
-        if obj.current_user.is_authenticated:
-            return Subscription.objects.filter(
-                current_user=obj.current_user,
-                user=obj.user
-            ).exists()
+        return is_subscribed(self.context['request'].user, obj.user_id)
 
     def get_recipes(self, obj):
         """
@@ -517,24 +605,22 @@ class SubcriptionSerializer(serializers.ModelSerializer):
     def validate(self, data):
         current_user = self.context['request'].user
         user_id = self.initial_data['id']
-        user = get_object_or_404(User, id=user_id)
-
-        subscription = Subscription.objects.filter(
-            current_user=current_user,
-            user=user
-        ).first()
+        subscribed = is_subscribed(current_user, user_id)
 
-        if self.context['request'].method == 'POST' and subscription:
+        if self.context['request'].method == 'POST' and subscribed:
             raise serializers.ValidationError(
                 'Вы уже подписаны на этого пользователя',
             )
 
-        if self.context['request'].method == 'POST' and current_user == user:
+        if (
+            self.context['request'].method == 'POST'
+            and current_user.id == user_id
+        ):
             raise serializers.ValidationError(
                 'Вы не можете подписываться на самого себя',
             )
 
-        if self.context['request'].method == 'DELETE' and not subscription:
+        if self.context['request'].method == 'DELETE' and not subscribed:
             raise serializers.ValidationError(
                 'Подписка не найдена.',
             )
@@ -0,0 +1,132 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+
+from foodgram.constants import (
+    CART_AMOUNT_DECIMAL_PLACES,
+    CART_AMOUNT_MAX_DIGITS
+)
+from recipes.models import IngredientRecipe, ShoppingListIngredient
+
+AMOUNT_STEP = Decimal(1).scaleb(-CART_AMOUNT_DECIMAL_PLACES)
+# В SQLite сумма считается в float: остаток меньше половины шага
+# считается нулем.
+MIN_AMOUNT = AMOUNT_STEP / 2
+
+
+def to_amount(value):
+    """
+    Метод округляет количество до точности итогов списка покупок.
+    Итоги хранятся в Decimal, поэтому добавление и удаление рецептов
+    не накапливают ошибку float.
+    """
+    return Decimal(value).quantize(AMOUNT_STEP)
+
+
+def get_recipe_amounts(recipe_id):
+    """Метод возвращает количество каждого ингредиента в рецепте."""
+    return {
+        ingredient_id: to_amount(amount)
+        for ingredient_id, amount in IngredientRecipe.objects.filter(
+            recipe=recipe_id
+        ).values_list('ingredient', 'amount')
+    }
+
+
+def apply_amounts(user_ids, amounts):
+    """
+    Метод изменяет суммарные количества ингредиентов в списках
+    покупок пользователей на значения из amounts.
+    Строки с нулевым количеством удаляются.
+    """
+    amounts = {
+        ingredient_id: amount
+        for ingredient_id, amount in amounts.items() if amount
+    }
+    user_ids = list(user_ids)
+    if not amounts or not user_ids:
+        return
+    with transaction.atomic():
+        ShoppingListIngredient.objects.bulk_create(
+            [
+                ShoppingListIngredient(
+                    current_user_id=user_id, ingredient_id=ingredient_id
+                )
+                for user_id in user_ids for ingredient_id in amounts
+            ],
+            ignore_conflicts=True
+        )
+        items = ShoppingListIngredient.objects.filter(
+            current_user__in=user_ids,
+            ingredient__in=amounts
+        )
+        items.update(
+            amount=F('amount') + Case(
+                *(
+                    When(ingredient=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in amounts.items()
+                ),
+                output_field=DecimalField(
+                    max_digits=CART_AMOUNT_MAX_DIGITS,
+                    decimal_places=CART_AMOUNT_DECIMAL_PLACES
+                )
+            )
+        )
+        items.filter(amount__lt=MIN_AMOUNT).delete()
+
+
+def add_recipe_to_cart(user_id, recipe_id):
+    apply_amounts((user_id,), get_recipe_amounts(recipe_id))
+
+
+def remove_recipe_from_cart(user_id, recipe_id):
+    apply_amounts(
+        (user_id,),
+        {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+        }
+    )
+
+
+def update_recipe_in_carts(recipe, old_amounts, new_amounts):
+    """
+    Метод переносит изменение ингредиентов рецепта в списки покупок
+    всех пользователей, у которых этот рецепт лежит в корзине.
+    """
+    amounts = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    apply_amounts(
+        recipe.shoppinglists.values_list('current_user', flat=True),
+        amounts
+    )
+
+
+def rebuild_cart(user_id):
+    """
+    Метод пересчитывает список покупок пользователя с нуля.
+    Используется командой rebuild_shopping_carts.
+    """
+    with transaction.atomic():
+        totals = {}
+        for ingredient_id, amount in IngredientRecipe.objects.filter(
+            recipe__shoppinglists__current_user=user_id
+        ).values_list('ingredient', 'amount'):
+            totals[ingredient_id] = (
+                totals.get(ingredient_id, 0) + to_amount(amount)
+            )
+        ShoppingListIngredient.objects.filter(current_user=user_id).delete()
+        ShoppingListIngredient.objects.bulk_create(
+            ShoppingListIngredient(
+                current_user_id=user_id,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in totals.items()
+        )
@@ -0,0 +1,235 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete
+)
+from django.dispatch import receiver
+
+from .changes import log_change
+from .events import publish
+from .feed import backfill_feed, fan_out_recipe, trim_feed
+from .payload_cache import invalidate_payloads
+from .renditions import generate_renditions
+from jobs.queue import enqueue
+from .shopping_cart import add_recipe_to_cart, remove_recipe_from_cart
+from .snapshot import reference_snapshot
+from recipes.models import (
+    Change,
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    RecipeRanking,
+    ShoppingList,
+    Tag
+)
+from users.models import FoodgramUser, Subscription
+
+
+@receiver(post_save, sender=Recipe)
+def create_ranking(sender, instance, created, **kwargs):
+    """Создает нулевой рейтинг, чтобы рецепт попадал в сортировки."""
+    if created:
+        RecipeRanking.objects.get_or_create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_to_feeds(sender, instance, created, **kwargs):
+    """Ставит в очередь рассылку нового рецепта подписчикам."""
+    if created:
+        enqueue(fan_out_recipe, instance.id, priority=1)
+
+
+@receiver(post_save, sender=Subscription)
+def fill_feed(sender, instance, created, **kwargs):
+    """Ставит в очередь заполнение ленты рецептами автора при подписке."""
+    if created:
+        enqueue(
+            backfill_feed, instance.current_user_id, instance.user_id,
+            priority=1
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_feed(sender, instance, **kwargs):
+    """Очищает ленту от рецептов автора при отписке."""
+    trim_feed(instance.current_user_id, instance.user_id)
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_to_cart_totals(sender, instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в итог списка покупок."""
+    if created:
+        add_recipe_to_cart(instance.current_user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def remove_from_cart_totals(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты рецепта из итога списка покупок.
+    Используется pre_delete, чтобы при каскадном удалении рецепта
+    его ингредиенты были еще доступны.
+    """
+    remove_recipe_from_cart(instance.current_user_id, instance.recipe_id)
+
+
+RENDITION_FIELDS = {
+    Recipe: 'image',
+    FoodgramUser: 'avatar',
+}
+
+
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=FoodgramUser)
+def remember_image(sender, instance, **kwargs):
+    """
+    Запоминает имя загруженного из БД фото или аватара, чтобы при
+    сохранении ставить задачу только после его замены. Значение
+    берется из __dict__: так отложенное поле не загружается.
+    """
+    value = instance.__dict__.get(RENDITION_FIELDS[sender])
+    instance._loaded_image = getattr(value, 'name', value)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=FoodgramUser)
+def create_renditions(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    """
+    Ставит в очередь создание уменьшенных копий фото или аватара,
+    если изображение изменилось и копий для него еще нет.
+    """
+    field = RENDITION_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    name = getattr(instance, field).name
+    changed = created or name != instance._loaded_image
+    instance._loaded_image = name
+    if (
+        name and changed
+        and name != getattr(instance, f'{field}_renditions_for')
+    ):
+        enqueue(generate_renditions, name)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_public_payloads(sender, **kwargs):
+    """Сбрасывает кеш публичных ответов при изменении каталога."""
+    invalidate_payloads()
+
+
+@receiver(post_save, sender=FoodgramUser)
+def invalidate_author_payloads(sender, update_fields=None, **kwargs):
+    """
+    Сбрасывает кеш публичных ответов при изменении пользователя,
+    кроме обновления last_login при входе.
+    """
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        invalidate_payloads()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def rebuild_reference_snapshot(sender, **kwargs):
+    """
+    Ставит перестройку общего снимка справочников в очередь.
+    Короткие ссылки перестройки не требуют: новых нет в снимке, и они
+    читаются из БД, а ссылка удаленного рецепта до перестройки по
+    REFERENCE_SNAPSHOT_TTL ведет на его страницу, которая отвечает 404.
+    """
+    reference_snapshot.invalidate()
+
+
+CHANGE_TYPES = {
+    Recipe: Change.RECIPE,
+    Tag: Change.TAG,
+    Ingredient: Change.INGREDIENT,
+}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def log_saved(sender, instance, created, **kwargs):
+    """
+    Записывает создание или изменение объекта в журнал изменений.
+    ChangeLoggedModel.save вызывает обработчик внутри своей
+    транзакции, поэтому запись журнала коммитится вместе с объектом.
+    """
+    log_change(
+        CHANGE_TYPES[sender],
+        instance.pk,
+        Change.CREATED if created else Change.UPDATED
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_deleted(sender, instance, **kwargs):
+    """Записывает удаление объекта в журнал изменений."""
+    log_change(CHANGE_TYPES[sender], instance.pk, Change.DELETED)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_recipe(sender, instance, created, **kwargs):
+    """Сообщает подписчикам автора о новом рецепте."""
+    if created:
+        publish(
+            'recipe_published',
+            {'id': instance.id, 'name': instance.name},
+            author=instance.author_id
+        )
+
+
+LIST_EVENTS = {
+    Favorite: ('favorite', 'is_favorited'),
+    ShoppingList: ('shopping_cart', 'is_in_shopping_cart'),
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def publish_list_change(sender, instance, signal, created=False, **kwargs):
+    """Сообщает другим устройствам пользователя об изменении списков."""
+    added = signal is post_save
+    if added and not created:
+        return
+    event, field = LIST_EVENTS[sender]
+    publish(
+        event,
+        {'recipe': instance.recipe_id, field: added},
+        user=instance.current_user_id
+    )
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def publish_subscription(sender, instance, signal, created=False, **kwargs):
+    """
+    Сообщает другим устройствам пользователя о подписке или отписке;
+    по этому событию поток обновляет список авторов пользователя.
+    """
+    added = signal is post_save
+    if added and not created:
+        return
+    publish(
+        'subscription',
+        {'author': instance.user_id, 'is_subscribed': added},
+        user=instance.current_user_id
+    )
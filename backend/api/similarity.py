@@ -0,0 +1,153 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from foodgram.constants import (
+    SIMILAR_CHUNK_SIZE,
+    SIMILAR_MAX_INGREDIENT_SHARE,
+    SIMILAR_MIN_INGREDIENT_LIMIT,
+    SIMILAR_RECIPES_TOP_K
+)
+
+SIMILAR_BATCH_SIZE = 5000
+
+# Модели импортируются внутри функций: процессы пула запускаются
+# через spawn и импортируют этот модуль без настройки Django.
+_matrix = None
+_transposed = None
+_top_k = None
+
+
+def load_pairs():
+    """Метод загружает пары (рецепт, ингредиент) в массивы NumPy."""
+    from recipes.models import IngredientRecipe
+
+    pairs = IngredientRecipe.objects.values_list(
+        'recipe', 'ingredient'
+    ).iterator(chunk_size=SIMILAR_BATCH_SIZE)
+    flat = np.fromiter(itertools.chain.from_iterable(pairs), dtype=np.int64)
+    return flat[0::2], flat[1::2]
+
+
+def build_matrix(recipes, ingredients):
+    """
+    Метод строит разреженную матрицу рецепт × ингредиент.
+    Веса ингредиентов обратно пропорциональны их частоте, строки
+    нормированы, поэтому произведение строк дает косинусное сходство.
+    Ингредиенты, которые встречаются больше чем в
+    SIMILAR_MAX_INGREDIENT_SHARE рецептов (соль, вода), отбрасываются:
+    они почти не влияют на сходство, но делают произведение плотным.
+    """
+    recipe_ids, rows = np.unique(recipes, return_inverse=True)
+    ingredient_ids, columns = np.unique(ingredients, return_inverse=True)
+    total = len(recipe_ids)
+    counts = np.bincount(columns, minlength=len(ingredient_ids))
+    limit = max(
+        SIMILAR_MAX_INGREDIENT_SHARE * total, SIMILAR_MIN_INGREDIENT_LIMIT
+    )
+    keep = counts[columns] <= limit
+    weights = np.log1p(total / counts)[columns[keep]].astype(np.float32)
+    matrix = sparse.csr_matrix(
+        (weights, (rows[keep], columns[keep])),
+        shape=(total, len(ingredient_ids)),
+        dtype=np.float32
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return recipe_ids, sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def init_worker(matrix, top_k):
+    global _matrix, _transposed, _top_k
+    _matrix = matrix
+    _transposed = matrix.T.tocsr()
+    _top_k = top_k
+
+
+def get_top_similar(start, stop):
+    """
+    Метод вычисляет для строк [start, stop) до _top_k самых похожих
+    рецептов. Выполняется в процессе пула; сходство блока строк со
+    всеми рецептами считается одним умножением разреженных матриц.
+    """
+    product = _matrix[start:stop].dot(_transposed).tocsr()
+    rows, similar, scores = [], [], []
+    for offset in range(stop - start):
+        begin, end = product.indptr[offset], product.indptr[offset + 1]
+        columns = product.indices[begin:end]
+        values = product.data[begin:end]
+        mask = columns != start + offset
+        columns, values = columns[mask], values[mask]
+        if len(values) > _top_k:
+            best = np.argpartition(-values, _top_k - 1)[:_top_k]
+            columns, values = columns[best], values[best]
+        rows.append(np.full(len(columns), start + offset, dtype=np.int64))
+        similar.append(columns)
+        scores.append(values)
+    if not rows:
+        return np.array([], np.int64), np.array([], np.int64), np.array([])
+    return np.concatenate(rows), np.concatenate(similar), np.concatenate(
+        scores
+    )
+
+
+def compute_similar(matrix, top_k, workers):
+    """Метод распределяет блоки строк матрицы по пулу процессов."""
+    total = matrix.shape[0]
+    starts = range(0, total, SIMILAR_CHUNK_SIZE)
+    stops = [min(start + SIMILAR_CHUNK_SIZE, total) for start in starts]
+    if workers <= 1:
+        init_worker(matrix, top_k)
+        return list(map(get_top_similar, starts, stops))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+        initargs=(matrix, top_k)
+    ) as executor:
+        return list(executor.map(get_top_similar, starts, stops))
+
+
+def store_similar(recipe_ids, results):
+    """Метод заменяет сохраненные похожие рецепты одной транзакцией."""
+    from recipes.models import SimilarRecipe
+
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        for rows, similar, scores in results:
+            SimilarRecipe.objects.bulk_create(
+                (
+                    SimilarRecipe(
+                        recipe_id=int(recipe_id),
+                        similar_id=int(similar_id),
+                        score=round(float(score), 4)
+                    )
+                    for recipe_id, similar_id, score in zip(
+                        recipe_ids[rows], recipe_ids[similar], scores
+                    )
+                    if score > 0
+                ),
+                batch_size=SIMILAR_BATCH_SIZE
+            )
+
+
+def refresh_similar_recipes(workers=None, top_k=SIMILAR_RECIPES_TOP_K):
+    """
+    Метод пересчитывает похожие рецепты по общим ингредиентам.
+    Запускается периодически обработчиком фоновых задач
+    или командой compute_similar_recipes.
+    """
+    if workers is None:
+        workers = settings.SIMILAR_RECIPES_WORKERS
+    recipes, ingredients = load_pairs()
+    if not len(recipes):
+        return 0
+    recipe_ids, matrix = build_matrix(recipes, ingredients)
+    results = compute_similar(matrix, top_k, workers)
+    store_similar(recipe_ids, results)
+    return len(recipe_ids)
@@ -0,0 +1,296 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+
+from foodgram.constants import REFERENCE_SNAPSHOT_CHECK_INTERVAL
+
+MAGIC = b'FGREF1\n'
+HEADER_LENGTH = struct.Struct('<I')
+# Запись таблицы: смещение и длина ключа, смещение и длина значения.
+ENTRY = struct.Struct('<IIII')
+ID_KEY = struct.Struct('>I')
+
+
+def pack_snapshot(tables, built_at):
+    """
+    Метод упаковывает таблицы в один буфер.
+    Таблица — отсортированный по ключу список пар (ключ, значение)
+    в байтах. Записи фиксированной длины позволяют искать ключ
+    двоичным поиском прямо в отображенном в память файле.
+    """
+    entries, blob, sections = bytearray(), bytearray(), {}
+    for name, rows in tables.items():
+        sections[name] = (len(entries), len(rows))
+        for key, value in rows:
+            entries += ENTRY.pack(
+                len(blob), len(key), len(blob) + len(key), len(value)
+            )
+            blob += key + value
+    header = json.dumps({
+        'built_at': built_at,
+        'sections': sections,
+        'blob': len(entries),
+    }).encode()
+    return b''.join(
+        (MAGIC, HEADER_LENGTH.pack(len(header)), header, entries, blob)
+    )
+
+
+def build_tables():
+    """Метод загружает справочные данные в таблицы снимка."""
+    from recipes.models import Ingredient, ShortLinkRecipe, Tag
+    from .serializers import IngredientSerializer, TagSerializer
+
+    tags = [
+        (ID_KEY.pack(tag['id']), json.dumps(tag).encode())
+        for tag in TagSerializer(Tag.objects.order_by('id'), many=True).data
+    ]
+    ingredients_by_id, ingredients_by_name = [], []
+    for ingredient in IngredientSerializer(
+        Ingredient.objects.order_by('id'), many=True
+    ).data:
+        key = ID_KEY.pack(ingredient['id'])
+        value = json.dumps(ingredient).encode()
+        ingredients_by_id.append((key, value))
+        ingredients_by_name.append(
+            (ingredient['name'].upper().encode() + b'\0' + key, value)
+        )
+    ingredients_by_name.sort()
+    short_links = sorted(
+        (short_link.encode(), ID_KEY.pack(recipe_id))
+        for short_link, recipe_id in ShortLinkRecipe.objects.values_list(
+            'short_link', 'recipe_id'
+        ).iterator()
+    )
+    return {
+        'tags': tags,
+        'ingredients': ingredients_by_id,
+        'ingredient_names': ingredients_by_name,
+        'short_links': short_links,
+    }
+
+
+def write_snapshot(path):
+    """
+    Метод записывает снимок во временный файл и атомарно подменяет
+    им старый: процессы, которые уже отобразили старый файл в память,
+    дочитывают его, а новые открывают новый.
+    """
+    data = pack_snapshot(build_tables(), time.time())
+    temporary = f'{path}.{os.getpid()}'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+class SnapshotTable:
+    """Отсортированная таблица снимка с доступом по индексу."""
+
+    def __init__(self, buffer, offset, count, blob):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.blob = blob
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """Метод возвращает ключ записи; нужен для bisect."""
+        key_offset, key_length, _, _ = ENTRY.unpack_from(
+            self.buffer, self.offset + index * ENTRY.size
+        )
+        start = self.blob + key_offset
+        return self.buffer[start:start + key_length]
+
+    def value(self, index):
+        _, _, value_offset, value_length = ENTRY.unpack_from(
+            self.buffer, self.offset + index * ENTRY.size
+        )
+        start = self.blob + value_offset
+        return self.buffer[start:start + value_length]
+
+    def get(self, key):
+        index = bisect_left(self, key)
+        if index < self.count and self[index] == key:
+            return self.value(index)
+        return None
+
+    def scan(self, prefix=b''):
+        """Метод возвращает значения записей, ключ которых начинается
+        с prefix, в порядке ключей.
+        """
+        index = bisect_left(self, prefix)
+        while index < self.count and self[index].startswith(prefix):
+            yield self.value(index)
+            index += 1
+
+
+class Snapshot:
+    """
+    Снимок справочных данных, отображенный в память только для чтения.
+    Страницы файла лежат в страничном кеше ОС и общие для всех
+    процессов, поэтому N воркеров не держат N копий данных.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.inode = os.fstat(file.fileno()).st_ino
+            self.buffer = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'Файл {path} не является снимком.')
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (length,) = HEADER_LENGTH.unpack_from(self.buffer, len(MAGIC))
+        header = json.loads(self.buffer[start:start + length])
+        base = start + length
+        self.built_at = header['built_at']
+        self.tables = {
+            name: SnapshotTable(
+                self.buffer, base + offset, count, base + header['blob']
+            )
+            for name, (offset, count) in header['sections'].items()
+        }
+
+    def get_object(self, table, object_id):
+        value = self.tables[table].get(ID_KEY.pack(object_id))
+        return None if value is None else json.loads(value)
+
+    def get_tags(self):
+        return [json.loads(value) for value in self.tables['tags'].scan()]
+
+    def get_tag(self, tag_id):
+        return self.get_object('tags', tag_id)
+
+    def get_ingredient(self, ingredient_id):
+        return self.get_object('ingredients', ingredient_id)
+
+    def find_ingredients(self, prefix=''):
+        """
+        Метод ищет ингредиенты по началу названия без учета регистра;
+        результат отсортирован по id, как и ответ из БД.
+        """
+        return sorted(
+            (
+                json.loads(value)
+                for value in self.tables['ingredient_names'].scan(
+                    prefix.upper().encode()
+                )
+            ),
+            key=lambda ingredient: ingredient['id']
+        )
+
+    def get_recipe_id(self, short_link):
+        value = self.tables['short_links'].get(short_link.encode())
+        return None if value is None else ID_KEY.unpack(value)[0]
+
+
+class ReferenceSnapshot:
+    """
+    Общий для процессов снимок тегов, ингредиентов и коротких ссылок.
+    Снимок создается до fork в мастере gunicorn и перестраивается
+    фоновой задачей после изменений справочников, а также по истечении
+    REFERENCE_SNAPSHOT_TTL, чтобы подхватить массовые загрузки без
+    сигналов. Процессы раз в REFERENCE_SNAPSHOT_CHECK_INTERVAL
+    проверяют файл и отображают в память новую версию. Если снимок
+    недоступен, get возвращает None и данные читаются из БД.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = None
+
+    @property
+    def path(self):
+        """
+        Путь к файлу снимка с хешем имени основной БД: тесты и другие
+        развертывания на том же хосте не читают чужой снимок.
+        """
+        database = connections['default'].settings_dict['NAME']
+        digest = hashlib.sha1(str(database).encode()).hexdigest()[:12]
+        return f'{settings.REFERENCE_SNAPSHOT_PATH}.{digest}'
+
+    def rebuild(self, blocking=True):
+        """
+        Метод перестраивает файл снимка под файловой блокировкой,
+        чтобы воркеры не строили его одновременно. Без blocking
+        перестройка пропускается, если ее уже выполняет другой процесс.
+        """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f'{self.path}.lock', 'w') as lock:
+                flags = fcntl.LOCK_EX if blocking else (
+                    fcntl.LOCK_EX | fcntl.LOCK_NB
+                )
+                try:
+                    fcntl.flock(lock, flags)
+                except BlockingIOError:
+                    return False
+                write_snapshot(self.path)
+        except OSError:
+            return False
+        self._checked_at = None
+        return True
+
+    def refresh(self):
+        """Метод отображает в память актуальную версию файла."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if (
+            stat is None
+            or time.time() - stat.st_mtime > settings.REFERENCE_SNAPSHOT_TTL
+        ) and self.rebuild(blocking=False):
+            stat = os.stat(self.path)
+        if stat is None:
+            self._snapshot = None
+        elif self._snapshot is None or self._snapshot.inode != stat.st_ino:
+            try:
+                self._snapshot = Snapshot(self.path)
+            except (OSError, ValueError):
+                self._snapshot = None
+
+    def get(self):
+        now = time.monotonic()
+        if (
+            self._checked_at is None
+            or now - self._checked_at > REFERENCE_SNAPSHOT_CHECK_INTERVAL
+        ):
+            with self._lock:
+                self._checked_at = now
+                self.refresh()
+        return self._snapshot
+
+    def invalidate(self):
+        """
+        Метод ставит перестройку снимка в очередь фоновых задач.
+        Задача пишется в текущей транзакции и выполняется после
+        коммита; пока она ждет выполнения, новая не создается, поэтому
+        массовое удаление в админке перестраивает снимок один раз.
+        """
+        from jobs.models import Job
+        from jobs.queue import enqueue, get_job_name
+
+        name = get_job_name(rebuild_snapshot)
+        if not Job.objects.filter(name=name, status=Job.QUEUED).exists():
+            enqueue(name)
+
+
+reference_snapshot = ReferenceSnapshot()
+
+
+def rebuild_snapshot():
+    """Фоновая задача: перестраивает снимок справочников."""
+    reference_snapshot.rebuild()
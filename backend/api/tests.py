@@ -0,0 +1,969 @@
+import base64
+import io
+import itertools
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+import django_filters
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, QueryDict
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings
+)
+
+from .bitmaps import BitmapRecipeList, RecipeBitmapIndex
+from .bulk_export import write_export
+from .changes import decode_token, get_changes_page, get_head_token, log_change
+from .exports import (
+    get_artifact_path,
+    get_cart_rows,
+    get_cart_version,
+    purge_artifacts,
+    render_shopping_list
+)
+from .feed import (
+    backfill_feed,
+    fan_out_recipe,
+    finish_leaving,
+    get_feed_page,
+    sync_celebrities
+)
+from .filters import RecipeFilter
+from .payload_cache import get_generation, invalidate_payloads
+from .renditions import generate_renditions, get_renditions
+from .shopping_cart import get_recipe_amounts, update_recipe_in_carts
+from .snapshot import reference_snapshot
+from foodgram.db_router import ReplicaRoutingMiddleware, use_replicas
+from foodgram.storage import content_storage
+from jobs.models import Job
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from recipes.models import (
+    Change,
+    FeedCelebrity,
+    FeedEntry,
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingList,
+    ShoppingListIngredient,
+    ShortLinkRecipe,
+    Tag
+)
+from users.models import Subscription
+
+User = get_user_model()
+
+RECIPES_COUNT = 2000
+USERS_COUNT = 10
+TAGS_COUNT = 5
+LIST_SHARE = 0.3
+MEDIA_GARBAGE_MIN_AGE = 3600
+
+
+class LegacyRecipeFilter(django_filters.FilterSet):
+    """Фильтр рецептов до перехода на EXISTS: JOIN и exclude по спискам."""
+    author = django_filters.NumberFilter(
+        field_name='author',
+        lookup_expr='exact'
+    )
+    tags = django_filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug', to_field_name='slug',
+        queryset=Tag.objects.all()
+    )
+    is_favorited = django_filters.NumberFilter(method='filter_is_favorited')
+    is_in_shopping_cart = django_filters.NumberFilter(
+        method='filter_is_in_shopping_cart'
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+
+    def filter_is_favorited(self, queryset, name, value):
+        current_user = self.request.user
+        if current_user.is_authenticated and value is not None:
+            if value == 1:
+                return queryset.filter(
+                    favorites__current_user=current_user.id
+                )
+            return queryset.exclude(favorites__current_user=current_user.id)
+        return queryset
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        current_user = self.request.user
+        if current_user.is_authenticated and value is not None:
+            if value:
+                return queryset.filter(
+                    shoppinglists__current_user=current_user
+                )
+            return queryset.exclude(
+                shoppinglists__current_user=current_user.id
+            )
+        return queryset
+
+
+class RecipeFilterTest(TestCase):
+    """
+    Сравнивает фильтры рецептов на EXISTS со старыми фильтрами
+    на JOIN на заполненной базе: результаты должны совпадать
+    для всех сочетаний параметров, а планы — использовать
+    полусоединения вместо JOIN со списками.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generator = random.Random(0)
+        # Не все СУБД возвращают id из bulk_create, поэтому объекты
+        # перечитываются из базы.
+        User.objects.bulk_create(
+            User(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for number in range(USERS_COUNT)
+        )
+        cls.users = list(User.objects.order_by('id'))
+        Tag.objects.bulk_create(
+            Tag(name=f'tag{number}', slug=f'tag{number}')
+            for number in range(TAGS_COUNT)
+        )
+        cls.tags = list(Tag.objects.order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=generator.choice(cls.users),
+                name=f'Рецепт {number}',
+                image='recipes/images/recipe.png',
+                text='Описание',
+                cooking_time=generator.randint(1, 120)
+            )
+            for number in range(RECIPES_COUNT)
+        )
+        recipes = list(Recipe.objects.order_by('id'))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in generator.sample(
+                cls.tags, generator.randint(0, TAGS_COUNT)
+            )
+        )
+        for model in (Favorite, ShoppingList):
+            model.objects.bulk_create(
+                model(current_user=user, recipe=recipe)
+                for user in cls.users
+                for recipe in recipes
+                if generator.random() < LIST_SHARE
+            )
+
+    def get_request(self, user):
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        return request
+
+    def get_data(self, is_favorited, is_in_shopping_cart, tags, author):
+        data = QueryDict(mutable=True)
+        if is_favorited is not None:
+            data['is_favorited'] = is_favorited
+        if is_in_shopping_cart is not None:
+            data['is_in_shopping_cart'] = is_in_shopping_cart
+        data.setlist('tags', tags)
+        if author is not None:
+            data['author'] = author
+        return data
+
+    def test_results_match_legacy_filter(self):
+        user = self.users[0]
+        combinations = itertools.product(
+            (user, AnonymousUser()),
+            (None, 0, 1),
+            (None, 0, 1),
+            (
+                [],
+                [self.tags[0].slug],
+                [self.tags[1].slug, self.tags[2].slug]
+            ),
+            (None, self.users[1].id)
+        )
+        for current_user, *params in combinations:
+            with self.subTest(user=current_user, params=params):
+                data = self.get_data(*params)
+                request = self.get_request(current_user)
+                recipes = RecipeFilter(
+                    data, Recipe.objects.all(), request=request
+                ).qs
+                legacy = LegacyRecipeFilter(
+                    data, Recipe.objects.all(), request=request
+                ).qs
+                ids = list(recipes.values_list('id', flat=True))
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(
+                    set(ids), set(legacy.values_list('id', flat=True))
+                )
+
+    def assert_semi_join(self, sql, model, negated):
+        """Проверяет, что таблица подключена подзапросом EXISTS."""
+        table = model._meta.db_table
+        subquery = f'EXISTS(SELECT (1) AS "a" FROM "{table}"'
+        self.assertIn(subquery, sql)
+        self.assertEqual(f'NOT {subquery}' in sql, negated)
+        self.assertNotIn(f'JOIN "{table}"', sql)
+
+    def test_lists_filtered_by_semi_joins(self):
+        request = self.get_request(self.users[0])
+        for value in (1, 0):
+            with self.subTest(value=value):
+                recipes = RecipeFilter(
+                    self.get_data(value, value, [self.tags[0].slug], None),
+                    Recipe.objects.all(),
+                    request=request
+                ).qs
+                sql = str(recipes.query)
+                self.assert_semi_join(sql, Recipe.tags.through, False)
+                for model in (Favorite, ShoppingList):
+                    self.assert_semi_join(sql, model, not value)
+                if connection.vendor == 'postgresql':
+                    self.assertIn(
+                        'Semi Join' if value else 'Anti Join',
+                        recipes.explain()
+                    )
+
+
+class RecipeBitmapIndexTest(TestCase):
+    """
+    Проверяет, что битовый индекс дает те же рецепты и в том же
+    порядке, что и фильтр в БД, и видит только закоммиченные
+    изменения из журнала.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.tag = Tag.objects.create(name='tag', slug='tag')
+        for number in range(10):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {number}',
+                image='recipes/images/recipe.png',
+                text='Описание',
+                cooking_time=1
+            )
+            if number % 2:
+                recipe.tags.add(cls.tag)
+                recipe.save()
+
+    def setUp(self):
+        self.index = RecipeBitmapIndex()
+
+    def get_ids(self, **filters):
+        bitmap, order = self.index.evaluate(**filters)
+        return [
+            recipe.id
+            for recipe in BitmapRecipeList(
+                bitmap, order, Recipe.objects.all()
+            )[:]
+        ]
+
+    def get_expected_ids(self):
+        return list(
+            Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )
+        )
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author,
+            name='Новый рецепт',
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=1
+        )
+
+    def test_matches_database_order(self):
+        self.assertEqual(self.get_ids(), self.get_expected_ids())
+        self.assertEqual(
+            self.get_ids(tag_ids=[self.tag.id]),
+            list(
+                Recipe.objects.filter(tags=self.tag).order_by(
+                    '-pub_date', '-id'
+                ).values_list('id', flat=True)
+            )
+        )
+
+    def test_rolled_back_recipe_is_not_indexed(self):
+        self.index.sync()
+        try:
+            with transaction.atomic():
+                self.create_recipe()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.get_ids(), self.get_expected_ids())
+
+    def test_changes_from_log_are_applied(self):
+        self.index.sync()
+        recipe = self.create_recipe()
+        self.assertEqual(self.get_ids()[0], recipe.id)
+        oldest = Recipe.objects.order_by('pub_date', 'id').first()
+        oldest.delete()
+        bitmap, _ = self.index.evaluate()
+        self.assertEqual(
+            BitmapRecipeList(bitmap, [], Recipe.objects.all()).count(),
+            Recipe.objects.count()
+        )
+        self.assertEqual(self.get_ids(), self.get_expected_ids())
+
+    def test_pub_date_change_reorders_recipes(self):
+        self.index.sync()
+        newest = Recipe.objects.order_by('-pub_date', '-id').first()
+        oldest = Recipe.objects.order_by('pub_date', 'id').first()
+        oldest.pub_date = newest.pub_date + timedelta(days=1)
+        oldest.save()
+        newest.pub_date = oldest.pub_date - timedelta(days=30)
+        newest.save()
+        self.assertEqual(self.get_ids(), self.get_expected_ids())
+
+    def test_unlogged_deletion_keeps_page_full(self):
+        self.index.sync()
+        bitmap, order = self.index.evaluate()
+        # Рецепт удален после чтения журнала.
+        Recipe.objects.filter(id=order[-1]).delete()
+        recipes = BitmapRecipeList(bitmap, order, Recipe.objects.all())
+        self.assertEqual(
+            [recipe.id for recipe in recipes[0:3]],
+            self.get_expected_ids()[:3]
+        )
+        self.assertEqual(recipes.count(), Recipe.objects.count())
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedCelebrityTest(TestCase):
+    """
+    Проверяет, что рецепты, опубликованные автором из таблицы
+    популярных, не пропадают из лент после его ухода из таблицы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.other = (
+            User.objects.create(username=name, email=f'{name}@example.com')
+            for name in ('author', 'reader', 'other')
+        )
+
+    def get_feed_ids(self):
+        recipes, _ = get_feed_page(self.reader, Recipe.objects.all())
+        return [recipe.id for recipe in recipes]
+
+    def test_recipe_stays_in_feed_after_author_leaves(self):
+        for follower in (self.reader, self.other):
+            Subscription.objects.create(
+                current_user=follower, user=self.author
+            )
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=1
+        )
+        sync_celebrities()
+        fan_out_recipe(recipe.id)
+        self.assertTrue(
+            FeedCelebrity.objects.filter(author=self.author).exists()
+        )
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+
+        Subscription.objects.filter(current_user=self.other).delete()
+        sync_celebrities()
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+        self.assertTrue(
+            FeedCelebrity.objects.get(author=self.author).leaving
+        )
+        self.assertTrue(
+            Job.objects.filter(name__endswith='finish_leaving').exists()
+        )
+
+        finish_leaving(self.author.id)
+        self.assertFalse(
+            FeedCelebrity.objects.filter(author=self.author).exists()
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                current_user=self.reader, recipe=recipe
+            ).exists()
+        )
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+
+
+class FeedBackfillTest(TestCase):
+    """
+    Проверяет, что лента заполняется после подписки фоновой задачей,
+    которая ничего не добавляет, если пользователь уже отписался.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create(username=name, email=f'{name}@example.com')
+            for name in ('author', 'reader')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=1
+        )
+
+    def get_entries(self):
+        return FeedEntry.objects.filter(current_user=self.reader)
+
+    def test_subscription_enqueues_backfill(self):
+        Subscription.objects.create(current_user=self.reader, user=self.author)
+        self.assertFalse(self.get_entries().exists())
+        job = Job.objects.get(name__endswith='backfill_feed')
+        self.assertEqual(job.args, [self.reader.id, self.author.id])
+        backfill_feed(*job.args)
+        self.assertEqual(
+            list(self.get_entries().values_list('recipe', flat=True)),
+            [self.recipe.id]
+        )
+
+    def test_backfill_skipped_after_unsubscribe(self):
+        Subscription.objects.create(current_user=self.reader, user=self.author)
+        Subscription.objects.filter(current_user=self.reader).delete()
+        backfill_feed(self.reader.id, self.author.id)
+        self.assertFalse(self.get_entries().exists())
+
+
+class RenditionsTest(TestCase):
+    """
+    Проверяет, что ссылки на копии отдаются только после их создания,
+    без обращения к хранилищу, а задача ставится только при замене фото.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+
+    def save_image(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+        return content_storage.save(
+            'recipes/images/recipe.png', ContentFile(buffer.getvalue())
+        )
+
+    def get_jobs(self):
+        return Job.objects.filter(name__endswith='generate_renditions')
+
+    def test_renditions_hidden_until_generated(self):
+        name = self.save_image('red')
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image=name,
+            text='Описание',
+            cooking_time=1
+        )
+        self.assertEqual(self.get_jobs().count(), 1)
+        self.assertIsNone(
+            get_renditions(recipe.image.name, recipe.image_renditions_for)
+        )
+        generate_renditions(name)
+        recipe.refresh_from_db()
+        renditions = get_renditions(
+            recipe.image.name, recipe.image_renditions_for
+        )
+        self.assertIn('thumbnail', renditions)
+        self.assertIn('srcset_webp', renditions)
+        with mock.patch.object(default_storage, 'exists') as exists:
+            response = self.client.get('/api/recipes/')
+        exists.assert_not_called()
+        self.assertEqual(
+            response.json()['results'][0]['image_renditions'], renditions
+        )
+
+    def test_enqueued_only_when_image_changes(self):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image=self.save_image('red'),
+            text='Описание',
+            cooking_time=1
+        )
+        recipe = Recipe.objects.get(id=recipe.id)
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.assertEqual(self.get_jobs().count(), 1)
+        recipe.image = self.save_image('blue')
+        recipe.save()
+        self.assertEqual(self.get_jobs().count(), 2)
+        recipe.save()
+        self.assertEqual(self.get_jobs().count(), 2)
+
+
+class MediaGarbageTest(TestCase):
+    """
+    Проверяет, что повторная загрузка существующего файла защищает
+    его от сборщика, пока на него еще нет ссылки в БД.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_deduplicated_upload_survives_collection(self):
+        content = ContentFile(b'image')
+        name = content_storage.save('recipes/images/recipe.png', content)
+        old = time.time() - 2 * MEDIA_GARBAGE_MIN_AGE
+        os.utime(content_storage.path(name), (old, old))
+        self.assertEqual(
+            content_storage.save('recipes/images/copy.png', content), name
+        )
+        call_command(
+            'collect_media_garbage',
+            min_age=MEDIA_GARBAGE_MIN_AGE, stdout=io.StringIO()
+        )
+        self.assertTrue(content_storage.exists(name))
+        os.utime(content_storage.path(name), (old, old))
+        call_command(
+            'collect_media_garbage',
+            min_age=MEDIA_GARBAGE_MIN_AGE, stdout=io.StringIO()
+        )
+        self.assertFalse(content_storage.exists(name))
+
+
+class ReferenceSnapshotTest(TestCase):
+    """
+    Проверяет, что изменения справочников перестраивают снимок одной
+    фоновой задачей, а поиск ингредиентов в снимке и в БД дает
+    одинаковый порядок.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            REFERENCE_SNAPSHOT_PATH=f'{directory.name}/reference.snapshot'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get_rebuild_jobs(self):
+        return Job.objects.filter(name__endswith='rebuild_snapshot')
+
+    def test_changes_enqueue_one_rebuild(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Соль {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        Ingredient.objects.all().delete()
+        self.assertEqual(self.get_rebuild_jobs().count(), 1)
+
+    def test_recipe_deletion_does_not_rebuild(self):
+        author = User.objects.create(username='author', email='a@a.ru')
+        recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=1
+        )
+        ShortLinkRecipe.objects.get_or_create(recipe=recipe)
+        recipe.delete()
+        self.assertFalse(self.get_rebuild_jobs().exists())
+
+    def test_ingredient_order_matches_database(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Сахар', 'Соль', 'Свекла', 'Сыр')
+        )
+        self.assertTrue(reference_snapshot.rebuild())
+        snapshot = reference_snapshot.get()
+        database = self.client.get(
+            '/api/ingredients/', {'name': 'С', 'search': ''}
+        ).json()
+        self.assertEqual(len(database), 4)
+        self.assertEqual(snapshot.find_ingredients('С'), database)
+        self.assertEqual(
+            self.client.get('/api/ingredients/', {'name': 'С'}).json(),
+            database
+        )
+
+
+class ShoppingListExportTest(TestCase):
+    """
+    Проверяет, что PDF формируется одной фоновой задачей, опрос
+    не расходует бюджет загрузок, а старые версии удаляет только
+    периодическая задача.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['throttle'].clear()
+        self.user = User.objects.create(username='user', email='u@u.ru')
+        self.auth = {
+            'HTTP_AUTHORIZATION':
+                f'Token {Token.objects.create(user=self.user).key}'
+        }
+        self.item = ShoppingListIngredient.objects.create(
+            current_user=self.user,
+            ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit='г'
+            ),
+            amount=5
+        )
+
+    def download(self, file_format):
+        return self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'type': file_format}, **self.auth
+        )
+
+    def test_pdf_polls_share_one_job(self):
+        for _ in range(15):
+            self.assertEqual(self.download('pdf').status_code, 202)
+        jobs = Job.objects.filter(name__endswith='render_shopping_list')
+        self.assertEqual(jobs.count(), 1)
+        render_shopping_list(*jobs.get().args)
+        self.assertEqual(self.download('pdf').status_code, 200)
+
+    def test_old_versions_removed_by_periodic_job(self):
+        self.assertEqual(self.download('txt').status_code, 200)
+        old = get_artifact_path(
+            self.user.id, get_cart_version(get_cart_rows(self.user.id)),
+            'txt'
+        )
+        self.item.amount = 7
+        self.item.save()
+        self.assertEqual(self.download('txt').status_code, 200)
+        self.assertTrue(default_storage.exists(old))
+        self.assertEqual(purge_artifacts(), 0)
+        expired = time.time() - settings.SHOPPING_LIST_EXPORT_TTL - 1
+        os.utime(default_storage.path(old), (expired, expired))
+        self.assertEqual(purge_artifacts(), 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(
+            len(default_storage.listdir(f'shopping_lists/{self.user.id}')[1]),
+            1
+        )
+
+
+class RecipeExportTest(TestCase):
+    """
+    Проверяет, что выгрузка рецептов пишется фоновой задачей один раз
+    и пересоздается после изменения каталога.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['throttle'].clear()
+        self.admin = User.objects.create(
+            username='admin', email='admin@a.ru', is_staff=True
+        )
+        self.auth = {
+            'HTTP_AUTHORIZATION':
+                f'Token {Token.objects.create(user=self.admin).key}'
+        }
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            author=self.admin,
+            name=name,
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=1
+        )
+
+    def export(self):
+        return self.client.get('/api/recipes/export/', **self.auth)
+
+    def test_export_written_by_job(self):
+        self.create_recipe('Первый')
+        for _ in range(15):
+            self.assertEqual(self.export().status_code, 202)
+        self.assertEqual(
+            Job.objects.filter(name__endswith='write_export').count(), 1
+        )
+        write_export()
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        path = response.json()['url'].split(settings.MEDIA_URL, 1)[1]
+        with default_storage.open(path) as file:
+            self.assertEqual(len(file.read().splitlines()), 1)
+
+        self.create_recipe('Второй')
+        Job.objects.update(status=Job.DONE)
+        self.assertEqual(self.export().status_code, 202)
+        write_export()
+        self.assertNotEqual(
+            self.export().json()['url'], response.json()['url']
+        )
+
+
+class ShoppingCartTotalsTest(TestCase):
+    """
+    Проверяет, что итоги списка покупок остаются точными после
+    добавления, удаления и изменения рецептов и пересчета командой.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='кг'
+        )
+        cls.recipes = []
+        for amount in (0.1, 0.2):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {amount}',
+                image='recipes/images/recipe.png',
+                text='Описание',
+                cooking_time=1
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=amount
+            )
+            cls.recipes.append(recipe)
+
+    def get_total(self):
+        item = ShoppingListIngredient.objects.filter(
+            current_user=self.user
+        ).first()
+        return None if item is None else item.amount
+
+    def test_totals_stay_exact(self):
+        first, second = self.recipes
+        for recipe in (first, second):
+            ShoppingList.objects.create(current_user=self.user, recipe=recipe)
+        self.assertEqual(self.get_total(), Decimal('0.3'))
+        ShoppingList.objects.filter(recipe=first).delete()
+        self.assertEqual(self.get_total(), Decimal('0.2'))
+        ShoppingList.objects.create(current_user=self.user, recipe=first)
+
+        old_amounts = get_recipe_amounts(second.id)
+        IngredientRecipe.objects.filter(recipe=second).update(amount=0.7)
+        update_recipe_in_carts(
+            second, old_amounts, get_recipe_amounts(second.id)
+        )
+        self.assertEqual(self.get_total(), Decimal('0.8'))
+        self.assertEqual(float(self.get_total()), 0.8)
+
+        ShoppingListIngredient.objects.update(amount=Decimal('5'))
+        call_command('rebuild_shopping_carts', stdout=io.StringIO())
+        self.assertEqual(self.get_total(), Decimal('0.8'))
+
+        ShoppingList.objects.all().delete()
+        self.assertIsNone(self.get_total())
+
+
+class ChangeLogTest(TestCase):
+    """
+    Проверяет, что журнал изменений читается по позиции
+    (transaction_id, id), а не по id, который транзакции получают
+    не в порядке коммитов.
+    """
+
+    def read_all(self, token, limit):
+        objects = []
+        while True:
+            position, _ = decode_token(token)
+            changes, token, has_more = get_changes_page(position, limit)
+            objects.extend(change.object_id for change in changes)
+            if not has_more:
+                return objects, token
+
+    def test_changes_read_in_position_order(self):
+        token = get_head_token()
+        Change.objects.bulk_create(
+            Change(
+                object_type=Change.RECIPE, object_id=object_id,
+                action=Change.UPDATED, transaction_id=transaction_id
+            )
+            for object_id, transaction_id in ((1, 12), (2, 10), (3, 11))
+        )
+        objects, token = self.read_all(token, 2)
+        self.assertEqual(objects, [2, 3, 1])
+        self.assertEqual(self.read_all(token, 2)[0], [])
+
+    def test_token_without_transaction_id(self):
+        token = base64.urlsafe_b64encode(b'7|100').decode()
+        self.assertEqual(decode_token(token), ((0, 7), 100))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Только для PostgreSQL.')
+class ChangeLogTransactionTest(TransactionTestCase):
+    """
+    Проверяет, что записи транзакции, которая коммитится позже
+    транзакции с большим id, не теряются для читателя журнала.
+    """
+
+    def test_open_transaction_holds_back_later_changes(self):
+        token = get_head_token()
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO recipes_change (object_type, object_id, '
+                'action, created_at, transaction_id) VALUES '
+                "('recipe', 1, 'updated', now(), txid_current())"
+            )
+        log_change(Change.RECIPE, 2, Change.UPDATED)
+        position, _ = decode_token(token)
+        changes, token, _ = get_changes_page(position, 10)
+        self.assertEqual(changes, [])
+        other.commit()
+        position, _ = decode_token(token)
+        changes, _, _ = get_changes_page(position, 10)
+        self.assertEqual([change.object_id for change in changes], [1, 2])
+
+
+class PayloadGenerationTest(TestCase):
+    """
+    Проверяет, что поколение кеша публичных ответов общее для
+    процессов и меняется только после коммита.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            PUBLIC_CACHE_GENERATION_PATH=f'{directory.name}/generation'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_generation_changes_on_commit(self):
+        generation = get_generation()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            invalidate_payloads()
+            self.assertEqual(get_generation(), generation)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(get_generation(), generation)
+
+
+class ReplicaStickinessTest(TestCase):
+    """
+    Проверяет, что клиент с токеном после изменения читает из основной
+    БД и в другом воркере: воркеры gunicorn — процессы, созданные
+    через fork до запроса, и не видят памяти друг друга.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CACHES={
+            **settings.CACHES,
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'replica_sticky': {
+                'BACKEND': (
+                    'django.core.cache.backends.filebased.FileBasedCache'
+                ),
+                'LOCATION': directory.name,
+            },
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        replicas = mock.patch(
+            'foodgram.db_router.get_replicas', return_value=['replica_1']
+        )
+        replicas.start()
+        self.addCleanup(replicas.stop)
+
+    def handle(self, request):
+        """Метод обрабатывает запрос и возвращает, разрешены ли реплики."""
+        allowed = []
+
+        def get_response(request):
+            allowed.append(use_replicas.get())
+            return HttpResponse(status=201)
+
+        ReplicaRoutingMiddleware(get_response)(request)
+        return allowed[0]
+
+    def read_in_worker(self, request, written):
+        """Метод выполняет запрос в процессе, созданном до изменения."""
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+
+        def worker():
+            written.wait()
+            sender.send(self.handle(request))
+
+        process = context.Process(target=worker)
+        process.start()
+        return process, receiver
+
+    def test_token_client_is_sticky_in_other_worker(self):
+        factory = RequestFactory()
+        auth = {'HTTP_AUTHORIZATION': 'Token key'}
+        written = multiprocessing.get_context('fork').Event()
+        process, receiver = self.read_in_worker(
+            factory.get('/api/recipes/', **auth), written
+        )
+        self.assertFalse(self.handle(factory.post('/api/recipes/', **auth)))
+        written.set()
+        process.join(10)
+        self.assertTrue(receiver.poll(10))
+        self.assertFalse(receiver.recv())
+        self.assertTrue(
+            self.handle(factory.get('/api/recipes/', HTTP_AUTHORIZATION='x'))
+        )
+
+    def test_anonymous_write_does_not_pin_other_clients(self):
+        factory = RequestFactory()
+        self.handle(factory.post('/api/users/'))
+        self.assertTrue(self.handle(factory.get('/api/recipes/')))
+
+
+class SimilarRecipesTest(TestCase):
+    """Проверяет ответ на запрос похожих рецептов."""
+
+    def test_unknown_recipe_returns_404(self):
+        for pk in ('abc', '999999'):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/api/recipes/{pk}/similar/')
+                self.assertEqual(response.status_code, 404)
@@ -0,0 +1,83 @@
+from django.core.cache import caches
+from rest_framework.throttling import ScopedRateThrottle
+
+
+class SlidingWindowRateThrottle(ScopedRateThrottle):
+    """
+    Ограничение частоты запросов со скользящим окном.
+    Бюджет задается для группы эндпоинтов: атрибутом throttle_scope
+    или словарем throttle_scopes по именам действий ViewSet.
+    Запросы считаются по пользователю, а для анонимов по IP.
+
+    Вместо списка меток времени DRF хранятся два счетчика:
+    текущего и предыдущего окна. Предыдущий учитывается с весом
+    по доле окна, которая еще не прошла. Счетчики лежат в кеше
+    throttle в памяти процесса, поэтому проверка не обращается к БД.
+    """
+    cache = caches['throttle']
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def get_scope(self, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        return scopes.get(
+            getattr(view, 'action', None),
+            getattr(view, self.scope_attr, None)
+        )
+
+    def increment(self, key):
+        if self.cache.add(key, 1, 2 * self.duration):
+            return
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, 2 * self.duration)
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(view)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+
+        window, self.elapsed = divmod(self.timer(), self.duration)
+        current_key = f'{self.key}:{int(window)}'
+        self.previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0)
+        self.current = self.cache.get(current_key, 0)
+        weight = 1 - self.elapsed / self.duration
+        if self.previous * weight + self.current >= self.num_requests:
+            return False
+        self.increment(current_key)
+        return True
+
+    def refund(self, request, view):
+        """
+        Метод возвращает в бюджет уже учтенный запрос, например
+        повторный опрос файла, который еще формируется.
+        """
+        scope = self.get_scope(view)
+        if not scope:
+            return
+        self.scope = scope
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        window = int(self.timer() // self.duration)
+        key = f'{self.get_cache_key(request, view)}:{window}'
+        if self.cache.get(key, 0) > 0:
+            self.cache.decr(key)
+
+    def wait(self):
+        """Метод возвращает, через сколько секунд запрос будет разрешен."""
+        left = self.duration - self.elapsed
+        if self.current >= self.num_requests:
+            return left + self.duration * (
+                1 - self.num_requests / self.current
+            )
+        if not self.previous:
+            return left
+        return min(
+            left,
+            self.duration * (
+                1 - (self.num_requests - self.current) / self.previous
+            ) - self.elapsed
+        )
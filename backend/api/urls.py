@@ -2,7 +2,9 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    ChangeViewSet,
     IngredientViewSet,
+    ProfileViewSet,
     RecipeViewSet,
     TagViewSet,
     FoodgramUserViewSet
@@ -17,6 +19,8 @@ router_v1 = DefaultRouter()
 router_v1.register('tags', TagViewSet)
 router_v1.register('recipes', RecipeViewSet)
 router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
+router_v1.register('changes', ChangeViewSet, basename='changes')
+router_v1.register('profiles', ProfileViewSet, basename='profiles')
 
 urlpatterns = [
     path('', include(router_v1.urls)),
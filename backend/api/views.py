@@ -1,51 +1,109 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404, redirect
 from djoser.permissions import CurrentUserOrAdmin
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet
-from rest_framework import filters, permissions, status, viewsets
+from rest_framework import filters, generics, permissions, status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
-
-from .filters import RecipeFilter
-from .pagination import LimitPagePagination
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.utils.urls import replace_query_param
+
+from .bitmaps import BitmapRecipeList, recipe_index
+from .bulk_export import request_export
+from .changes import (
+    decode_token,
+    get_changes_page,
+    get_head_token,
+    is_token_expired
+)
+from .exports import EXPORT_FORMATS, get_artifact, get_cart_rows
+from .feed import decode_cursor, get_feed_page
+from .filters import RecipeFilter, UserFilter
+from .follows import follow, unfollow
+from .pagination import KeysetLimitPagination, LimitPagePagination
+from .parsers import RawImageParser
+from .profiling import PROFILE_FORMATS, list_profiles, profile_storage
+from .querysets import (
+    get_recipe_queryset,
+    get_requested_fields,
+    get_user_queryset
+)
 from .permissions import UnauthorizedOrAdmin, RecipePermisssion
 from .serializers import (
     AvatarUpdateSerializer,
+    ChangeSerializer,
     IngredientSerializer,
     RecipeSerializer,
     RecipeCreateSerializer,
+    RecipeImageSerializer,
     RecipeResponseSerializer,
+    ShoppingCartItemSerializer,
     ShortLinkRecipeSeriealizer,
     SubcriptionSerializer,
     TagSerializer,
     UserSerializer,
     UserCreateSerializer
 )
+from .snapshot import reference_snapshot
 
+from foodgram.constants import (
+    MAX_BULK_RECIPES,
+    MAX_CHANGES_LIMIT,
+    MAX_FEED_LIMIT,
+    PAGINATION_PAGE_SIZE
+)
 from recipes.models import (
     Favorite,
     Ingredient,
-    IngredientRecipe,
     ShortLinkRecipe,
     Recipe,
     Tag,
-    ShoppingList
+    ShoppingList,
+    ShoppingListIngredient
 )
 from users.models import Subscription
 
 User = get_user_model()
 
 
+def get_upload_data(request, field):
+    """Метод приводит данные загрузки к виду {field: файл}.
+    RawImageParser кладет файл под ключ 'file'.
+    """
+    if field not in request.data and 'file' in request.data:
+        return {field: request.data['file']}
+    return request.data
+
+
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
-    """ViewSet для работы с моделью Tag."""
+    """ViewSet для работы с моделью Tag.
+    Теги отдаются из общего снимка справочников, а при его
+    отсутствии или промахе читаются из БД.
+    """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
 
+    def list(self, request, *args, **kwargs):
+        snapshot = reference_snapshot.get()
+        if snapshot is None:
+            return super().list(request, *args, **kwargs)
+        return Response(snapshot.get_tags())
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = reference_snapshot.get()
+        tag = snapshot and self.kwargs['pk'].isdigit() and snapshot.get_tag(
+            int(self.kwargs['pk'])
+        )
+        if not tag:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(tag)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с моделью Ingredient."""
@@ -53,12 +111,107 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
     permission_classes = (permissions.AllowAny,)
+    throttle_scope = 'search'
 
     def get_queryset(self):
         keyword = self.request.query_params.get('name', '')
-        queryset = Ingredient.objects.filter(name__icontains=keyword)
+        queryset = Ingredient.objects.filter(
+            name__istartswith=keyword
+        ).order_by('id')
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """Метод ищет ингредиенты по началу названия в общем снимке
+        справочников; поиск через search идет в БД.
+        """
+        snapshot = reference_snapshot.get()
+        if snapshot is None or 'search' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return Response(snapshot.find_ingredients(
+            request.query_params.get('name', '')
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = reference_snapshot.get()
+        ingredient = (
+            snapshot and self.kwargs['pk'].isdigit()
+            and snapshot.get_ingredient(int(self.kwargs['pk']))
+        )
+        if not ingredient:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(ingredient)
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """ViewSet для скачивания профилей запросов администраторами."""
+    permission_classes = (permissions.IsAdminUser,)
+    lookup_value_regex = r'[0-9]+-[0-9a-f]+'
+
+    def list(self, request):
+        """Метод возвращает id сохраненных профилей, новые первыми."""
+        return Response(list_profiles())
+
+    def retrieve(self, request, pk=None):
+        """Метод отдает профиль: file=prof для snakeviz и pstats,
+        по умолчанию текстовый отчет по времени и памяти.
+        """
+        file_format = request.query_params.get('file', 'txt')
+        name = f'{pk}.{file_format}'
+        if (
+            file_format not in PROFILE_FORMATS
+            or not profile_storage.exists(name)
+        ):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            profile_storage.open(name, 'rb'),
+            as_attachment=file_format == 'prof',
+            filename=name,
+            content_type=PROFILE_FORMATS[file_format]
+        )
+
+
+class ChangeViewSet(viewsets.ViewSet):
+    """ViewSet для журнала изменений рецептов, тегов и ингредиентов."""
+    permission_classes = (permissions.AllowAny,)
+
+    def list(self, request):
+        """Метод возвращает изменения после токена since.
+        Без since возвращается только токен конца журнала: клиент
+        берет его до загрузки полных списков и дальше запрашивает
+        изменения с ним. Если нужные записи уже удалены очисткой
+        журнала, возвращается 410 и списки нужно загрузить заново.
+        """
+        since = request.query_params.get('since')
+        if not since:
+            return Response(
+                {'next': get_head_token(), 'has_more': False, 'results': []}
+            )
+        since = decode_token(since)
+        if since is None:
+            return Response(
+                {'since': 'Некорректный токен.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        since, checked_at = since
+        if is_token_expired(checked_at):
+            return Response(
+                {'since': 'Токен устарел, загрузите списки заново.'},
+                status=status.HTTP_410_GONE
+            )
+        try:
+            limit = int(request.query_params.get('limit', MAX_CHANGES_LIMIT))
+        except ValueError:
+            limit = MAX_CHANGES_LIMIT
+        limit = min(max(limit, 1), MAX_CHANGES_LIMIT)
+
+        changes, token, has_more = get_changes_page(since, limit)
+        serializer = ChangeSerializer(changes, many=True)
+        return Response({
+            'next': token,
+            'has_more': has_more,
+            'results': serializer.data
+        })
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """ViewSet для работы с моделью Recipe."""
@@ -69,15 +222,89 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (RecipePermisssion,)
+    read_actions = ('list', 'retrieve', 'get_bulk', 'get_feed')
+    throttle_scopes = {
+        'create': 'uploads',
+        'partial_update': 'uploads',
+        'update_image': 'uploads',
+        'get_shopping_cart': 'downloads',
+        'get_recipe_short_link': 'short_links',
+        'export_recipes': 'downloads',
+    }
 
     def get_serializer_class(self):
         """Метод определяет, какой сериализатор использовать.
         RecipeSerializer для операций 'list' и 'retrieve'.
         RecipeCreateSerializer для других действий (например, 'create')."""
-        if self.action in ('list', 'retrieve'):
+        if self.action in self.read_actions:
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_queryset(self):
+        """Метод возвращает рецепты для текущего действия.
+        Для чтения рецепты загружаются вместе со связанными объектами
+        и флагами пользователя за фиксированное число запросов.
+        Параметр fields ограничивает загружаемые столбцы и связи.
+        """
+        if self.action in self.read_actions:
+            return get_recipe_queryset(
+                self.request.user,
+                self.queryset,
+                get_requested_fields(self.request)
+            )
+        return super().get_queryset()
+
+    def get_serializer(self, *args, **kwargs):
+        """Метод передает сериализатору поля из параметра fields."""
+        if self.action in self.read_actions:
+            kwargs.setdefault('fields', get_requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """Метод возвращает список рецептов.
+        При включенном RECIPE_BITMAP_FILTER фильтры вычисляются
+        по битовому индексу, а из БД загружается только текущая страница.
+        Сортировка по рейтингу всегда выполняется в БД.
+        """
+        if (
+            not settings.RECIPE_BITMAP_FILTER
+            or request.query_params.get('ordering')
+        ):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_queryset()
+        filterset = RecipeFilter(
+            request.query_params, queryset=queryset, request=request
+        )
+        if not filterset.is_valid():
+            return super().list(request, *args, **kwargs)
+
+        bitmap, order = filterset.filter_bitmap(recipe_index)
+        recipes = BitmapRecipeList(bitmap, order, queryset)
+        page = self.paginate_queryset(recipes)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['patch'],
+        detail=True,
+        url_path='image',
+        parser_classes=(JSONParser, MultiPartParser, RawImageParser)
+    )
+    def update_image(self, request, pk=None):
+        """Метод заменяет фото рецепта.
+        Фото передается в base64 в JSON, файлом в multipart/form-data
+        или телом запроса с Content-Type image/*.
+        """
+        recipe = self.get_object()
+        serializer = RecipeImageSerializer(
+            recipe, data=get_upload_data(request, 'image')
+        )
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(
         methods=['get'],
         detail=True,
@@ -100,44 +327,181 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         methods=['get'],
-        url_path='download_shopping_cart',
+        detail=True,
+        url_path='similar',
+        permission_classes=(permissions.AllowAny,)
+    )
+    def get_similar(self, request, pk=None):
+        """Метод возвращает похожие рецепты по общим ингредиентам.
+        Список предрасчитан фоновой задачей и читается одним запросом
+        по индексу (recipe, -score) таблицы похожих рецептов.
+        get_object_or_404 из DRF отвечает 404 и на нечисловой id.
+        """
+        recipe = generics.get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        recipes = list(
+            Recipe.objects.filter(similar_to__recipe=recipe.id).order_by(
+                '-similar_to__score'
+            ).only(
+                'id', 'name', 'image', 'image_renditions_for', 'cooking_time'
+            )
+        )
+        serializer = RecipeResponseSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['get'],
+        url_path='bulk',
+        detail=False,
+        permission_classes=(permissions.AllowAny,)
+    )
+    def get_bulk(self, request):
+        """Метод возвращает рецепты по списку id.
+        Id передаются параметром ids через запятую, не более
+        MAX_BULK_RECIPES. Рецепты возвращаются в порядке запроса,
+        несуществующие id пропускаются.
+        """
+        try:
+            ids = [
+                int(recipe_id)
+                for recipe_id in request.query_params.get('ids', '').split(',')
+                if recipe_id.strip()
+            ]
+        except ValueError:
+            return Response(
+                {'ids': 'Укажите id рецептов числами через запятую.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = list(dict.fromkeys(ids))
+        if not ids or len(ids) > MAX_BULK_RECIPES:
+            return Response(
+                {'ids': f'Укажите от 1 до {MAX_BULK_RECIPES} id рецептов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipes = self.get_queryset().order_by().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[i] for i in ids if i in recipes], many=True
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['get'],
+        url_path='feed',
         detail=False,
         permission_classes=(permissions.IsAuthenticated,)
     )
-    def get_shopping_cart(self, request):
-        """Метод для загрузки списка покупок в формате TXT.
-        Метод получает список покупок для текущего пользователя
-        и создает текстовый файл.
+    def get_feed(self, request):
+        """Метод возвращает ленту рецептов авторов,
+        на которых подписан текущий пользователь.
+        Пагинация выполняется курсором по дате публикации.
         """
-        recipes_for_shopping = ShoppingList.objects.filter(
-            current_user=request.user
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            cursor = decode_cursor(cursor)
+            if cursor is None:
+                return Response(
+                    {'cursor': 'Некорректный курсор.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        try:
+            limit = int(
+                request.query_params.get('limit', PAGINATION_PAGE_SIZE)
+            )
+        except ValueError:
+            limit = PAGINATION_PAGE_SIZE
+        limit = min(max(limit, 1), MAX_FEED_LIMIT)
+
+        recipes, next_cursor = get_feed_page(
+            request.user, self.get_queryset(), cursor, limit
         )
-        items = {}
-        for recipe in recipes_for_shopping:
-            ingredients = IngredientRecipe.objects.filter(recipe=recipe.recipe)
-            for ingredient in ingredients:
-                ing_obj = Ingredient.objects.filter(
-                    id=ingredient.ingredient.id
-                ).first()
-                amount = ingredient.amount
-                if ing_obj.name not in items:
-                    items[ing_obj.name] = {
-                        'amount': amount,
-                        'measurement_unit': ing_obj.measurement_unit
-                    }
-                else:
-                    items[ing_obj.name]['amount'] += amount
-
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor', next_cursor
+            )
+        serializer = self.get_serializer(recipes, many=True)
+        return Response({'next': next_url, 'results': serializer.data})
+
+    def refund_throttles(self, request):
+        """Метод не учитывает запрос, который ждет готовый файл."""
+        for throttle in self.get_throttles():
+            if hasattr(throttle, 'refund'):
+                throttle.refund(request, self)
+
+    @action(
+        methods=['get'],
+        url_path='export',
+        detail=False,
+        permission_classes=(permissions.IsAdminUser,)
+    )
+    def export_recipes(self, request):
+        """Метод возвращает ссылку на выгрузку всех рецептов в NDJSON.
+        Выгрузку пишет фоновая задача, а файл отдает nginx, поэтому
+        размер каталога не упирается в таймаут воркера. Пока файл
+        формируется, возвращается ответ 202, который не учитывается
+        в ограничении частоты загрузок. Доступен только администраторам.
+        """
+        path = request_export()
+        if path is None:
+            self.refund_throttles(request)
+            return Response(
+                {'detail': 'Выгрузка формируется, повторите запрос позже.'},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Retry-After': '5'}
+            )
+        return Response(
+            {'url': request.build_absolute_uri(default_storage.url(path))}
         )
-        for name, data in items.items():
-            list_item = (
-                f"{name} - {data['amount']} {data['measurement_unit']}"
+
+    @action(
+        methods=['get'],
+        url_path='download_shopping_cart',
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def get_shopping_cart(self, request):
+        """Метод для загрузки списка покупок в формате TXT, CSV или PDF.
+        Формат передается параметром type. Готовые файлы хранятся
+        по версии списка покупок и повторно не формируются.
+        Пока PDF формируется, возвращается ответ 202, который
+        не учитывается в ограничении частоты загрузок.
+        """
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'type': 'Неподдерживаемый формат файла.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            response.write(f"{list_item}\n")
-        return response
+        rows = get_cart_rows(request.user.id)
+        path = get_artifact(request.user.id, rows, file_format)
+        if path is None:
+            self.refund_throttles(request)
+            return Response(
+                {'detail': 'Файл формируется, повторите запрос позже.'},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Retry-After': '2'}
+            )
+        return FileResponse(
+            default_storage.open(path, 'rb'),
+            as_attachment=True,
+            filename=f'shopping_list.{file_format}',
+            content_type=EXPORT_FORMATS[file_format][0]
+        )
+
+    @action(
+        methods=['get'],
+        url_path='shopping_cart',
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def get_shopping_cart_preview(self, request):
+        """Метод возвращает итоговый список покупок текущего пользователя."""
+        items = ShoppingListIngredient.objects.filter(
+            current_user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        serializer = ShoppingCartItemSerializer(items, many=True)
+        return Response(serializer.data)
 
     @action(
         methods=['post', 'delete'],
@@ -232,9 +596,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
 class FoodgramUserViewSet(UserViewSet):
     """ViewSet для работы с моделью User."""
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('id')
     serializer_class = UserSerializer
-    pagination_class = LimitPagePagination
+    pagination_class = KeysetLimitPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = UserFilter
+    throttle_scopes = {'update_avatar': 'uploads'}
     permission_classes = ()
 
     def get_serializer_class(self):
@@ -248,14 +615,38 @@ class FoodgramUserViewSet(UserViewSet):
             return UserSerializer
         return UserCreateSerializer
 
+    def get_queryset(self):
+        """Метод возвращает пользователей для текущего действия.
+        Для чтения is_subscribed берется из множества подписок,
+        а столбцы, не нужные для fields, не загружаются.
+        """
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return get_user_queryset(
+                self.request.user,
+                queryset,
+                get_requested_fields(self.request)
+            )
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        """Метод передает сериализатору поля из параметра fields."""
+        if self.action in ('list', 'retrieve', 'me'):
+            kwargs.setdefault('fields', get_requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
     @action(
         methods=['put', 'delete'],
         url_path='me/avatar',
         detail=False,
-        permission_classes=(CurrentUserOrAdmin,)
+        permission_classes=(CurrentUserOrAdmin,),
+        parser_classes=(JSONParser, MultiPartParser, RawImageParser)
     )
     def update_avatar(self, request):
-        """Метод изменяет аватара текущего пользователя."""
+        """Метод изменяет аватара текущего пользователя.
+        Аватар передается в base64 в JSON, файлом в multipart/form-data
+        или телом запроса с Content-Type image/*.
+        """
 
         current_user = request.user
         if request.method == 'DELETE':
@@ -272,7 +663,9 @@ class FoodgramUserViewSet(UserViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-        serializer = AvatarUpdateSerializer(current_user, data=request.data)
+        serializer = AvatarUpdateSerializer(
+            current_user, data=get_upload_data(request, 'avatar')
+        )
 
         if serializer.is_valid():
             serializer.save()
@@ -327,10 +720,12 @@ class FoodgramUserViewSet(UserViewSet):
         )
         if serializer.is_valid():
             if request.method == 'POST':
-                subscription = Subscription.objects.create(
-                    current_user=current_user,
-                    user=user
-                )
+                subscription = follow(current_user, user)
+                if subscription is None:
+                    return Response(
+                        {'detail': 'Вы уже подписаны на этого пользователя'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 serializer = SubcriptionSerializer(
                     subscription,
                     context={'request': request}
@@ -341,11 +736,7 @@ class FoodgramUserViewSet(UserViewSet):
                 )
 
             if request.method == 'DELETE':
-                subscription = Subscription.objects.filter(
-                    current_user=current_user,
-                    user=user
-                ).first()
-                subscription.delete()
+                unfollow(current_user, user)
                 return Response({"detail": "Успешная отписка."},
                                 status=status.HTTP_204_NO_CONTENT)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -361,6 +752,10 @@ class FoodgramUserViewSet(UserViewSet):
 
 
 def redirect_to_recipe(request, short_link):
+    snapshot = reference_snapshot.get()
+    recipe_id = snapshot and snapshot.get_recipe_id(short_link)
+    if recipe_id:
+        return redirect(f'/recipes/{recipe_id}')
     try:
         short_link = ShortLinkRecipe.objects.get(short_link=short_link)
         return redirect(f'/recipes/{short_link.recipe.id}')
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после настройки Django: модуль использует модели.
+from api.event_stream import EventStreamApplication  # noqa: E402
+
+application = EventStreamApplication(django_application)
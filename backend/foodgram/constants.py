@@ -6,4 +6,44 @@ MAX_LENGTH_SLUG = 32
 MAX_LENGTH_SHORT_LINK = 5
 MAX_LENGTH_EMAIL = 254
 MAX_LENGTH_FOR_USER = 150
+MAX_LENGTH_IMAGE_NAME = 100
 PAGINATION_PAGE_SIZE = 6
+MAX_FEED_LIMIT = 100
+STORAGE_SHARD_DEPTH = 2
+STORAGE_SHARD_WIDTH = 2
+RENDITION_WIDTHS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+RENDITION_FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+MAX_LENGTH_JOB_NAME = 255
+MAX_LENGTH_JOB_WORKER = 128
+MAX_BULK_RECIPES = 50
+PUBLIC_CACHE_PREFIXES = ('/api/tags/', '/api/ingredients/', '/api/recipes/')
+PUBLIC_CACHE_MIN_COMPRESS_LENGTH = 512
+PUBLIC_CACHE_COMPRESS_LEVEL = 9
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_CHUNK_SIZE = 500
+SIMILAR_MAX_INGREDIENT_SHARE = 0.01
+SIMILAR_MIN_INGREDIENT_LIMIT = 1000
+MAX_CHANGES_LIMIT = 1000
+EXPORT_CHUNK_SIZE = 2000
+RECIPE_EXPORTS_KEEP = 2
+PROFILE_STATS_LINES = 40
+PROFILE_MEMORY_SITES = 25
+PROFILE_TRACE_FRAMES = 1
+REFERENCE_SNAPSHOT_CHECK_INTERVAL = 1
+EVENTS_QUEUE_SIZE = 100
+EVENTS_HEARTBEAT_INTERVAL = 15
+EVENTS_RETRY_INTERVAL = 5000
+EVENTS_RECONNECT_DELAY = 5
+RECIPE_BITMAP_MAX_CHANGES = 1000
+FEED_CELEBRITY_BACKFILL_MARGIN = 60 * 60
+# Итоги списка покупок хранятся с фиксированной точностью.
+CART_AMOUNT_MAX_DIGITS = 12
+CART_AMOUNT_DECIMAL_PLACES = 3
+CHANGE_LOG_PURGE_MARGIN = 24 * 60 * 60
@@ -0,0 +1,158 @@
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'primary_until'
+
+use_replicas = contextvars.ContextVar('use_replicas', default=False)
+
+_lag_lock = threading.Lock()
+_lag_checked_at = {}
+_lag_healthy = {}
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+def get_replica_lag(alias):
+    """Метод возвращает отставание реплики в секундах или None."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна.', alias, exc_info=True)
+        return None
+    return 0 if lag is None else float(lag)
+
+
+def is_replica_healthy(alias):
+    """
+    Метод проверяет, что отставание реплики не больше REPLICA_MAX_LAG.
+    Результат кешируется в процессе на REPLICA_LAG_CHECK_INTERVAL.
+    """
+    now = time.monotonic()
+    with _lag_lock:
+        checked_at = _lag_checked_at.get(alias)
+        if (
+            checked_at is not None
+            and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL
+        ):
+            return _lag_healthy[alias]
+        _lag_checked_at[alias] = now
+    lag = get_replica_lag(alias)
+    healthy = lag is not None and lag <= settings.REPLICA_MAX_LAG
+    with _lag_lock:
+        _lag_healthy[alias] = healthy
+    return healthy
+
+
+class ReplicaRouter:
+    """
+    Роутер, который отправляет чтение на реплики.
+    Реплики используются, только если ReplicaRoutingMiddleware
+    разрешила их для текущего запроса; все остальное, включая
+    команды manage.py и фоновые задачи, работает с основной БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not use_replicas.get():
+            return PRIMARY
+        replicas = [
+            alias for alias in get_replicas() if is_replica_healthy(alias)
+        ]
+        if not replicas:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def get_client_key(request):
+    """
+    Метод возвращает ключ клиента для закрепления за основной БД
+    или None для анонимного клиента. Анонимные клиенты за nginx
+    приходят с одного адреса, поэтому закрепляются только cookie.
+    """
+    identity = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not identity:
+        return None
+    digest = hashlib.sha1(identity.encode()).hexdigest()
+    return f'primary-until:{digest}'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware, которое разрешает чтение с реплик для безопасных
+    запросов. После успешного изменяющего запроса клиент на
+    REPLICA_STICKY_SECONDS закрепляется за основной БД, чтобы сразу
+    видеть свои изменения. Закрепление хранится в cookie и в общем
+    для воркеров кеше replica_sticky: клиенты с токеном не
+    возвращают cookie, а их запросы попадают в разные воркеры.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_sticky(self, request):
+        now = time.time()
+        try:
+            if float(request.COOKIES.get(STICKY_COOKIE, 0)) > now:
+                return True
+        except ValueError:
+            pass
+        key = get_client_key(request)
+        return key is not None and caches['replica_sticky'].get(key, 0) > now
+
+    def __call__(self, request):
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        token = use_replicas.set(
+            safe and bool(get_replicas()) and not self.is_sticky(request)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+        if not safe and response.status_code < 400:
+            sticky_seconds = settings.REPLICA_STICKY_SECONDS
+            until = time.time() + sticky_seconds
+            key = get_client_key(request)
+            if key is not None:
+                caches['replica_sticky'].set(key, until, sticky_seconds)
+            response.set_cookie(
+                STICKY_COOKIE, str(until), max_age=sticky_seconds,
+                httponly=True, samesite='Lax'
+            )
+        return response
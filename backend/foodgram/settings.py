@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
@@ -56,6 +58,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'foodgram.db_router.ReplicaRoutingMiddleware',
+    'api.payload_cache.CompressedPayloadMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,6 +100,27 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1,host2:5433.
+# Имя БД и учетные данные совпадают с основной БД.
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+# Сколько секунд после изменения клиент читает из основной БД.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+# Максимальное отставание реплики в секундах.
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -123,6 +149,41 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.SlidingWindowRateThrottle',
+    ),
+    # Бюджеты на процесс: счетчики хранятся в памяти каждого воркера.
+    'DEFAULT_THROTTLE_RATES': {
+        'downloads': os.getenv('THROTTLE_DOWNLOADS', '10/min'),
+        'short_links': os.getenv('THROTTLE_SHORT_LINKS', '30/min'),
+        'search': os.getenv('THROTTLE_SEARCH', '120/min'),
+        'uploads': os.getenv('THROTTLE_UPLOADS', '20/min'),
+    },
+    # Реальный IP клиента берется из X-Forwarded-For, выставленного nginx.
+    'NUM_PROXIES': 1,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # Закрепление клиентов за основной БД после изменений: файлы
+    # общие для всех воркеров gunicorn, поэтому следующий запрос
+    # клиента с токеном попадет на основную БД в любом воркере.
+    'replica_sticky': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'REPLICA_STICKY_CACHE_DIR',
+            str(BASE_DIR / 'cache' / 'replica_sticky')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
 DJOSER = {
@@ -167,3 +228,90 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 HOST_NAME = os.getenv('HOST_NAME', '127.0.0.1')
+
+# Фильтрация рецептов через битовые индексы в памяти процесса.
+RECIPE_BITMAP_FILTER = (
+    os.getenv('RECIPE_BITMAP_FILTER', '').lower() == 'true'
+)
+RECIPE_BITMAP_INDEX_TTL = int(os.getenv('RECIPE_BITMAP_INDEX_TTL', 300))
+
+# Снимок тегов, ингредиентов и коротких ссылок, общий для воркеров:
+# файл, отображаемый в память, и срок до полной перестройки.
+# К имени файла добавляется хеш имени БД.
+REFERENCE_SNAPSHOT_PATH = os.getenv(
+    'REFERENCE_SNAPSHOT_PATH', str(BASE_DIR / 'cache' / 'reference.snapshot')
+)
+REFERENCE_SNAPSHOT_TTL = int(os.getenv('REFERENCE_SNAPSHOT_TTL', 300))
+
+# Лента подписок: авторы с большим числом подписчиков
+# не рассылают рецепты при публикации, а читаются при запросе ленты.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+FEED_FANOUT_BATCH_SIZE = 1000
+# Интервал фоновой сверки таблицы популярных авторов.
+FEED_CELEBRITIES_INTERVAL = int(os.getenv('FEED_CELEBRITIES_INTERVAL', 600))
+
+# Выгрузка списка покупок: файлы, которые не скачивали дольше
+# этого срока, удаляет периодическая задача.
+SHOPPING_LIST_EXPORT_TTL = int(
+    os.getenv('SHOPPING_LIST_EXPORT_TTL', 60 * 60)
+)
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Загруженные файлы больше этого размера пишутся во временный файл
+# частями и затем перемещаются в хранилище без копирования в память.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+# Фоновые задачи: очередь в основной БД и команда run_jobs.
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', 4))
+JOBS_MODE = os.getenv('JOBS_MODE', 'thread')
+JOBS_POLL_INTERVAL = 1.0
+JOBS_RETRY_BACKOFF = 10
+# Задача без обновления locked_at дольше JOBS_LOCK_TIMEOUT считается
+# брошенной; обработчик обновляет его раз в JOBS_HEARTBEAT_INTERVAL.
+JOBS_LOCK_TIMEOUT = 600
+JOBS_HEARTBEAT_INTERVAL = 60
+JOBS_KEEP_DONE = 24 * 60 * 60
+# Периодические задачи: путь к функции и интервал запуска в секундах.
+JOBS_PERIODIC = {
+    'api.rankings.refresh_rankings': int(
+        os.getenv('RANKING_REFRESH_INTERVAL', 600)
+    ),
+    'api.similarity.refresh_similar_recipes': int(
+        os.getenv('SIMILAR_RECIPES_REFRESH_INTERVAL', 24 * 60 * 60)
+    ),
+    'api.changes.purge_changes': 60 * 60,
+    'api.exports.purge_artifacts': SHOPPING_LIST_EXPORT_TTL,
+    'api.feed.sync_celebrities': FEED_CELEBRITIES_INTERVAL,
+}
+JOBS_PERIODIC_CHECK = 60
+
+# Похожие рецепты: число процессов для расчета сходства.
+SIMILAR_RECIPES_WORKERS = int(os.getenv('SIMILAR_RECIPES_WORKERS', 2))
+
+# Тренды рецептов: вес добавления падает вдвое за этот период.
+RANKING_TRENDING_HALF_LIFE = int(
+    os.getenv('RANKING_TRENDING_HALF_LIFE', 3 * 24 * 60 * 60)
+)
+
+# Кеш публичных ответов API для анонимных пользователей
+# вместе с их сжатой версией.
+PUBLIC_CACHE_TTL = int(os.getenv('PUBLIC_CACHE_TTL', 60))
+PUBLIC_CACHE_GENERATION_PATH = os.getenv(
+    'PUBLIC_CACHE_GENERATION_PATH',
+    os.path.join(tempfile.gettempdir(), 'foodgram-public-cache.generation')
+)
+
+# Журнал изменений: записи старше этого срока удаляются,
+# а клиентам с более старым токеном нужно загрузить списки заново.
+CHANGE_LOG_RETENTION = int(
+    os.getenv('CHANGE_LOG_RETENTION', 30 * 24 * 60 * 60)
+)
+
+# Профилирование запросов администраторов: каталог вне MEDIA_ROOT
+# и число хранимых профилей.
+PROFILES_ROOT = os.getenv('PROFILES_ROOT', BASE_DIR / 'profiles')
+PROFILES_KEEP = int(os.getenv('PROFILES_KEEP', 50))
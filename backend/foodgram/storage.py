@@ -0,0 +1,58 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from foodgram.constants import STORAGE_SHARD_DEPTH, STORAGE_SHARD_WIDTH
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, которое именует файлы по хешу содержимого.
+    Файл recipes/images/temp.png сохраняется как
+    recipes/images/ab/cd/abcd...ef.png. Одинаковые загрузки
+    хранятся в одном экземпляре, поэтому файлы не удаляются
+    вместе с объектами, а собираются командой collect_media_garbage.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        shards = [
+            digest[i * STORAGE_SHARD_WIDTH:(i + 1) * STORAGE_SHARD_WIDTH]
+            for i in range(STORAGE_SHARD_DEPTH)
+        ]
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(
+            [os.path.dirname(name), *shards, digest + extension]
+        ).lstrip('/')
+
+    def save(self, name, content, max_length=None):
+        """
+        Метод сохраняет файл или возвращает имя уже сохраненной копии.
+        У копии обновляется время изменения: пока запись с новой
+        ссылкой не закоммичена, collect_media_garbage не тронет
+        файл моложе --min-age.
+        """
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def delete(self, name):
+        """Файлы могут быть общими, поэтому удаляет их только сборщик."""
+
+    def purge(self, name):
+        super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
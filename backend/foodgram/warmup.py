@@ -0,0 +1,26 @@
+from django.db import connections
+from django.urls import reverse
+from djoser.conf import settings as djoser_settings
+from rest_framework.settings import api_settings
+
+
+def warm_up():
+    """
+    Метод готовит приложение до fork воркеров gunicorn.
+    Импортируются URLconf со всеми view, классы из настроек DRF
+    и djoser, которые иначе загружаются при первом запросе,
+    и строится общий снимок справочников. Соединения с БД
+    закрываются, чтобы воркеры не унаследовали сокеты мастера.
+    """
+    from api.snapshot import reference_snapshot
+
+    reverse('short_link_redirect', args=('warmup',))
+    for name in api_settings.defaults:
+        getattr(api_settings, name)
+    for group in ('SERIALIZERS', 'PERMISSIONS'):
+        classes = getattr(djoser_settings, group)
+        for name in classes:
+            getattr(classes, name)
+    reference_snapshot.rebuild()
+    reference_snapshot.get()
+    connections.close_all()
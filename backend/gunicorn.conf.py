@@ -0,0 +1,18 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(
+    os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+# Приложение загружается в мастере один раз, воркеры получают
+# его уже прогретым через fork.
+preload_app = True
+
+
+def when_ready(server):
+    """Прогревает приложение после загрузки, до запуска воркеров."""
+    from foodgram.warmup import warm_up
+
+    warm_up()
@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import (
+    claim,
+    complete,
+    execute,
+    fail,
+    heartbeat,
+    purge_finished,
+    release_stale,
+    schedule_periodic
+)
+
+
+class Command(BaseCommand):
+    """
+    Обработчик фоновых задач из таблицы jobs_job.
+
+    Забирает готовые задачи пачками по числу свободных исполнителей
+    и выполняет их в пуле потоков или процессов. Упавшие задачи
+    возвращаются в очередь с экспоненциальной задержкой.
+    """
+
+    help = "Обработчик фоновых задач."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.JOBS_WORKERS,
+            help='Количество одновременно выполняемых задач.'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=('thread', 'process'),
+            default=settings.JOBS_MODE,
+            help='Выполнять задачи в потоках или в отдельных процессах.'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, в секундах.'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и завершить работу.'
+        )
+
+    def get_executor(self, mode, workers):
+        if mode == 'process':
+            return ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+        return ThreadPoolExecutor(max_workers=workers)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def finish(self, done, running, worker):
+        for future in done:
+            job = running.pop(future)
+            error = future.exception()
+            if error is None:
+                complete(job, worker)
+            else:
+                fail(job, worker, error)
+                self.stderr.write(f'Задача {job.id} {job.name}: {error}')
+
+    def handle(self, *args, **options):
+        """Метод запускает цикл обработки очереди."""
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        running = {}
+        maintenance_at = 0
+        periodic_at = 0
+        heartbeat_at = 0
+        executor = self.get_executor(options['mode'], workers)
+        try:
+            while not self.stopping:
+                if time.monotonic() >= maintenance_at:
+                    release_stale()
+                    purge_finished()
+                    maintenance_at = (
+                        time.monotonic() + settings.JOBS_LOCK_TIMEOUT / 2
+                    )
+                if running and time.monotonic() >= heartbeat_at:
+                    heartbeat(running.values(), worker)
+                    heartbeat_at = (
+                        time.monotonic() + settings.JOBS_HEARTBEAT_INTERVAL
+                    )
+                if time.monotonic() >= periodic_at:
+                    schedule_periodic()
+                    periodic_at = (
+                        time.monotonic() + settings.JOBS_PERIODIC_CHECK
+                    )
+                jobs = claim(worker, workers - len(running))
+                for job in jobs:
+                    future = executor.submit(
+                        execute, job.name, job.args, job.kwargs
+                    )
+                    running[future] = job
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                done, _ = wait(
+                    running,
+                    timeout=0 if jobs else poll_interval,
+                    return_when=FIRST_COMPLETED
+                )
+                self.finish(done, running, worker)
+            while running:
+                done, _ = wait(
+                    running, timeout=settings.JOBS_HEARTBEAT_INTERVAL
+                )
+                self.finish(done, running, worker)
+                heartbeat(running.values(), worker)
+        finally:
+            executor.shutdown(wait=True)
@@ -0,0 +1,67 @@
+from django.db import models
+from django.utils import timezone
+
+from foodgram.constants import MAX_LENGTH_JOB_NAME, MAX_LENGTH_JOB_WORKER
+
+
+class Job(models.Model):
+    """Модель для фоновой задачи.
+    Задача хранит путь к функции и ее аргументы и выполняется
+    командой run_jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        'Функция',
+        max_length=MAX_LENGTH_JOB_NAME,
+        help_text='Путь к функции, например api.renditions.generate.'
+    )
+    args = models.JSONField('Аргументы', default=list, blank=True)
+    kwargs = models.JSONField(
+        'Именованные аргументы', default=dict, blank=True
+    )
+    priority = models.SmallIntegerField(
+        'Приоритет',
+        default=0,
+        help_text='Задачи с большим приоритетом выполняются раньше.'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=max(len(status) for status, _ in STATUS_CHOICES),
+        choices=STATUS_CHOICES,
+        default=QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=3
+    )
+    run_at = models.DateTimeField('Запустить после', default=timezone.now)
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+    locked_by = models.CharField(
+        'Обработчик', max_length=MAX_LENGTH_JOB_WORKER, blank=True
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = (
+            models.Index(
+                fields=['-priority', 'run_at'],
+                name='job_queue_idx',
+                condition=models.Q(status='queued')
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
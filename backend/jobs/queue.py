@@ -0,0 +1,167 @@
+import importlib
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import Job
+
+
+def get_job_name(func):
+    if isinstance(func, str):
+        return func
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, *args, priority=0, max_attempts=3, delay=None, **kwargs):
+    """
+    Метод ставит функцию в очередь фоновых задач.
+    Строка задачи пишется в текущей транзакции, поэтому обработчик
+    увидит ее только после коммита, а при откате задача исчезнет.
+    Аргументы должны сериализоваться в JSON.
+    """
+    run_at = timezone.now()
+    if delay:
+        run_at += timedelta(seconds=delay)
+    return Job.objects.create(
+        name=get_job_name(func),
+        args=list(args),
+        kwargs=kwargs,
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=run_at
+    )
+
+
+def resolve(name):
+    module, _, attribute = name.rpartition('.')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def execute(name, args, kwargs):
+    """Метод выполняет задачу; вызывается в потоке или процессе пула."""
+    from django.db import close_old_connections
+
+    close_old_connections()
+    try:
+        resolve(name)(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def claim(worker, limit):
+    """
+    Метод забирает из очереди до limit готовых задач.
+    SKIP LOCKED позволяет нескольким обработчикам работать
+    с одной таблицей без ожидания блокировок.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.QUEUED, run_at__lte=now
+            ).order_by('-priority', 'run_at', 'id')[:limit]
+        )
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=Job.RUNNING, locked_at=now, locked_by=worker
+        )
+    return jobs
+
+
+def owned(job, worker):
+    """
+    Метод выбирает задачу, только если она еще выполняется этим
+    обработчиком: задачу, возвращенную в очередь release_stale,
+    мог забрать другой обработчик.
+    """
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=worker)
+
+
+def heartbeat(jobs, worker):
+    """
+    Метод обновляет locked_at выполняемых задач, чтобы release_stale
+    не вернул в очередь долгую задачу живого обработчика.
+    Возвращает число задач, которые еще принадлежат обработчику.
+    """
+    return Job.objects.filter(
+        id__in=[job.id for job in jobs],
+        status=Job.RUNNING,
+        locked_by=worker
+    ).update(locked_at=timezone.now())
+
+
+def complete(job, worker):
+    owned(job, worker).update(
+        status=Job.DONE, locked_at=None, attempts=job.attempts + 1
+    )
+
+
+def fail(job, worker, error):
+    """
+    Метод возвращает задачу в очередь с экспоненциальной задержкой
+    или помечает ее как проваленную после max_attempts попыток.
+    """
+    attempts = job.attempts + 1
+    error_text = ''.join(
+        traceback.format_exception(type(error), error, error.__traceback__)
+    )
+    if attempts >= job.max_attempts:
+        owned(job, worker).update(
+            status=Job.FAILED, attempts=attempts, locked_at=None,
+            last_error=error_text
+        )
+        return
+    delay = settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1)
+    owned(job, worker).update(
+        status=Job.QUEUED, attempts=attempts, locked_at=None,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        last_error=error_text
+    )
+
+
+def release_stale():
+    """
+    Метод возвращает в очередь задачи упавших обработчиков: живой
+    обработчик обновляет locked_at каждые JOBS_HEARTBEAT_INTERVAL.
+    Возврат считается попыткой, поэтому задача, которая раз за разом
+    роняет обработчик, после max_attempts помечается проваленной.
+    """
+    threshold = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=threshold)
+    failed = stale.filter(
+        attempts__gte=models.F('max_attempts') - 1
+    ).update(
+        status=Job.FAILED, attempts=models.F('attempts') + 1,
+        locked_at=None, locked_by='',
+        last_error='Обработчик перестал отвечать во время выполнения.'
+    )
+    return failed + stale.update(
+        status=Job.QUEUED, attempts=models.F('attempts') + 1,
+        locked_at=None, locked_by=''
+    )
+
+
+def schedule_periodic():
+    """
+    Метод ставит в очередь периодические задачи из JOBS_PERIODIC,
+    если задача еще не ждет выполнения и не запускалась
+    за последний интервал.
+    """
+    now = timezone.now()
+    for name, interval in settings.JOBS_PERIODIC.items():
+        recent = Job.objects.filter(name=name).filter(
+            models.Q(status__in=(Job.QUEUED, Job.RUNNING))
+            | models.Q(created_at__gt=now - timedelta(seconds=interval))
+        )
+        if not recent.exists():
+            enqueue(name)
+
+
+def purge_finished():
+    """Метод удаляет выполненные задачи старше JOBS_KEEP_DONE."""
+    threshold = timezone.now() - timedelta(seconds=settings.JOBS_KEEP_DONE)
+    return Job.objects.filter(
+        status=Job.DONE, created_at__lt=threshold
+    ).delete()[0]
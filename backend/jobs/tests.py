@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Job
+from .queue import claim, complete, enqueue, heartbeat, release_stale
+
+
+class JobQueueTest(TestCase):
+    """
+    Проверяет возврат брошенных задач в очередь: живой обработчик
+    продлевает блокировку, возврат считается попыткой, а устаревший
+    обработчик не может завершить задачу, которую забрал другой.
+    """
+
+    def make_stale(self, job):
+        Job.objects.filter(id=job.id).update(
+            locked_at=timezone.now() - timedelta(
+                seconds=settings.JOBS_LOCK_TIMEOUT + 1
+            )
+        )
+
+    def test_heartbeat_keeps_job_running(self):
+        enqueue('api.feed.trim_feed', 1, 2)
+        jobs = claim('worker', 1)
+        self.make_stale(jobs[0])
+        self.assertEqual(heartbeat(jobs, 'worker'), 1)
+        self.assertEqual(release_stale(), 0)
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+
+    def test_release_counts_attempt(self):
+        enqueue('api.feed.trim_feed', 1, 2, max_attempts=2)
+        for status in (Job.QUEUED, Job.FAILED):
+            job = claim('worker', 1)[0]
+            self.make_stale(job)
+            self.assertEqual(release_stale(), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.status, status)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_worker_cannot_complete_reclaimed_job(self):
+        enqueue('api.feed.trim_feed', 1, 2)
+        stale_job = claim('stale', 1)[0]
+        self.make_stale(stale_job)
+        release_stale()
+        job = claim('fresh', 1)[0]
+        complete(stale_job, 'stale')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.locked_by, 'fresh')
+        complete(job, 'fresh')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
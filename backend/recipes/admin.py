@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
+from api.shopping_cart import get_recipe_amounts, update_recipe_in_carts
 from .models import (
     Favorite,
+    FeedEntry,
     Ingredient,
     IngredientRecipe,
     Recipe,
@@ -32,6 +34,17 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('tags',)
     inlines = (IngredientRecipeAdmin,)
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Метод переносит изменение ингредиентов в списки покупок:
+        inline-формы сохраняют строки рецепта без сериализатора.
+        """
+        old_amounts = get_recipe_amounts(form.instance.id) if change else {}
+        super().save_related(request, form, formsets, change)
+        update_recipe_in_carts(
+            form.instance, old_amounts, get_recipe_amounts(form.instance.id)
+        )
+
     def get_favorite_count(self, obj):
         """Метод считает количество добавлений рецепта в избранное."""
         return Favorite.objects.filter(recipe=obj).count()
@@ -71,3 +84,8 @@ class ShoppingListAdmin(admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'current_user')
+
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'current_user', 'recipe', 'pub_date')
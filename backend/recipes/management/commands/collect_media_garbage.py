@@ -0,0 +1,119 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.renditions import RENDITIONS_DIR
+from foodgram.storage import content_storage
+from recipes.models import Recipe
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Удаление медиафайлов, на которые не ссылается ни одна запись.
+
+    Команда обходит хранилище по шардам и для каждого шарда
+    запрашивает из БД только ссылки с соответствующим префиксом,
+    поэтому потребление памяти не зависит от числа файлов.
+    """
+
+    help = "Удаление медиафайлов без ссылок из БД."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе указанного числа секунд.'
+        )
+
+    def get_references(self):
+        return (
+            ('recipes/images', Recipe, 'image'),
+            ('users/images', User, 'avatar'),
+        )
+
+    def walk(self, storage, directory):
+        """Метод обходит каталог и возвращает файлы пачками по каталогам."""
+        directories, files = storage.listdir(directory)
+        if files:
+            yield directory, files
+        for name in sorted(directories):
+            yield from self.walk(storage, f'{directory}/{name}')
+
+    def collect(self, directory, files, model, field):
+        """Метод возвращает файлы каталога, на которые нет ссылок."""
+        referenced = set()
+        for start in range(0, len(files), BATCH_SIZE):
+            names = [f'{directory}/{name}' for name in files[
+                start:start + BATCH_SIZE
+            ]]
+            referenced.update(
+                model.objects.filter(
+                    **{f'{field}__in': names}
+                ).values_list(field, flat=True)
+            )
+        return [
+            f'{directory}/{name}' for name in files
+            if f'{directory}/{name}' not in referenced
+        ]
+
+    def collect_renditions(self, directory, files, model, field):
+        """Метод возвращает копии изображения, которого уже нет в БД."""
+        original = directory[len(RENDITIONS_DIR) + 1:]
+        if model.objects.filter(
+            **{f'{field}__startswith': original + '.'}
+        ).exists():
+            return []
+        return [f'{directory}/{name}' for name in files]
+
+    def remove(self, storage, names, threshold, dry_run):
+        removed = 0
+        for name in names:
+            if storage.get_modified_time(name).timestamp() > threshold:
+                continue
+            if dry_run:
+                self.stdout.write(name)
+            elif storage is content_storage:
+                storage.purge(name)
+            else:
+                storage.delete(name)
+            removed += 1
+        return removed
+
+    def handle(self, *args, **options):
+        """Метод удаляет файлы без ссылок и выводит их количество."""
+        threshold = time.time() - options['min_age']
+        dry_run = options['dry_run']
+        removed = 0
+        for root, model, field in self.get_references():
+            if content_storage.exists(root):
+                for directory, files in self.walk(content_storage, root):
+                    removed += self.remove(
+                        content_storage,
+                        self.collect(directory, files, model, field),
+                        threshold, dry_run
+                    )
+            renditions_root = f'{RENDITIONS_DIR}/{root}'
+            if default_storage.exists(renditions_root):
+                for directory, files in self.walk(
+                    default_storage, renditions_root
+                ):
+                    removed += self.remove(
+                        default_storage,
+                        self.collect_renditions(
+                            directory, files, model, field
+                        ),
+                        threshold, dry_run
+                    )
+        return f'Файлов без ссылок: {removed}.'
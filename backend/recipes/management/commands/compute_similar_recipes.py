@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.similarity import refresh_similar_recipes
+from foodgram.constants import SIMILAR_RECIPES_TOP_K
+
+
+class Command(BaseCommand):
+    """
+    Расчет похожих рецептов по общим ингредиентам.
+
+    Обычно выполняется периодической фоновой задачей; команда
+    нужна для первого расчета и ручного пересчета.
+    """
+
+    help = "Расчет похожих рецептов."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.SIMILAR_RECIPES_WORKERS,
+            help='Количество процессов для расчета сходства.'
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=SIMILAR_RECIPES_TOP_K,
+            help='Сколько похожих рецептов сохранять для каждого рецепта.'
+        )
+
+    def handle(self, *args, **options):
+        """Метод пересчитывает похожие рецепты и выводит их количество."""
+        total = refresh_similar_recipes(
+            workers=options['workers'], top_k=options['top_k']
+        )
+        return f'Обработано рецептов: {total}.'
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from api.bulk_export import iter_recipes_ndjson
+from foodgram.constants import EXPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    Выгрузка всех рецептов с ингредиентами, тегами и автором в NDJSON.
+
+    Рецепты читаются серверным курсором пачками из одного снимка БД,
+    поэтому выгрузка согласована и не требует памяти под всю базу.
+    """
+
+    help = "Выгрузка всех рецептов в формате NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки; по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Количество рецептов в одной пачке.'
+        )
+
+    def handle(self, *args, **options):
+        """Метод записывает рецепты построчно в файл или stdout."""
+        chunks = iter_recipes_ndjson(options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return None
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        return f'Рецепты выгружены в {options["output"]}.'
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.renditions import generate_renditions
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Создание уменьшенных копий фото рецептов и аватаров.
+
+    Используется после изменения RENDITION_WIDTHS или RENDITION_FORMATS,
+    а также для изображений, загруженных до появления копий. Для уже
+    созданных копий команда только отмечает их готовность в моделях.
+    """
+
+    help = "Создание уменьшенных копий изображений."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать уже существующие копии.'
+        )
+
+    def handle(self, *args, **options):
+        """Метод обходит все изображения и создает для них копии."""
+        names = set()
+        for model, field in ((Recipe, 'image'), (User, 'avatar')):
+            names.update(
+                model.objects.exclude(
+                    **{f'{field}__in': ('', None)}
+                ).values_list(field, flat=True).iterator()
+            )
+        failed = 0
+        for name in sorted(names):
+            try:
+                generate_renditions(name, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        return f'Обработано изображений: {len(names)}, ошибок: {failed}.'
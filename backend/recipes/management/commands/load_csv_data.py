@@ -3,8 +3,10 @@ import os
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
-from recipes.models import Ingredient
+from api.changes import log_changes
+from recipes.models import Change, Ingredient
 
 
 class Command(BaseCommand):
@@ -40,5 +42,13 @@ class Command(BaseCommand):
                 id_num += 1
                 objects.append(object_instance)
 
-            Ingredient.objects.bulk_create(objects)
+            # bulk_create не отправляет сигналы, поэтому новые
+            # ингредиенты записываются в журнал изменений явно.
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(objects)
+                log_changes(
+                    Change.INGREDIENT,
+                    [ingredient.id for ingredient in objects],
+                    Change.CREATED
+                )
         return "Данные из csv файлов успешно загружены."
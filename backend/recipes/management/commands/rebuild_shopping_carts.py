@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from api.shopping_cart import rebuild_cart
+from recipes.models import ShoppingList, ShoppingListIngredient
+
+
+class Command(BaseCommand):
+    """
+    Пересчет итогов списков покупок по рецептам в корзинах.
+
+    Итоги обновляются при добавлении и удалении рецептов; команда
+    исправляет их после изменений в обход этих путей, например
+    массовых правок в БД.
+    """
+
+    help = "Пересчет итогов списков покупок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='Id пользователя; по умолчанию пересчитываются все.'
+        )
+
+    def handle(self, *args, **options):
+        """Метод пересчитывает списки покупок и выводит их количество."""
+        users = options['users']
+        if not users:
+            users = set(
+                ShoppingList.objects.values_list(
+                    'current_user', flat=True
+                ).distinct().iterator()
+            ) | set(
+                ShoppingListIngredient.objects.values_list(
+                    'current_user', flat=True
+                ).distinct().iterator()
+            )
+        for user_id in sorted(users):
+            rebuild_cart(user_id)
+        return f'Пересчитано списков покупок: {len(users)}.'
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_ingredients(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListIngredient = apps.get_model(
+        'recipes', 'ShoppingListIngredient'
+    )
+    totals = IngredientRecipe.objects.filter(
+        recipe__shoppinglists__isnull=False
+    ).values(
+        'recipe__shoppinglists__current_user', 'ingredient'
+    ).annotate(total=models.Sum('amount'))
+    ShoppingListIngredient.objects.bulk_create(
+        ShoppingListIngredient(
+            current_user_id=item['recipe__shoppinglists__current_user'],
+            ingredient_id=item['ingredient'],
+            amount=item['total']
+        )
+        for item in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField(default=0, verbose_name='Количество')),
+                ('current_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Текущий пользователь')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_ingredients', to='recipes.ingredient', verbose_name='Ингредиент')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент списка покупок',
+                'verbose_name_plural': 'Ингредиенты списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistingredient',
+            constraint=models.UniqueConstraint(fields=('current_user', 'ingredient'), name='unique_shopping_ingredient'),
+        ),
+        migrations.RunPython(
+            fill_shopping_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:42
+
+from django.db import migrations, models
+import foodgram.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistingredient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Картинка, закодированная в Base64', storage=foodgram.storage.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Фото рецепта'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:51
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сливает повторы ингредиента в рецепте перед уникальным ограничением."""
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = IngredientRecipe.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        total=models.Sum('amount'), first=models.Min('id'),
+        count=models.Count('id')
+    ).filter(count__gt=1)
+    for item in duplicates:
+        IngredientRecipe.objects.filter(id=item['first']).update(
+            amount=item['total']
+        )
+        IngredientRecipe.objects.filter(
+            recipe=item['recipe'], ingredient=item['ingredient']
+        ).exclude(id=item['first']).delete()
+
+
+def create_ingredient_prefix_index(apps, schema_editor):
+    """Индекс под istartswith: Django строит UPPER(name::text) LIKE."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_prefix_idx '
+        'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'
+    )
+
+
+def drop_ingredient_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipes_ingredient_name_upper_prefix_idx'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_recipe'),
+        ),
+        migrations.RunPython(
+            create_ingredient_prefix_index, drop_ingredient_prefix_index
+        ),
+    ]
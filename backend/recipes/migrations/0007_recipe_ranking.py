@@ -0,0 +1,73 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_rankings(apps, schema_editor):
+    """
+    Создает рейтинги существующих рецептов. Время добавления
+    старых записей неизвестно, поэтому берется дата публикации
+    рецепта, чтобы они не попали в тренды как новые.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRanking = apps.get_model('recipes', 'RecipeRanking')
+    for model_name in ('Favorite', 'ShoppingList'):
+        apps.get_model('recipes', model_name).objects.update(
+            added_at=models.Subquery(
+                Recipe.objects.filter(
+                    id=models.OuterRef('recipe')
+                ).values('pub_date')[:1]
+            )
+        )
+    RecipeRanking.objects.bulk_create(
+        (
+            RecipeRanking(recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.values_list('id', flat=True)
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popularity', models.FloatField(default=0, help_text='Количество добавлений в избранное.', verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, help_text='Добавления в избранное и список покупок с затуханием по времени.', verbose_name='Тренд')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-popularity', '-recipe'], name='recipe_ranking_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipe_ranking_trending_idx'),
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
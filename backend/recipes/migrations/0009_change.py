@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-19 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(choices=[('recipe', 'Рецепт'), ('tag', 'Тег'), ('ingredient', 'Ингредиент')], max_length=10, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Id объекта')),
+                ('action', models.CharField(choices=[('created', 'Создан'), ('updated', 'Изменен'), ('deleted', 'Удален')], max_length=7, verbose_name='Действие')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение',
+                'verbose_name_plural': 'Журнал изменений',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-19 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedCelebrity',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('since', models.DateTimeField(auto_now_add=True, verbose_name='В списке с')),
+                ('leaving', models.BooleanField(default=False, verbose_name='Уходит из списка')),
+            ],
+            options={
+                'verbose_name': 'Популярный автор ленты',
+                'verbose_name_plural': 'Популярные авторы ленты',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-19 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedcelebrity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppinglistingredient',
+            name='amount',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12, verbose_name='Количество'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.16 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_shoppinglistingredient_decimal_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='transaction_id',
+            field=models.PositiveBigIntegerField(default=0, help_text='txid_current() транзакции, записавшей изменение.', verbose_name='Id транзакции'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['transaction_id', 'id'], name='change_position_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_change_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions_for',
+            field=models.CharField(blank=True, editable=False, help_text='Фото, для которого созданы уменьшенные копии.', max_length=100, verbose_name='Фото с уменьшенными копиями'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, router, transaction
 
 from api.service import get_short_link
 from foodgram.constants import (
+    CART_AMOUNT_DECIMAL_PLACES,
+    CART_AMOUNT_MAX_DIGITS,
+    MAX_LENGTH_IMAGE_NAME,
     MAX_LENGTH_NAME,
     MAX_LENGTH_NAME_INGREDIENT,
     MAX_LENGTH_MEASURE_UNIT,
@@ -11,12 +14,33 @@ from foodgram.constants import (
     MAX_LENGTH_SLUG,
     MAX_LENGTH_SHORT_LINK
 )
+from foodgram.storage import content_storage
 
 
 User = get_user_model()
 
 
-class Ingredient(models.Model):
+class ChangeLoggedModel(models.Model):
+    """
+    Базовая модель для объектов журнала изменений.
+    Сохранение выполняется в транзакции вместе с обработчиками
+    post_save, поэтому запись журнала коммитится вместе с объектом
+    даже вне ATOMIC_REQUESTS. Удаление Django и так выполняет в
+    транзакции вместе с post_delete.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            return super().save(*args, **kwargs)
+
+
+class Ingredient(ChangeLoggedModel):
     """Модель для ингредиентов"""
     name = models.CharField(
         'Название',
@@ -44,7 +68,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Tag(models.Model):
+class Tag(ChangeLoggedModel):
     """Модель для тегов."""
     name = models.CharField(
         'Имя тега',
@@ -67,7 +91,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(ChangeLoggedModel):
     """Модель для рецепта."""
     author = models.ForeignKey(
         User,
@@ -85,8 +109,16 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Фото рецепта',
         upload_to='recipes/images/',
+        storage=content_storage,
         help_text='Картинка, закодированная в Base64'
     )
+    image_renditions_for = models.CharField(
+        'Фото с уменьшенными копиями',
+        max_length=MAX_LENGTH_IMAGE_NAME,
+        blank=True,
+        editable=False,
+        help_text='Фото, для которого созданы уменьшенные копии.'
+    )
     text = models.TextField('Описание рецепта', help_text='Описание рецепта.')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -119,6 +151,13 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -149,6 +188,12 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент и Рецепт'
         verbose_name_plural = 'Ингредиенты и Рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_ingredient_recipe'
+            ),
+        )
 
 
 class BaseList(models.Model):
@@ -165,6 +210,7 @@ class BaseList(models.Model):
         verbose_name='Рецепт',
         related_name='%(class)ss'
     )
+    added_at = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         abstract = True
@@ -188,6 +234,123 @@ class ShoppingList(BaseList):
         verbose_name_plural = 'Списки покупок'
 
 
+class ShoppingListIngredient(models.Model):
+    """Модель для суммарного количества ингредиента
+    в списке покупок пользователя.
+    Обновляется при добавлении и удалении рецептов из списка покупок.
+    """
+    current_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Текущий пользователь',
+        related_name='shopping_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_ingredients'
+    )
+    amount = models.DecimalField(
+        'Количество',
+        max_digits=CART_AMOUNT_MAX_DIGITS,
+        decimal_places=CART_AMOUNT_DECIMAL_PLACES,
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['current_user', 'ingredient'],
+                name='unique_shopping_ingredient'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} для {self.current_user}'
+
+
+class RecipeRanking(models.Model):
+    """Модель для рейтингов рецепта.
+    Строка создается вместе с рецептом, а рейтинги периодически
+    пересчитываются фоновой задачей api.rankings.refresh_rankings.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт'
+    )
+    popularity = models.FloatField(
+        'Популярность',
+        default=0,
+        help_text='Количество добавлений в избранное.'
+    )
+    trending = models.FloatField(
+        'Тренд',
+        default=0,
+        help_text='Добавления в избранное и список покупок '
+                  'с затуханием по времени.'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = (
+            models.Index(
+                fields=['-popularity', '-recipe'],
+                name='recipe_ranking_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending', '-recipe'],
+                name='recipe_ranking_trending_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Рейтинг {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель для похожих рецептов.
+    Записи пересчитываются фоновой задачей
+    api.similarity.refresh_similar_recipes по общим ингредиентам.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='similar_entries'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='similar_to'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['recipe', '-score'], name='similar_recipe_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
 class ShortLinkRecipe(models.Model):
     """Модель для коротких ссылок на рецепт."""
     recipe = models.OneToOneField(
@@ -214,3 +377,131 @@ class ShortLinkRecipe(models.Model):
     class Meta:
         verbose_name = 'Короткая ссылка для рецепта'
         verbose_name_plural = 'Короткие ссылки для рецепта'
+
+
+class FeedEntry(models.Model):
+    """Модель для ленты рецептов от авторов, на которых подписан
+    пользователь. Записи создаются при публикации рецепта.
+    """
+    current_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Текущий пользователь',
+        related_name='feed_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['current_user', 'recipe'], name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['current_user', '-pub_date', '-recipe'],
+                name='feed_entry_timeline_idx'
+            ),
+            models.Index(
+                fields=['current_user', 'author'],
+                name='feed_entry_author_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.current_user}'
+
+
+class FeedCelebrity(models.Model):
+    """Модель для авторов, рецепты которых не рассылаются в ленты,
+    а подмешиваются при чтении. Пока автор уходит из списка,
+    его рецепты снова рассылаются, а пропущенные добавляются
+    в ленты подписчиков фоновой задачей.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Автор',
+        related_name='+'
+    )
+    since = models.DateTimeField('В списке с', auto_now_add=True)
+    leaving = models.BooleanField('Уходит из списка', default=False)
+
+    class Meta:
+        verbose_name = 'Популярный автор ленты'
+        verbose_name_plural = 'Популярные авторы ленты'
+
+    def __str__(self):
+        return str(self.author)
+
+
+class Change(models.Model):
+    """Модель для журнала изменений рецептов, тегов и ингредиентов.
+    Записи только добавляются в той же транзакции, что и изменение,
+    а удаленные объекты остаются в журнале как записи deleted.
+    Порядок чтения задает позиция (transaction_id, id).
+    """
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    TYPE_CHOICES = (
+        (RECIPE, 'Рецепт'),
+        (TAG, 'Тег'),
+        (INGREDIENT, 'Ингредиент'),
+    )
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (CREATED, 'Создан'),
+        (UPDATED, 'Изменен'),
+        (DELETED, 'Удален'),
+    )
+
+    object_type = models.CharField(
+        'Тип объекта',
+        max_length=max(len(name) for name, _ in TYPE_CHOICES),
+        choices=TYPE_CHOICES
+    )
+    object_id = models.PositiveBigIntegerField('Id объекта')
+    action = models.CharField(
+        'Действие',
+        max_length=max(len(name) for name, _ in ACTION_CHOICES),
+        choices=ACTION_CHOICES
+    )
+    created_at = models.DateTimeField(
+        'Дата изменения', auto_now_add=True, db_index=True
+    )
+    transaction_id = models.PositiveBigIntegerField(
+        'Id транзакции',
+        default=0,
+        help_text='txid_current() транзакции, записавшей изменение.'
+    )
+
+    class Meta:
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+        indexes = (
+            models.Index(
+                fields=['transaction_id', 'id'],
+                name='change_position_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.object_type} {self.object_id} {self.action}'
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:42
+
+from django.db import migrations, models
+import foodgram.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_alter_foodgramuser_username'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='foodgramuser',
+            name='avatar',
+            field=models.ImageField(blank=True, help_text='Аватар пользователя, закодированный в Base64', null=True, storage=foodgram.storage.ContentAddressedStorage(), upload_to='users/images/', verbose_name='Аватар пользователя'),
+        ),
+    ]
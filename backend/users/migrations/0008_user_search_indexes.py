@@ -0,0 +1,34 @@
+from django.db import migrations
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def create_indexes(apps, schema_editor):
+    """Индексы под istartswith: Django строит UPPER(поле::text) LIKE."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS users_{field}_upper_prefix_idx '
+            f'ON users_foodgramuser (UPPER({field}::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS users_{field}_upper_prefix_idx'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodgramuser',
+            name='avatar_renditions_for',
+            field=models.CharField(blank=True, editable=False, help_text='Аватар, для которого созданы уменьшенные копии.', max_length=100, verbose_name='Аватар с уменьшенными копиями'),
+        ),
+    ]
@@ -3,7 +3,12 @@ from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core.exceptions import ValidationError
 from django.db import models
 
-from foodgram.constants import MAX_LENGTH_EMAIL, MAX_LENGTH_FOR_USER
+from foodgram.constants import (
+    MAX_LENGTH_EMAIL,
+    MAX_LENGTH_FOR_USER,
+    MAX_LENGTH_IMAGE_NAME
+)
+from foodgram.storage import content_storage
 
 
 class FoodgramUser(AbstractUser):
@@ -34,10 +39,18 @@ class FoodgramUser(AbstractUser):
     avatar = models.ImageField(
         'Аватар пользователя',
         upload_to='users/images/',
+        storage=content_storage,
         help_text='Аватар пользователя, закодированный в Base64',
         blank=True,
         null=True
     )
+    avatar_renditions_for = models.CharField(
+        'Аватар с уменьшенными копиями',
+        max_length=MAX_LENGTH_IMAGE_NAME,
+        blank=True,
+        editable=False,
+        help_text='Аватар, для которого созданы уменьшенные копии.'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -71,15 +84,9 @@ class Subscription(models.Model):
         )
 
     def clean(self):
-        if self.current_user == self.user:
+        if self.current_user_id == self.user_id:
             raise ValidationError("Вы не можете подписаться на самого себя.")
 
-        if Subscription.objects.filter(
-            current_user=self.current_user,
-            user=self.user
-        ).exists():
-            raise ValidationError("Вы уже подписаны на этого пользователя.")
-
     def save(self, **kwargs):
         self.clean()
         super().save(**kwargs)